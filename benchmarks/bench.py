@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+"""End-to-end benchmarks of requisitor against local servers
+
+Starts ``http.server`` servers over TCP, TLS requiring a client
+certificate, and a unix socket, in threads of this process, and measures
+requests per second, and latency percentiles, of a set of scenarios.
+Results are written as JSON, and can be compared against an earlier run::
+
+    PYTHONPATH=src python benchmarks/bench.py -o before.json
+    PYTHONPATH=src python benchmarks/bench.py --compare before.json
+
+As the servers share the interpreter with the client, the numbers are only
+meaningful relative to other runs on the same machine.
+"""
+
+import argparse
+import contextlib
+import gzip
+import hashlib
+import http.server
+import json
+import os
+import platform
+import socketserver
+import ssl
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import requisitor
+from requisitor.auth import HTTPDigestAuth
+
+
+FIXTURES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'tests', 'unit', 'fixtures'
+)
+CERT = (
+    os.path.join(FIXTURES, 'cacert.pem'),
+    os.path.join(FIXTURES, 'cakey.pem'),
+)
+
+DIGEST_REALM = 'bench'
+DIGEST_USER = 'user'
+DIGEST_PASSWORD = 'pass'
+
+DOCUMENT = {
+    'items': [
+        {'id': i, 'name': 'item %d' % i, 'tags': ['a', 'b', 'c'],
+         'price': i * 1.5, 'active': bool(i % 2)}
+        for i in range(200)
+    ],
+}
+DOCUMENT_BYTES = json.dumps(DOCUMENT).encode()
+DOCUMENT_GZIP = gzip.compress(DOCUMENT_BYTES)
+
+
+def _md5(*parts):
+    return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    _bytes = {}
+
+    def _send(self, code, body=b'', headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _body(self):
+        if self.headers.get('transfer-encoding', '') == 'chunked':
+            size = 0
+            while True:
+                chunk = int(self.rfile.readline().split(b';')[0], 16)
+                self.rfile.read(chunk)
+                self.rfile.readline()
+                if not chunk:
+                    return size
+                size += chunk
+        length = int(self.headers.get('content-length', 0))
+        self.rfile.read(length)
+        return length
+
+    def _digest_ok(self):
+        value = self.headers.get('authorization', '')
+        scheme, _, params = value.partition(' ')
+        if scheme.lower() != 'digest':
+            return False
+        params = urllib.request.parse_keqv_list(
+            urllib.request.parse_http_list(params)
+        )
+        ha1 = _md5(DIGEST_USER, DIGEST_REALM, DIGEST_PASSWORD)
+        ha2 = _md5(self.command, params.get('uri', ''))
+        expected = _md5(
+            ha1, self.server.nonce, params.get('nc', ''),
+            params.get('cnonce', ''), params.get('qop', ''), ha2
+        )
+        return (params.get('nonce') == self.server.nonce and
+                params.get('response') == expected)
+
+    def do_GET(self):
+        length = self._body()
+        path = self.path.partition('?')[0]
+        if path.startswith('/bytes/'):
+            size = int(path[7:])
+            body = self._bytes.get(size)
+            if body is None:
+                body = self._bytes[size] = b'x' * size
+            return self._send(200, body, {
+                'Content-Type': 'application/octet-stream',
+            })
+        elif path == '/json':
+            return self._send(200, DOCUMENT_BYTES, {
+                'Content-Type': 'application/json',
+            })
+        elif path == '/gzip':
+            return self._send(200, DOCUMENT_GZIP, {
+                'Content-Type': 'application/json',
+                'Content-Encoding': 'gzip',
+            })
+        elif path.startswith('/redirect/'):
+            hops = int(path[10:])
+            if hops:
+                return self._send(302, headers={
+                    'Location': '/redirect/%d' % (hops - 1),
+                })
+        elif path == '/digest':
+            if not self._digest_ok():
+                return self._send(401, b'unauthorized', {
+                    'WWW-Authenticate': (
+                        'Digest realm="%s", qop="auth", nonce="%s", '
+                        'algorithm=MD5' % (DIGEST_REALM, self.server.nonce)
+                    ),
+                })
+
+        return self._send(200, json.dumps({'received': length}).encode(), {
+            'Content-Type': 'application/json',
+        })
+
+    do_POST = do_PUT = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class UnixHandler(Handler):
+    disable_nagle_algorithm = False
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('local', 0)
+
+
+def _serve(httpd):
+    httpd.nonce = os.urandom(16).hex()
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+
+def _tls_context():
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(*CERT)
+    context.verify_mode = ssl.CERT_REQUIRED
+    context.load_verify_locations(CERT[0])
+    return context
+
+
+class Environment:
+    '''The running servers, and scratch directory, scenarios use'''
+
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        self._servers = []
+
+        httpd = self._start(
+            http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        )
+        self.http_url = 'http://127.0.0.1:%d' % httpd.server_address[1]
+
+        httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        httpd.socket = _tls_context().wrap_socket(httpd.socket,
+                                                  server_side=True)
+        self._start(httpd)
+        self.https_url = 'https://127.0.0.1:%d' % httpd.server_address[1]
+
+        self.unix_socket = os.path.join(tmpdir, 'http.sock')
+        self._start(UnixHTTPServer(self.unix_socket, UnixHandler))
+
+    def _start(self, httpd):
+        self._servers.append(_serve(httpd))
+        return httpd
+
+    def close(self):
+        for httpd in self._servers:
+            httpd.shutdown()
+            httpd.server_close()
+
+
+SCENARIOS = {}
+
+
+def scenario(name):
+    '''Registers a scenario, a generator that sets up what it needs from
+    an ``Environment``, yields a callable making one request, and then
+    cleans up
+    '''
+    def decorator(func):
+        SCENARIOS[name] = contextlib.contextmanager(func)
+        return func
+    return decorator
+
+
+@scenario('get-small')
+def _get_small(env):
+    url = env.http_url + '/bytes/128'
+    yield lambda: requisitor.get(url).bytes
+
+
+@scenario('session-small')
+def _session_small(env):
+    url = env.http_url + '/bytes/128'
+    with requisitor.Session() as s:
+        yield lambda: s.get(url).bytes
+
+
+@scenario('session-large')
+def _session_large(env):
+    url = env.http_url + '/bytes/%d' % (4 * 1024 * 1024)
+    with requisitor.Session() as s:
+        yield lambda: s.get(url).bytes
+
+
+@scenario('unix-session-small')
+def _unix_session_small(env):
+    with requisitor.Session() as s:
+        s.unix_socket = env.unix_socket
+        yield lambda: s.get('http://localhost/bytes/128').bytes
+
+
+@scenario('session-gzip')
+def _session_gzip(env):
+    url = env.http_url + '/gzip'
+    with requisitor.Session() as s:
+        yield lambda: s.get(url).json()
+
+
+@scenario('session-json-get')
+def _session_json_get(env):
+    url = env.http_url + '/json'
+    with requisitor.Session() as s:
+        yield lambda: s.get(url).json()
+
+
+@scenario('session-json-post')
+def _session_json_post(env):
+    url = env.http_url + '/json'
+    with requisitor.Session() as s:
+        yield lambda: s.post(url, json=DOCUMENT).json()
+
+
+@scenario('session-multipart')
+def _session_multipart(env):
+    path = os.path.join(env.tmpdir, 'upload.bin')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(256 * 1024))
+    url = env.http_url + '/upload'
+    files = {
+        'name': 'upload',
+        'file': {'file': path, 'mime_type': 'application/octet-stream'},
+    }
+    with requisitor.Session() as s:
+        yield lambda: s.post(url, files=files).json()
+
+
+@scenario('session-redirect-chain')
+def _session_redirect_chain(env):
+    url = env.http_url + '/redirect/5'
+    with requisitor.Session() as s:
+        yield lambda: s.get(url).bytes
+
+
+@scenario('session-digest-auth')
+def _session_digest_auth(env):
+    url = env.http_url + '/digest'
+    with requisitor.Session() as s:
+        s.auth = HTTPDigestAuth(DIGEST_USER, DIGEST_PASSWORD)
+        yield lambda: s.get(url).bytes
+
+
+@scenario('get-https-client-cert')
+def _get_https_client_cert(env):
+    url = env.https_url + '/bytes/128'
+    yield lambda: requisitor.get(url, cert=CERT, verify=False).bytes
+
+
+@scenario('session-https-client-cert')
+def _session_https_client_cert(env):
+    url = env.https_url + '/bytes/128'
+    with requisitor.Session() as s:
+        s.cert = CERT
+        s.verify = False
+        yield lambda: s.get(url).bytes
+
+
+def _percentile(ordered, percent):
+    # Nearest rank
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def run(func, requests, warmup):
+    '''Calls ``func`` ``warmup`` times, then ``requests`` times, returning
+    the throughput, and latencies in milliseconds
+    '''
+    for _ in range(warmup):
+        func()
+
+    latencies = []
+    perf_counter = time.perf_counter
+    start = perf_counter()
+    for _ in range(requests):
+        t = perf_counter()
+        func()
+        latencies.append(perf_counter() - t)
+    total = perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'seconds': round(total, 6),
+        'rps': round(requests / total, 2),
+        'mean_ms': round(total / requests * 1000, 4),
+        'p50_ms': round(_percentile(latencies, 50) * 1000, 4),
+        'p99_ms': round(_percentile(latencies, 99) * 1000, 4),
+        'max_ms': round(latencies[-1] * 1000, 4),
+    }
+
+
+def compare(baseline, results, threshold):
+    '''Returns a list of ``(name, ratio)`` of scenarios whose throughput
+    dropped by more than ``threshold`` relative to ``baseline``
+    '''
+    before = {r['name']: r for r in baseline['results']}
+    regressions = []
+    for result in results:
+        old = before.get(result['name'])
+        if not old:
+            continue
+        ratio = result['rps'] / old['rps']
+        result['baseline_rps'] = old['rps']
+        result['ratio'] = round(ratio, 4)
+        if ratio < 1 - threshold:
+            regressions.append((result['name'], ratio))
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('-n', '--requests', type=int, default=500,
+                        help='Requests per scenario, default %(default)s')
+    parser.add_argument('--warmup', type=int, default=20,
+                        help='Untimed requests per scenario, default '
+                             '%(default)s')
+    parser.add_argument('-k', '--filter', action='append', default=[],
+                        help='Only run scenarios whose name contains this, '
+                             'may be given more than once')
+    parser.add_argument('-o', '--output',
+                        help='Write the JSON results to this file, instead '
+                             'of stdout')
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help='JSON results of an earlier run to compare '
+                             'against, exits 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative drop in requests per second that '
+                             'counts as a regression, default %(default)s')
+    parser.add_argument('--list', action='store_true',
+                        help='List the scenarios, and exit')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list:
+        print('\n'.join(SCENARIOS))
+        return 0
+
+    names = [name for name in SCENARIOS
+             if not args.filter or any(f in name for f in args.filter)]
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = Environment(tmpdir)
+        try:
+            for name in names:
+                with SCENARIOS[name](env) as func:
+                    result = {'name': name}
+                    result.update(run(func, args.requests, args.warmup))
+                results.append(result)
+                print('%-28s %10.1f req/s  p50 %8.3f ms  p99 %8.3f ms' % (
+                    name, result['rps'], result['p50_ms'], result['p99_ms']
+                ), file=sys.stderr)
+        finally:
+            env.close()
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for name, ratio in regressions:
+            print('REGRESSION %s: %.1f%% of baseline' % (name, ratio * 100),
+                  file=sys.stderr)
+
+    output = json.dumps({
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': int(time.time()),
+        'requests': args.requests,
+        'warmup': args.warmup,
+        'results': results,
+    }, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,6 +4,17 @@
 from .session import Session
 
 
+def __getattr__(name):
+    # ``asyncio`` is slow to import, only load it when ``AsyncSession`` is
+    # used
+    if name == 'AsyncSession':
+        from .asyncsession import AsyncSession
+        return AsyncSession
+    raise AttributeError(
+        'module %r has no attribute %r' % (__name__, name)
+    )
+
+
 def get(url, **kwargs):
     r"""Sends a GET request. Returns :class:`HTTPResponse` object.
 
@@ -12,7 +23,7 @@ def get(url, **kwargs):
     :returns: requisitor.response.Response
     """
 
-    return Session().get(url, **kwargs)
+    return Session(pool=False).get(url, **kwargs)
 
 
 def options(url, **kwargs):
@@ -23,7 +34,7 @@ def options(url, **kwargs):
     :returns: requisitor.response.Response
     """
 
-    return Session().options(url, **kwargs)
+    return Session(pool=False).options(url, **kwargs)
 
 
 def head(url, **kwargs):
@@ -34,7 +45,7 @@ def head(url, **kwargs):
     :returns: requisitor.response.Response
     """
 
-    return Session().head(url, **kwargs)
+    return Session(pool=False).head(url, **kwargs)
 
 
 def post(url, data=None, **kwargs):
@@ -47,7 +58,7 @@ def post(url, data=None, **kwargs):
     :returns: requisitor.response.Response
     """
 
-    return Session().post(url, data=data, **kwargs)
+    return Session(pool=False).post(url, data=data, **kwargs)
 
 
 def put(url, data=None, **kwargs):
@@ -60,7 +71,7 @@ def put(url, data=None, **kwargs):
     :returns: requisitor.response.Response
     """
 
-    return Session().put(url, data=data, **kwargs)
+    return Session(pool=False).put(url, data=data, **kwargs)
 
 
 def patch(url, data=None, **kwargs):
@@ -73,7 +84,7 @@ def patch(url, data=None, **kwargs):
     :returns: requisitor.response.Response
     """
 
-    return Session().patch(url, data=data, **kwargs)
+    return Session(pool=False).patch(url, data=data, **kwargs)
 
 
 def delete(url, **kwargs):
@@ -84,4 +95,4 @@ def delete(url, **kwargs):
     :returns: requisitor.response.Response
     """
 
-    return Session().delete(url, **kwargs)
+    return Session(pool=False).delete(url, **kwargs)
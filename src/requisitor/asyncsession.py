@@ -0,0 +1,757 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import asyncio
+import collections
+import functools
+import http.client
+import io
+import socket
+import time
+import urllib.error
+import urllib.request
+from collections.abc import Iterable
+from urllib.parse import urljoin
+from urllib.parse import urlparse
+
+from .auth import HTTPBearerAuth
+from .errors import DeadlineExceeded
+from .errors import HTTPError
+from .errors import PoolError
+from .handlers import IDEMPOTENT_METHODS
+from .handlers import RedirectHandler
+from .handlers import STALE_CONNECTION_ERRORS
+from .handlers import rewind_body
+from .headers import parse_headers
+from .pool import ConnectionPool
+from .redirects import PermanentRedirectHandler
+from .redirects import RedirectCache
+from .response import ACCEPT_ENCODING
+from .response import CHUNK_SIZE
+from .response import ContentDecoder
+from .response import Response
+from .response import SUPPORTED_ENCODINGS
+from .response import parse_content_encoding
+from .sentinel import Sentinel
+from .session import BaseSession
+from .timeouts import Timeout
+from .utils import iter_body
+
+REDIRECT_CODES = frozenset((301, 302, 303, 307, 308))
+
+_MAXLINE = 65536
+_MAXHEADERS = 100
+
+# Used only for ``do_request_``, which applies the same default headers
+# (Host, Content-Type, Content-Length, User-Agent) that ``Session`` sends
+_request_handler = urllib.request.HTTPHandler()
+_request_handler.add_parent(urllib.request.OpenerDirector())
+
+
+async def _wait_for(timeouts, func, *args, connect=False):
+    # Awaits ``func(*args)`` for up to the connect or read timeout of
+    # ``timeouts``, raising DeadlineExceeded if it was the deadline that
+    # passed
+    if connect:
+        timeout = timeouts.connect_timeout()
+    else:
+        timeout = timeouts.read_timeout()
+    aw = func(*args)
+    if timeout is None:
+        return await aw
+    try:
+        return await asyncio.wait_for(aw, timeout)
+    except asyncio.TimeoutError:
+        timeouts.remaining()
+        raise socket.timeout('timed out')
+
+
+class AsyncConnection:
+    '''A persistent connection made of an ``asyncio`` stream pair'''
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @property
+    def sock(self):
+        if self.writer.is_closing():
+            return None
+        return self.writer.get_extra_info('socket')
+
+    def is_dropped(self):
+        return self.sock is None or self.reader.at_eof()
+
+    def close(self):
+        self.writer.close()
+
+
+class _LoopCondition:
+    '''Minimal condition variable for ``AsyncConnectionPool``
+
+    Pool bookkeeping never awaits, so on a single event loop it does not
+    need a lock, only a way to wake up tasks waiting for a connection
+    '''
+
+    def __init__(self):
+        self._waiters = collections.deque()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def notify(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                break
+
+    async def wait(self, timeout=None):
+        waiter = asyncio.get_event_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # This task was notified but will never act on it, pass the
+            # wakeup on so that the remaining waiters are not left hanging
+            if waiter.done() and not waiter.cancelled():
+                self.notify()
+            raise
+
+
+class AsyncConnectionPool(ConnectionPool):
+    '''``ConnectionPool`` for ``AsyncConnection`` objects, for use from a
+    single event loop
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond = _LoopCondition()
+
+    def _is_dropped(self, conn):
+        return conn.is_dropped()
+
+    async def _wait(self, key, deadline):
+        if not self.block:
+            raise PoolError('Connection pool is full for %r' % (key,))
+
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolError(
+                    'Timed out waiting for a connection for %r' % (key,)
+                )
+        await self._cond.wait(remaining)
+
+    async def acquire(self, key, factory):
+        '''Returns a tuple of ``(connection, reused)``
+
+        An idle connection for ``key`` is returned if one is available,
+        otherwise the ``factory`` coroutine function is awaited to create
+        a new one
+        '''
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+
+        while True:
+            conn = self._pop_idle(key)
+            if conn is not None:
+                return conn, True
+
+            if self._has_room(key):
+                self._counts[key] += 1
+                break
+
+            await self._wait(key, deadline)
+
+        try:
+            return await factory(), False
+        except BaseException:
+            self._forget(key)
+            raise
+
+
+class AsyncHTTPResponse:
+    '''Minimal ``asyncio`` counterpart of ``http.client.HTTPResponse``
+
+    The body is read with ``await aread()``. Once the whole body has been
+    read into memory with ``await load()``, the synchronous ``read`` is
+    also available, which is what ``Response`` and ``HTTPError`` use.
+    '''
+
+    def __init__(self, conn, method, url, timeouts=None, release=None):
+        self._conn = conn
+        self._method = method
+        self._timeouts = Timeout() if timeouts is None else timeouts
+        self._release = release
+        self._buffer = None
+        self._chunk_left = None
+        self._done = False
+
+        self.url = url
+        self.status = None
+        self.reason = None
+        self.version = None
+        self.headers = None
+        self.chunked = False
+        self.length = None
+        self.will_close = True
+
+    @property
+    def code(self):
+        return self.status
+
+    @property
+    def msg(self):
+        return self.reason
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        if self.headers is None:
+            raise http.client.ResponseNotReady()
+        headers = self.headers.get_all(name) or default
+        if isinstance(headers, str) or not hasattr(headers, '__iter__'):
+            return headers
+        return ', '.join(headers)
+
+    def getheaders(self):
+        if self.headers is None:
+            raise http.client.ResponseNotReady()
+        return self.headers.multi_items()
+
+    def isclosed(self):
+        return self._done
+
+    async def _readline(self):
+        try:
+            return await _wait_for(self._timeouts, self._conn.reader.readline)
+        except ValueError:
+            # Longer than the limit of the reader
+            raise http.client.LineTooLong('header line')
+
+    async def _readexactly(self, n):
+        try:
+            return await _wait_for(self._timeouts,
+                                   self._conn.reader.readexactly, n)
+        except asyncio.IncompleteReadError as e:
+            self._finish(False)
+            raise http.client.IncompleteRead(e.partial, n - len(e.partial))
+
+    async def _read_status(self):
+        line = str(await self._readline(), 'iso-8859-1')
+        if not line:
+            raise http.client.RemoteDisconnected(
+                'Remote end closed connection without response'
+            )
+        try:
+            version, status, reason = (line.split(None, 2) + [''])[:3]
+            status = int(status)
+        except ValueError:
+            raise http.client.BadStatusLine(line)
+        if not version.startswith('HTTP/') or not 100 <= status <= 999:
+            raise http.client.BadStatusLine(line)
+        return version, status, reason.strip()
+
+    async def _read_headers(self):
+        lines = []
+        while True:
+            line = await self._readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            lines.append(line)
+            if len(lines) > _MAXHEADERS:
+                raise http.client.HTTPException(
+                    'got more than %d headers' % _MAXHEADERS
+                )
+        return parse_headers(lines)
+
+    async def begin(self):
+        '''Reads the status line and headers of the response'''
+        while True:
+            version, status, reason = await self._read_status()
+            headers = await self._read_headers()
+            # Skip informational responses, such as 100 Continue
+            if not 100 <= status < 200 or status == 101:
+                break
+
+        self.version = 10 if version == 'HTTP/1.0' else 11
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+
+        encoding = headers.get('transfer-encoding', '')
+        self.chunked = encoding.lower() == 'chunked'
+        length = headers.get('content-length')
+        if length is not None and not self.chunked:
+            try:
+                self.length = max(int(length), 0)
+            except ValueError:
+                self.length = None
+
+        if (status in (204, 304) or 100 <= status < 200 or
+                self._method == 'HEAD'):
+            self.length = 0
+
+        connection = headers.get('connection', '').lower()
+        if self.version == 10:
+            self.will_close = 'keep-alive' not in connection
+        else:
+            self.will_close = 'close' in connection
+        if not self.chunked and self.length is None:
+            self.will_close = True
+
+        if self.length == 0 and not self.chunked:
+            self._finish(True)
+
+    def _finish(self, reusable):
+        self._done = True
+        release = self._release
+        if release is not None:
+            self._release = None
+            release(reusable=reusable and not self.will_close)
+
+    async def _read_chunk_size(self):
+        line = await self._readline()
+        try:
+            size = int(line.split(b';', 1)[0], 16)
+        except ValueError:
+            self._finish(False)
+            raise http.client.IncompleteRead(b'')
+        if size == 0:
+            # Discard the trailer
+            while await self._readline() not in (b'\r\n', b'\n', b''):
+                pass
+            self._finish(True)
+        return size
+
+    async def _read_chunked(self, amt):
+        parts = []
+        while True:
+            if not self._chunk_left:
+                self._chunk_left = await self._read_chunk_size()
+                if not self._chunk_left:
+                    break
+
+            n = self._chunk_left
+            if amt is not None:
+                n = min(n, amt)
+            parts.append(await self._readexactly(n))
+            self._chunk_left -= n
+            if not self._chunk_left:
+                await self._readexactly(2)  # CRLF after the chunk
+            if amt is not None:
+                break
+        return b''.join(parts)
+
+    async def _read_length(self, amt):
+        n = self.length if amt is None else min(amt, self.length)
+        data = await self._readexactly(n)
+        self.length -= n
+        if not self.length:
+            self._finish(True)
+        return data
+
+    async def _read_until_close(self, amt):
+        data = await _wait_for(self._timeouts, self._conn.reader.read,
+                               -1 if amt is None else amt)
+        if amt is None or not data:
+            self._finish(False)
+        return data
+
+    async def aread(self, amt=None):
+        '''Reads and returns the response body, or up to the next ``amt``
+        bytes
+        '''
+        if self._buffer is not None:
+            return self._buffer.read(amt)
+        if self._done:
+            return b''
+        if self.chunked:
+            return await self._read_chunked(amt)
+        if self.length is not None:
+            return await self._read_length(amt)
+        return await self._read_until_close(amt)
+
+    async def load(self):
+        '''Reads the remaining body into memory, after which ``read`` can
+        be used
+        '''
+        if self._buffer is None:
+            self._buffer = io.BytesIO(await self.aread())
+
+    def read(self, amt=None):
+        if self._buffer is None:
+            if self._done:
+                return b''
+            raise RuntimeError(
+                'The response body has not been read, use '
+                '"await response.aread()"'
+            )
+        return self._buffer.read(amt)
+
+    def close(self):
+        if not self._done:
+            self._finish(False)
+
+    async def aclose(self):
+        self.close()
+
+
+class AsyncResponse(Response):
+    '''``Response`` returned by ``AsyncSession``
+
+    Unless ``stream=True`` was requested, the body has already been read
+    and ``bytes``, ``text`` and ``json()`` can be used directly. Streamed
+    bodies are consumed with ``await aread()`` or ``aiter_content()``.
+    '''
+
+    def _set_stream(self, stream):
+        if stream._buffer is None:
+            self.raw = stream
+        else:
+            super()._set_stream(stream)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aiter_content(self, chunk_size=CHUNK_SIZE):
+        '''Asynchronously iterates over the decoded response body'''
+        if self._response._buffer is not None:
+            for chunk in iter(functools.partial(self.raw.read, chunk_size),
+                              b''):
+                yield chunk
+            return
+
+        decoder = None
+        encodings = parse_content_encoding(
+            self._get_header('content-encoding')
+        )
+        if encodings and SUPPORTED_ENCODINGS.issuperset(encodings):
+            decoder = ContentDecoder(encodings)
+
+        while True:
+            chunk = await self._response.aread(chunk_size)
+            if not chunk:
+                break
+            if decoder:
+                chunk = decoder.decompress(chunk)
+            if chunk:
+                yield chunk
+
+        if decoder:
+            tail = decoder.flush()
+            if tail:
+                yield tail
+
+    async def aread(self):
+        '''Reads and returns the whole decoded response body'''
+        if self._bytes is None:
+            self._bytes = b''.join(
+                [chunk async for chunk in self.aiter_content()]
+            )
+        return self._bytes
+
+    async def aclose(self):
+        await self._response.aclose()
+
+
+class AsyncSession(BaseSession):
+    '''``asyncio`` counterpart of ``Session``
+
+    Requests are made directly over ``asyncio`` streams, so that many
+    requests can be in flight on a single event loop. Connections are
+    kept alive and reused through an ``AsyncConnectionPool``.
+
+    ``AsyncSession`` supports the same arguments as ``Session.request``,
+    plus ``stream``. Proxies are not supported. Of the authentication
+    types, only ``HTTPBasicAuth``, or a ``(user, password)`` tuple, and
+    ``HTTPBearerAuth`` are supported, others such as ``HTTPDigestAuth``
+    raise ``TypeError``.
+
+    Unlike ``Session``, the default pool waits for a connection to be
+    released when full, rather than raising ``PoolError``.
+    '''
+
+    def __init__(self, pool=None, base_url=None, cookies=None,
+                 redirect_cache=None):
+        super().__init__(cookies=cookies)
+
+        if pool is None:
+            pool = AsyncConnectionPool(block=True)
+        self.pool = pool or None
+        self.redirect_cache = (
+            RedirectCache() if redirect_cache is None else
+            redirect_cache or None
+        )
+        self.base_url = base_url
+        self.max_redirects = RedirectHandler.max_redirections
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    async def close(self):
+        """Closes all idle pooled connections"""
+        if self.pool is not None:
+            self.pool.clear()
+
+    async def _connect(self, host, unix_socket, context, timeouts):
+        o = urlparse('//%s' % host)
+        kwargs = {'limit': _MAXLINE}
+        if context is not None:
+            kwargs.update(ssl=context, server_hostname=o.hostname)
+            port = o.port or http.client.HTTPS_PORT
+        else:
+            port = o.port or http.client.HTTP_PORT
+
+        try:
+            if unix_socket:
+                connect = functools.partial(asyncio.open_unix_connection,
+                                            unix_socket, **kwargs)
+            else:
+                connect = functools.partial(asyncio.open_connection,
+                                            o.hostname, port, **kwargs)
+            reader, writer = await _wait_for(timeouts, connect,
+                                             connect=True)
+        except DeadlineExceeded:
+            raise
+        except OSError as e:
+            raise urllib.error.URLError(e)
+        return AsyncConnection(reader, writer)
+
+    async def _acquire(self, key, factory):
+        if self.pool is None:
+            conn = await factory()
+            return conn, False, lambda reusable: conn.close()
+
+        conn, reused = await self.pool.acquire(key, factory)
+        return conn, reused, functools.partial(self.pool.release, key, conn)
+
+    def _serialize(self, req):
+        if req.type not in ('http', 'https'):
+            raise urllib.error.URLError('unknown url type: %s' % req.type)
+        if (req.data is not None and not isinstance(req.data, Iterable) and
+                not hasattr(req.data, 'read')):
+            raise TypeError(
+                'AsyncSession request data must be bytes or an iterable of '
+                'bytes, cannot be type %s' % req.data.__class__.__name__
+            )
+
+        _request_handler.do_request_(req)
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items()
+                        if k not in headers})
+        headers.setdefault('Accept-encoding', 'identity')
+
+        lines = ['%s %s HTTP/1.1' % (req.get_method(), req.selector or '/')]
+        for name, value in headers.items():
+            value = str(value)
+            if '\r' in value or '\n' in value:
+                raise ValueError('Invalid header value %r' % value)
+            lines.append('%s: %s' % (name.title(), value))
+        lines.append('\r\n')
+        head = '\r\n'.join(lines).encode('iso-8859-1')
+        if req.data is None or isinstance(req.data, bytes):
+            return head + (req.data or b''), None
+        return head, req.data
+
+    async def _write(self, conn, payload, body, chunked, timeouts):
+        writer = conn.writer
+        writer.write(payload)
+        if body is not None:
+            for chunk in iter_body(body, CHUNK_SIZE):
+                if chunked:
+                    writer.writelines(
+                        (b'%x\r\n' % len(chunk), chunk, b'\r\n')
+                    )
+                else:
+                    writer.write(chunk)
+                await _wait_for(timeouts, writer.drain)
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+        await _wait_for(timeouts, writer.drain)
+
+    async def _send(self, req, options, timeouts):
+        rewind_body(req)
+        if options.cookies is not None:
+            options.cookies.add_cookie_header(req)
+        if options.compression and not req.has_header('Accept-encoding'):
+            req.add_unredirected_header('Accept-encoding', ACCEPT_ENCODING)
+        payload, body = self._serialize(req)
+        chunked = req.get_header('Transfer-encoding') == 'chunked'
+
+        context = None
+        if req.type == 'https':
+            context = self._create_context(options.verify, options.cert)
+        key = (req.type, req.host, options.unix_socket, context)
+        factory = functools.partial(self._connect, req.host,
+                                    options.unix_socket, context, timeouts)
+
+        method = req.get_method()
+        retry = method in IDEMPOTENT_METHODS and body is None
+        while True:
+            conn, reused, release = await self._acquire(key, factory)
+            raw = AsyncHTTPResponse(conn, method, req.full_url,
+                                    timeouts=timeouts, release=release)
+            try:
+                await self._write(conn, payload, body, chunked, timeouts)
+                await raw.begin()
+            except STALE_CONNECTION_ERRORS:
+                raw.close()
+                if reused and retry:
+                    retry = False
+                    continue
+                raise
+            except BaseException:
+                raw.close()
+                raise
+            break
+
+        if options.cookies is not None:
+            options.cookies.extract_cookies(raw, req)
+        return raw
+
+    def _redirect(self, handler, req, raw):
+        newurl = urljoin(req.full_url, raw.headers['location'])
+        if urlparse(newurl).scheme not in ('http', 'https'):
+            raise HTTPError(
+                newurl, raw.status,
+                '%s - Redirection to url \'%s\' is not allowed' % (
+                    raw.reason, newurl
+                ),
+                raw.headers, raw, req
+            )
+        return handler.redirect_request(req, raw, raw.status, raw.reason,
+                                        raw.headers, newurl)
+
+    async def _follow(self, req, options, timeouts, allow_redirects):
+        permanent_redirects = None
+        if allow_redirects and self.redirect_cache is not None:
+            permanent_redirects = PermanentRedirectHandler(
+                self.redirect_cache, namespace=options.unix_socket
+            )
+            req = permanent_redirects.http_request(req)
+        handler = RedirectHandler(allow_redirects=allow_redirects,
+                                  permanent_redirects=permanent_redirects)
+        for _ in range(self.max_redirects + 1):
+            await self._authorize(req, options)
+            raw = await self._send(req, options, timeouts)
+            if (not allow_redirects or raw.status not in REDIRECT_CODES or
+                    'location' not in raw.headers):
+                return req, raw
+
+            # Drain the body, so that the connection can be reused
+            await raw.aread()
+            req = self._redirect(handler, req, raw)
+
+        await raw.load()
+        raise HTTPError(
+            req.full_url, raw.status,
+            'The HTTP server returned a redirect error that would lead to '
+            'an infinite loop.\nThe last 30x error message was:\n' +
+            raw.reason,
+            raw.headers, raw, req
+        )
+
+    @staticmethod
+    async def _authorize(req, options):
+        # The equivalent of BearerAuthHandler.http_request, adding the
+        # token to every request for the host the auth was prepared for,
+        # unless the caller set their own Authorization header
+        if (isinstance(options.auth, HTTPBearerAuth) and
+                req.host == options.host and
+                not req.has_header('Authorization')):
+            token = await options.auth.atoken()
+            req.add_unredirected_header('Authorization', 'Bearer %s' % token)
+
+    async def _send_bearer(self, prepared, timeouts, allow_redirects):
+        # The equivalent of BearerAuthHandler.http_error_401, retrying once
+        # with a new token
+        req, raw = await self._follow(prepared.build_request(), prepared,
+                                      timeouts, allow_redirects)
+        sent = req.get_header('Authorization', '')
+        if (raw.status != 401 or req.host != prepared.host or
+                sent[:7] != 'Bearer '):
+            return req, raw
+
+        # Drain the body, so that the connection can be reused
+        await raw.aread()
+        prepared.auth.invalidate(sent[7:])
+        req.remove_header('Authorization')
+        return await self._follow(req, prepared, timeouts, allow_redirects)
+
+    async def request(self, method, url, params=Sentinel, data=None,
+                      headers=Sentinel, cookies=Sentinel, files=None,
+                      auth=Sentinel, timeout=None, allow_redirects=True,
+                      verify=Sentinel, cert=Sentinel, json=Sentinel,
+                      unix_socket=Sentinel, compression=Sentinel,
+                      stream=False, deadline=None):
+        prepared = self.prepare(
+            method, url, params=params, data=data, headers=headers,
+            cookies=cookies, files=files, auth=auth, cert=cert, json=json,
+            unix_socket=unix_socket, verify=verify, compression=compression,
+        )
+        return await self.send(prepared, timeout=timeout,
+                               allow_redirects=allow_redirects, stream=stream,
+                               deadline=deadline)
+
+    async def send(self, prepared, timeout=None, allow_redirects=True,
+                   stream=False, deadline=None):
+        """Sends a ``PreparedRequest`` created by ``prepare``
+
+        :kwarg timeout: Seconds to wait for connecting and each read, a
+            ``(connect, read)`` tuple, or a ``requisitor.timeouts.Timeout``
+        :kwarg deadline: Seconds the request may take in total, including
+            redirects and reading a streamed body, after which
+            ``requisitor.errors.DeadlineExceeded`` is raised
+        :returns: AsyncResponse
+        """
+        bearer = isinstance(prepared.auth, HTTPBearerAuth)
+        if prepared.auth_handlers and not bearer:
+            raise TypeError(
+                '%s is not supported by AsyncSession, only HTTPBasicAuth, '
+                'or a (user, password) tuple, and HTTPBearerAuth are' % (
+                    prepared.auth.__class__.__name__
+                )
+            )
+
+        timeouts = (Timeout.from_args(timeout, deadline) or
+                    Timeout(timeout, timeout))
+        if bearer:
+            req, raw = await self._send_bearer(prepared, timeouts,
+                                               allow_redirects)
+        else:
+            req, raw = await self._follow(prepared.build_request(), prepared,
+                                          timeouts, allow_redirects)
+
+        redirect = raw.status in REDIRECT_CODES and 'location' in raw.headers
+        if not 200 <= raw.status < 300 and not redirect:
+            await raw.load()
+            e = HTTPError(req.full_url, raw.status, raw.reason, raw.headers,
+                          raw, req)
+            e._json_loads = self.json_loads
+            raise e
+
+        if not stream:
+            await raw.load()
+        return AsyncResponse(raw, request=req, json_loads=self.json_loads)
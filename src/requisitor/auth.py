@@ -2,8 +2,13 @@
 # Copyright 2020 Matt Martz
 
 import base64
+import threading
+import time
 import urllib.request
 
+from .handlers import BearerAuthHandler
+from .handlers import HTTPDigestAuthHandler
+
 
 def validate_auth(value):
     if value is None:
@@ -41,12 +46,198 @@ class HTTPBasicAuth(HTTPAuth):
 
 
 class HTTPDigestAuth(HTTPAuth):
+    '''Digest authentication
+
+    The last challenge of each origin, its realm, nonce, opaque, qop and
+    algorithm, is kept, so that later requests are authorized without
+    waiting for a ``401``. An instance is safe to share between threads.
+    '''
+
+    def __init__(self, user, password):
+        super().__init__(user, password)
+        self._lock = threading.Lock()
+        # Keyed by (scheme, host), values are [challenge, nonce count]
+        self._challenges = {}
+
+    def set_challenge(self, origin, challenge):
+        '''Remembers the ``challenge`` dict of ``origin``, restarting the
+        nonce count if the nonce changed, and returns the ``(challenge,
+        nonce count)`` tuple for the request answering it
+        '''
+        with self._lock:
+            state = self._challenges.get(origin)
+            nonce = challenge.get('nonce')
+            if state is None or state[0].get('nonce') != nonce:
+                state = self._challenges[origin] = [dict(challenge), 0]
+            # Counted here rather than with ``next_nonce``, so that the
+            # request is retried with its own challenge, even if another
+            # thread has replaced it in the meantime
+            state[1] += 1
+            return state[0], state[1]
+
+    def next_nonce(self, origin):
+        '''Returns a ``(challenge, nonce count)`` tuple, with the nonce count
+        incremented, for the next request to ``origin``, or ``None``
+        '''
+        with self._lock:
+            state = self._challenges.get(origin)
+            if state is None:
+                return None
+            state[1] += 1
+            return state[0], state[1]
+
+    def clear(self):
+        '''Forgets all challenges'''
+        with self._lock:
+            self._challenges.clear()
+
     def __call__(self, parsed_url):
         pwd_mgr = urllib.request.HTTPPasswordMgrWithDefaultRealm()
         pwd_mgr.add_password(None, parsed_url.netloc, self.user, self.password)
 
         return {
             'handlers': [
-                urllib.request.HTTPDigestAuthHandler(pwd_mgr),
+                HTTPDigestAuthHandler(pwd_mgr, challenges=self),
+            ]
+        }
+
+
+class HTTPBearerAuth(HTTPAuth):
+    '''Bearer token authentication, such as with an OAuth 2.0 access token
+
+    Tokens are fetched with ``fetch_token``, which returns either the
+    token, or a ``(token, expires_in)`` tuple, with the number of seconds
+    the token is valid for, or ``None``. A token is reused until
+    ``refresh_margin`` seconds before it expires, from then on it is
+    refreshed in a background thread, while requests keep using it. The
+    margin is capped at half the lifetime of a token, so that short lived
+    tokens are not refreshed on every request.
+
+    Only one thread, or coroutine, fetches a token at a time, others wait
+    for it when there is no valid token. On a ``401`` the token is
+    invalidated, and the request retried once with a new token.
+
+    :arg fetch_token: Callable taking no arguments
+    :kwarg refresh_margin: Seconds before the expiry of a token to start
+        refreshing it
+    '''
+
+    def __init__(self, fetch_token, refresh_margin=60):
+        if refresh_margin < 0:
+            raise ValueError(
+                'refresh_margin must not be negative, got %r' %
+                (refresh_margin,)
+            )
+        self.fetch_token = fetch_token
+        self.refresh_margin = refresh_margin
+
+        self._cond = threading.Condition()
+        self._token = None
+        self._expires = None
+        self._refresh_at = None
+        self._refreshing = False
+        # Incremented when a refresh finishes, with ``_error`` set if it
+        # failed
+        self._generation = 0
+        self._error = None
+
+    def _current(self):
+        # Called with the lock held, returns the token if it is valid,
+        # starting a background refresh if it expires soon
+        if self._token is None:
+            return None
+        if self._expires is None:
+            return self._token
+
+        now = time.monotonic()
+        if now >= self._expires:
+            return None
+        if not self._refreshing and now >= self._refresh_at:
+            self._refreshing = True
+            threading.Thread(target=self._background_refresh,
+                             daemon=True).start()
+        return self._token
+
+    def _refresh(self):
+        try:
+            result = self.fetch_token()
+        except BaseException as e:
+            with self._cond:
+                self._error = e
+                self._refreshing = False
+                self._generation += 1
+                self._cond.notify_all()
+            raise
+
+        token, expires_in = (
+            result if isinstance(result, tuple) else (result, None)
+        )
+        with self._cond:
+            self._token = token
+            if expires_in is None:
+                self._expires = self._refresh_at = None
+            else:
+                now = time.monotonic()
+                self._expires = now + expires_in
+                self._refresh_at = self._expires - min(self.refresh_margin,
+                                                       expires_in / 2)
+            self._error = None
+            self._refreshing = False
+            self._generation += 1
+            self._cond.notify_all()
+        return token
+
+    def _background_refresh(self):
+        try:
+            self._refresh()
+        except Exception:
+            # The current token stays in use until it expires, and the
+            # next request after that refreshes it, raising the error
+            pass
+
+    def token(self):
+        '''Returns a valid token, fetching one if needed'''
+        with self._cond:
+            while True:
+                token = self._current()
+                if token is not None:
+                    return token
+                if not self._refreshing:
+                    self._refreshing = True
+                    break
+
+                generation = self._generation
+                while self._generation == generation:
+                    self._cond.wait()
+                if self._error is not None:
+                    raise self._error
+
+        return self._refresh()
+
+    async def atoken(self):
+        '''Returns a valid token like ``token``, waiting for a fetch in a
+        thread, so that the event loop is not blocked
+        '''
+        with self._cond:
+            token = self._current()
+        if token is not None:
+            return token
+
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.token)
+
+    def invalidate(self, token=None):
+        '''Forgets the current token, if it is ``token``, or any token if
+        ``token`` is ``None``
+        '''
+        with self._cond:
+            if token is None or token == self._token:
+                self._token = self._expires = None
+
+    def __call__(self, parsed_url):
+        return {
+            'handlers': [
+                BearerAuthHandler(self, parsed_url.netloc),
             ]
         }
@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import collections
+import email.utils
+import hashlib
+import http.client
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import namedtuple
+
+from .utils import parse_cache_control
+
+CacheEntry = namedtuple(
+    'CacheEntry',
+    ('url', 'status', 'reason', 'version', 'headers', 'body', 'vary',
+     'request_time', 'response_time')
+)
+
+# Status codes that are cacheable by default, RFC 9110 Section 15.1
+CACHEABLE_STATUSES = frozenset((200, 203, 204, 300, 301, 308, 404, 405, 410,
+                                414, 501))
+
+SAFE_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'TRACE'))
+
+# Headers describing the stored content, which a 304 must not replace,
+# RFC 9111 Section 3.2
+_CONTENT_HEADERS = frozenset(('content-length', 'content-encoding',
+                              'transfer-encoding', 'content-range'))
+
+
+def _parse_date(value):
+    if not value:
+        return None
+    try:
+        parsed = email.utils.parsedate_tz(value)
+    except (TypeError, ValueError):
+        return None
+    if parsed is None:
+        return None
+    return email.utils.mktime_tz(parsed)
+
+
+def _seconds(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _headers(entry):
+    headers = http.client.HTTPMessage()
+    for name, value in entry.headers:
+        headers[name] = value
+    return headers
+
+
+def freshness_lifetime(entry):
+    '''Returns the number of seconds ``entry`` is fresh for after it was
+    generated, RFC 9111 Section 4.2.1
+    '''
+    headers = _headers(entry)
+    cc = parse_cache_control(headers.get('cache-control'))
+    if 'no-cache' in cc:
+        return 0
+
+    max_age = _seconds(cc.get('max-age'))
+    if max_age is not None:
+        return max_age
+
+    date = _parse_date(headers.get('date'))
+    if date is None:
+        date = entry.response_time
+    if 'expires' in headers:
+        expires = _parse_date(headers['expires'])
+        if expires is None:
+            return 0
+        return max(expires - date, 0)
+
+    last_modified = _parse_date(headers.get('last-modified'))
+    if last_modified is not None and entry.status in CACHEABLE_STATUSES:
+        # Heuristic freshness, RFC 9111 Section 4.2.2
+        return max((date - last_modified) // 10, 0)
+    return 0
+
+
+def current_age(entry, now=None):
+    '''Returns the age of ``entry`` in seconds, RFC 9111 Section 4.2.3'''
+    if now is None:
+        now = time.time()
+    headers = _headers(entry)
+    date = _parse_date(headers.get('date'))
+    if date is None:
+        date = entry.response_time
+    apparent_age = max(entry.response_time - date, 0)
+    response_delay = entry.response_time - entry.request_time
+    age = (_seconds(headers.get('age')) or 0) + response_delay
+    return max(apparent_age, age) + (now - entry.response_time)
+
+
+class BaseCache:
+    '''Base class for ``CacheHandler`` storage backends
+
+    Backends map a string key to a ``CacheEntry``, and must be thread safe.
+    ``max_bytes``, if set, is the largest body that will be stored.
+    '''
+
+    max_bytes = None
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, entry):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCache(BaseCache):
+    '''In memory LRU cache, bounded by the number of entries and the total
+    size of the stored bodies
+
+    :kwarg max_entries: Maximum number of entries
+    :kwarg max_bytes: Maximum total size in bytes of the stored bodies,
+        ``None`` for no limit
+    '''
+
+    def __init__(self, max_entries=1000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size(self):
+        '''Total size in bytes of the stored bodies'''
+        return self._size
+
+    def get(self, key):
+        with self._lock:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                return None
+            return self._entries[key]
+
+    def _pop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry.body)
+
+    def _full(self):
+        if len(self._entries) > self.max_entries:
+            return True
+        return self.max_bytes is not None and self._size > self.max_bytes
+
+    def set(self, key, entry):
+        if self.max_bytes is not None and len(entry.body) > self.max_bytes:
+            return
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = entry
+            self._size += len(entry.body)
+            while self._full():
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class FileCache(BaseCache):
+    '''Cache storing one file per entry in ``directory``, which persists
+    across processes
+
+    :arg directory: Directory to store entries in, created if missing
+    :kwarg max_bytes: (optional) Largest body that will be stored
+    '''
+
+    def __init__(self, directory, max_bytes=None):
+        self.directory = os.fspath(directory)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                meta = json.loads(f.readline())
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self.delete(key)
+            return None
+        if meta.get('key') != key:
+            return None
+
+        meta['headers'] = [tuple(h) for h in meta['headers']]
+        return CacheEntry(body=body, **{f: meta[f] for f in CacheEntry._fields
+                                        if f != 'body'})
+
+    def set(self, key, entry):
+        if self.max_bytes is not None and len(entry.body) > self.max_bytes:
+            return
+        meta = dict(entry._asdict(), key=key)
+        del meta['body']
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(json.dumps(meta).encode('utf-8'))
+                f.write(b'\n')
+                f.write(entry.body)
+            os.replace(tmp, self._path(key))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if len(name) == 64:
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+
+class CachedResponse(io.BytesIO):
+    '''A response served from a ``CacheEntry``, in place of an
+    ``http.client.HTTPResponse``
+    '''
+
+    from_cache = True
+
+    def __init__(self, entry, url, age=0):
+        super().__init__(entry.body)
+        self.status = self.code = entry.status
+        self.reason = self.msg = entry.reason
+        self.version = entry.version
+        self.headers = _headers(entry)
+        del self.headers['age']
+        self.headers['Age'] = str(int(age))
+        self.url = url
+        self.length = len(entry.body)
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def getheaders(self):
+        return list(self.headers.items())
+
+    def isclosed(self):
+        return self.closed
+
+
+class _CacheTee:
+    '''Wraps a response, collecting the body as it is read, and storing it
+    once the body has been read to the end
+    '''
+
+    def __init__(self, response, store, max_bytes=None):
+        self._response = response
+        self._store = store
+        self._max_bytes = max_bytes
+        self._chunks = []
+        self._size = 0
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def _record(self, data, amt):
+        if self._chunks is None:
+            return
+        if data:
+            self._size += len(data)
+            if self._max_bytes is not None and self._size > self._max_bytes:
+                self._chunks = None
+                return
+            self._chunks.append(data)
+        if not data or amt is None or self._response.isclosed():
+            body = b''.join(self._chunks)
+            self._chunks = None
+            self._store(body)
+
+    def read(self, amt=None):
+        data = self._response.read(amt)
+        self._record(data, amt)
+        return data
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
+
+    def close(self):
+        self._chunks = None
+        self._response.close()
+
+
+class CacheHandler(urllib.request.BaseHandler):
+    '''Private HTTP cache following RFC 9111
+
+    Fresh responses to ``GET`` requests are served from ``cache`` without
+    touching the network, stale responses with an ``ETag`` or
+    ``Last-Modified`` validator are revalidated with a conditional request,
+    and a ``304 Not Modified`` is turned into the cached response.
+
+    :arg cache: ``BaseCache`` storage backend
+    :kwarg namespace: (optional) prefix for keys, such as the unix socket
+        requests are sent over
+    '''
+
+    # Run before the HTTP handlers, so a fresh entry short circuits the
+    # request, and before HTTPErrorProcessor sees a 304
+    handler_order = 100
+
+    def __init__(self, cache, namespace=None):
+        self.cache = cache
+        self.namespace = namespace
+
+    def _key(self, req):
+        url = req.full_url.partition('#')[0]
+        if self.namespace:
+            return '%s|%s' % (self.namespace, url)
+        return url
+
+    @staticmethod
+    def _request_cache_control(req):
+        cc = parse_cache_control(req.get_header('Cache-control'))
+        if not cc and 'no-cache' in (req.get_header('Pragma') or ''):
+            cc['no-cache'] = None
+        return cc
+
+    @staticmethod
+    def _vary_matches(entry, req):
+        return all(
+            req.get_header(name.capitalize()) == value
+            for name, value in entry.vary.items()
+        )
+
+    def http_open(self, req):
+        req._cache_entry = None
+        req._cache_request_time = time.time()
+        if req.get_method() != 'GET':
+            return None
+
+        cc = self._request_cache_control(req)
+        if 'no-store' in cc:
+            return None
+
+        key = self._key(req)
+        entry = self.cache.get(key)
+        if entry is None or not self._vary_matches(entry, req):
+            return None
+
+        age = current_age(entry)
+        max_age = _seconds(cc.get('max-age'))
+        fresh = age < freshness_lifetime(entry)
+        if max_age is not None:
+            fresh = fresh and age <= max_age
+        if fresh and 'no-cache' not in cc:
+            return CachedResponse(entry, req.full_url, age=age)
+
+        headers = _headers(entry)
+        etag = headers.get('etag')
+        last_modified = headers.get('last-modified')
+        if etag is None and last_modified is None:
+            return None
+        if req.has_header('If-none-match') or \
+                req.has_header('If-modified-since'):
+            # The caller is revalidating their own copy
+            return None
+
+        if etag is not None:
+            req.add_unredirected_header('If-none-match', etag)
+        if last_modified is not None:
+            req.add_unredirected_header('If-modified-since', last_modified)
+        req._cache_entry = entry
+        return None
+
+    https_open = http_open
+
+    def _not_modified(self, req, response, entry):
+        response.read()
+        response.close()
+
+        replaced = {name.lower() for name in response.headers.keys()
+                    if name.lower() not in _CONTENT_HEADERS}
+        headers = [(n, v) for n, v in entry.headers
+                   if n.lower() not in replaced]
+        headers.extend((n, v) for n, v in response.headers.items()
+                       if n.lower() in replaced)
+        entry = entry._replace(
+            headers=headers,
+            request_time=req._cache_request_time,
+            response_time=time.time(),
+        )
+        self.cache.set(self._key(req), entry)
+        return CachedResponse(entry, req.full_url, age=current_age(entry))
+
+    def _storable(self, req, response):
+        if response.status not in CACHEABLE_STATUSES:
+            return False
+        if 'no-store' in self._request_cache_control(req):
+            return False
+        headers = response.headers
+        cc = parse_cache_control(headers.get('cache-control'))
+        if 'no-store' in cc or headers.get('vary', '').strip() == '*':
+            return False
+        explicit = (
+            'max-age' in cc or 'expires' in headers or
+            'etag' in headers or 'last-modified' in headers
+        )
+        return explicit
+
+    def http_response(self, req, response):
+        if getattr(response, 'from_cache', False):
+            return response
+
+        method = req.get_method()
+        if method not in SAFE_METHODS:
+            if response.status < 400:
+                self.cache.delete(self._key(req))
+            return response
+
+        entry = getattr(req, '_cache_entry', None)
+        if entry is not None and response.status == 304:
+            return self._not_modified(req, response, entry)
+
+        if method != 'GET' or not self._storable(req, response):
+            return response
+        return self._tee(req, response)
+
+    https_response = http_response
+
+    @staticmethod
+    def _vary(req, response):
+        # The request headers named by Vary, that a later request has to
+        # match to be served the entry
+        vary = {}
+        for names in response.headers.get_all('vary') or ():
+            for name in names.split(','):
+                name = name.strip().lower()
+                if name:
+                    vary[name] = req.get_header(name.capitalize())
+        return vary
+
+    def _tee(self, req, response):
+        max_bytes = self.cache.max_bytes
+        length = getattr(response, 'length', None)
+        if max_bytes is not None and length is not None and \
+                length > max_bytes:
+            return response
+
+        vary = self._vary(req, response)
+        response_time = time.time()
+        partial_entry = CacheEntry(
+            url=req.full_url,
+            status=response.status,
+            reason=response.reason,
+            version=getattr(response, 'version', 11),
+            headers=list(response.headers.items()),
+            body=b'',
+            vary=vary,
+            request_time=getattr(req, '_cache_request_time', response_time),
+            response_time=response_time,
+        )
+        key = self._key(req)
+
+        def store(body):
+            self.cache.set(key, partial_entry._replace(body=body))
+
+        return _CacheTee(response, store, max_bytes)
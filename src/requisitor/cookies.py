@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import collections
+import http.cookiejar
+import time
+
+# Limits suggested by RFC 6265 Section 6.1
+MAX_COOKIES = 3000
+MAX_COOKIES_PER_DOMAIN = 50
+
+
+def _domain_keys(host):
+    # Every key a cookie for ``host`` could be stored under, ``host`` and
+    # each of its parent domains, with and without a leading dot
+    host = host.lstrip('.')
+    while host:
+        yield host
+        yield '.' + host
+        host = host.partition('.')[2]
+
+
+class CookieJar(http.cookiejar.CookieJar):
+    '''``http.cookiejar.CookieJar`` that only inspects the cookies stored
+    for the domains of a request, instead of every cookie in the jar
+
+    The stdlib jar walks every cookie on each request to find matches and
+    to discard expired cookies. This jar looks up the request host and its
+    parent domains in its ``{domain: {path: {name: cookie}}}`` store, only
+    discards expired cookies once the earliest expiry has passed, and skips
+    all work for responses without cookies, or a jar without cookies.
+
+    :kwarg policy: ``http.cookiejar.CookiePolicy``, defaults to
+        ``http.cookiejar.DefaultCookiePolicy``
+    :kwarg max_cookies: Maximum number of cookies, the least recently set
+        cookies are evicted first
+    :kwarg max_cookies_per_domain: Maximum number of cookies per domain
+    '''
+
+    def __init__(self, policy=None, max_cookies=MAX_COOKIES,
+                 max_cookies_per_domain=MAX_COOKIES_PER_DOMAIN):
+        super().__init__(policy=policy)
+        self.max_cookies = max_cookies
+        self.max_cookies_per_domain = max_cookies_per_domain
+
+        # ``(domain, path, name)`` of every cookie, least recently set first
+        self._order = collections.OrderedDict()
+        self._next_expiry = None
+
+    def __len__(self):
+        return len(self._order)
+
+    def _cookies_for_request(self, request):
+        req_host, erhn = http.cookiejar.eff_request_host(request)
+        keys = dict.fromkeys(_domain_keys(req_host))
+        keys.update(dict.fromkeys(_domain_keys(erhn)))
+        cookies = []
+        for domain in keys:
+            if domain in self._cookies:
+                cookies.extend(self._cookies_for_domain(domain, request))
+        return cookies
+
+    def add_cookie_header(self, request):
+        if not self._order:
+            return
+        super().add_cookie_header(request)
+
+    def extract_cookies(self, response, request):
+        headers = response.info()
+        if 'Set-Cookie' not in headers and 'Set-Cookie2' not in headers:
+            return
+        super().extract_cookies(response, request)
+
+    def set_cookie(self, cookie):
+        with self._cookies_lock:
+            super().set_cookie(cookie)
+
+            key = (cookie.domain, cookie.path, cookie.name)
+            self._order[key] = None
+            self._order.move_to_end(key)
+
+            if cookie.expires is not None and (
+                    self._next_expiry is None or
+                    cookie.expires < self._next_expiry):
+                self._next_expiry = cookie.expires
+
+            self._evict(cookie.domain)
+
+    def _count(self, domain):
+        return sum(len(names) for names in self._cookies[domain].values())
+
+    def _evict(self, domain):
+        if (len(self._order) <= self.max_cookies and
+                self._count(domain) <= self.max_cookies_per_domain):
+            return
+
+        self.clear_expired_cookies(force=True)
+
+        if domain in self._cookies:
+            excess = self._count(domain) - self.max_cookies_per_domain
+            if excess > 0:
+                keys = [key for key in self._order if key[0] == domain]
+                for key in keys[:excess]:
+                    self.clear(*key)
+
+        while len(self._order) > self.max_cookies:
+            self.clear(*next(iter(self._order)))
+
+    def clear(self, domain=None, path=None, name=None):
+        with self._cookies_lock:
+            super().clear(domain, path, name)
+
+            if name is not None:
+                del self._order[(domain, path, name)]
+            elif domain is None:
+                self._order.clear()
+                self._next_expiry = None
+            else:
+                for key in list(self._order):
+                    if key[0] == domain and path in (None, key[1]):
+                        del self._order[key]
+
+            if domain is not None:
+                # Don't leave behind empty domains, or paths, so lookups of
+                # them stay cheap
+                paths = self._cookies.get(domain)
+                if paths is not None and path in paths and not paths[path]:
+                    del paths[path]
+                if paths is not None and not paths:
+                    del self._cookies[domain]
+
+    def clear_expired_cookies(self, force=False):
+        '''Discards all expired cookies, does nothing until the earliest
+        expiry has passed, unless ``force`` is ``True``
+        '''
+        with self._cookies_lock:
+            now = time.time()
+            if not force and (self._next_expiry is None or
+                              now < self._next_expiry):
+                return
+
+            next_expiry = None
+            for cookie in list(self):
+                if cookie.is_expired(now):
+                    self.clear(cookie.domain, cookie.path, cookie.name)
+                elif cookie.expires is not None and (
+                        next_expiry is None or cookie.expires < next_expiry):
+                    next_expiry = cookie.expires
+            self._next_expiry = next_expiry
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 # Copyright 2020 Matt Martz
 
+import socket
 import urllib.error
 
 from .response import Response
@@ -10,3 +11,22 @@ class HTTPError(urllib.error.HTTPError, Response):
     def __init__(self, url, code, msg, hdrs, fp, req=None):
         super().__init__(url, code, msg, hdrs, fp)
         Response.__init__(self, fp, req, _error=True)
+
+
+class PoolError(Exception):
+    '''Raised when a connection cannot be acquired from a
+    ``ConnectionPool``
+    '''
+
+
+class UnrewindableBodyError(Exception):
+    '''Raised when a request body that can only be read once, such as a
+    generator, would have to be sent again, on a redirect or an
+    authentication retry
+    '''
+
+
+class DeadlineExceeded(socket.timeout):
+    '''Raised when the ``deadline`` of a request passes before it, and
+    reading its body, completed
+    '''
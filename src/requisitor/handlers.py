@@ -2,19 +2,62 @@
 # Copyright 2020 Matt Martz
 
 import contextlib
+import functools
 import http.client
+import os
 import socket
+import ssl
+import time
 import urllib.error
 import urllib.request
 import urllib.response
 
+from .errors import DeadlineExceeded
 from .errors import HTTPError
+from .errors import PoolError
+from .errors import UnrewindableBodyError
+from .response import ACCEPT_ENCODING
+from .response import CHUNK_SIZE
 from .response import Response
+from .timings import Timings
+from .utils import is_regular_file
+from .utils import iter_body
+
+
+# Headers describing the payload, dropped along with it on redirects that
+# do not preserve it
+REDIRECT_CONTENT_HEADERS = ('content-length', 'content-type')
+
+
+def redirect_method(code, method):
+    '''Returns the method of the request following a ``code`` redirect of
+    a ``method`` request
+    '''
+    # http://tools.ietf.org/html/rfc7231#section-6.4.4
+    if code == 303 and method != 'HEAD':
+        return 'GET'
+
+    # Non-standard transformations
+
+    # Turn 302s into GETs.
+    if code == 302 and method != 'HEAD':
+        return 'GET'
+
+    # Turn 301 from POST into GET
+    if code == 301 and method == 'POST':
+        return 'GET'
+
+    return method
 
 
 class RedirectHandler(urllib.request.HTTPRedirectHandler):
-    def __init__(self, allow_redirects=True):
+    def __init__(self, allow_redirects=True, hooks=None,
+                 permanent_redirects=None):
         self.allow_redirects = allow_redirects
+        self.hooks = hooks
+        # Optional ``requisitor.redirects.PermanentRedirectHandler`` that
+        # permanent redirects are recorded with
+        self.permanent_redirects = permanent_redirects
 
     def redirect_request(self, req, fp, code, msg, headers, newurl):
         if not self.allow_redirects:
@@ -39,26 +82,11 @@ class RedirectHandler(urllib.request.HTTPRedirectHandler):
         else:
             # Do not preserve payload and filter headers
             data = None
-
-            CONTENT_HEADERS = ('content-length', 'content-type')
             newheaders = {k: v for k, v in req.headers.items()
-                          if k.lower() not in CONTENT_HEADERS}
-
-            # http://tools.ietf.org/html/rfc7231#section-6.4.4
-            if code == 303 and m != 'HEAD':
-                m = 'GET'
-
-            # Non-standard transformations
-
-            # Turn 302s into GETs.
-            if code == 302 and m != 'HEAD':
-                m = 'GET'
+                          if k.lower() not in REDIRECT_CONTENT_HEADERS}
+            m = redirect_method(code, m)
 
-            # Turn 301 from POST into GET
-            if code == 301 and m == 'POST':
-                m = 'GET'
-
-        return urllib.request.Request(
+        new = urllib.request.Request(
             newurl,
             method=m,
             headers=newheaders,
@@ -66,6 +94,19 @@ class RedirectHandler(urllib.request.HTTPRedirectHandler):
             origin_req_host=origin_req_host,
             unverifiable=True
         )
+        if data is not None:
+            # The body is sent again
+            new.body_position = getattr(req, 'body_position', None)
+            new.body_sent = getattr(req, 'body_sent', False)
+        # Every hop adds its timings to the same list, and counts towards
+        # the same deadline
+        new.timings = get_request_timings(req)
+        new.timeouts = getattr(req, 'timeouts', None)
+        if self.permanent_redirects is not None and code in (301, 308):
+            self.permanent_redirects.record(req, code, headers, newurl)
+        if self.hooks is not None:
+            self.hooks.emit('redirect', req, new, code)
+        return new
 
     def http_error_302(self, req, fp, code, msg, headers):
         try:
@@ -87,12 +128,665 @@ class RedirectHandler(urllib.request.HTTPRedirectHandler):
     http_error_307 = http_error_308 = http_error_302
 
 
+class AcceptEncodingProcessor(urllib.request.BaseHandler):
+    '''Advertises the content codings that ``Response`` can decode, unless
+    the request already carries an ``Accept-Encoding`` header
+    '''
+
+    def __init__(self, accept_encoding=ACCEPT_ENCODING):
+        self.accept_encoding = accept_encoding
+
+    def http_request(self, req):
+        if not req.has_header('Accept-encoding'):
+            req.add_unredirected_header('Accept-encoding',
+                                        self.accept_encoding)
+        return req
+
+    https_request = http_request
+
+
 class HTTPErrorHandler(urllib.request.HTTPDefaultErrorHandler):
+    def __init__(self, hooks=None):
+        self.hooks = hooks
+
     def http_error_default(self, req, fp, code, msg, hdrs):
-        raise HTTPError(req.full_url, code, msg, hdrs, fp, req)
+        e = HTTPError(req.full_url, code, msg, hdrs, fp, req)
+        if self.hooks is not None:
+            self.hooks.emit('error', req, e)
+        raise e
+
+
+class HTTPDigestAuthHandler(urllib.request.HTTPDigestAuthHandler):
+    '''HTTPDigestAuthHandler that consumes the body of a Digest challenge
+    before retrying, so that a pooled connection is released, and can be
+    reused for the retry, instead of being held until garbage collected
+
+    With ``challenges``, such as ``requisitor.auth.HTTPDigestAuth``, the
+    last challenge of each origin is remembered there, and requests to the
+    origin are authorized preemptively, with an incrementing nonce count,
+    instead of waiting for a ``401`` every time. A ``401``, such as one
+    with ``stale=true`` once the nonce expired, answers with a new
+    challenge, which the request is retried with.
+
+    :kwarg passwd: ``HTTPPasswordMgr`` to find credentials in
+    :kwarg challenges: (optional) object with ``set_challenge(origin,
+        challenge)`` and ``next_nonce(origin)`` methods, both returning a
+        ``(challenge, nonce count)`` tuple, or ``None`` from ``next_nonce``
+        for an unknown origin
+    '''
+
+    # Retries of a request answering rejected credentials, as urllib, and
+    # answering stale nonces
+    max_retries = 6
+    max_stale_retries = 20
+
+    def __init__(self, passwd=None, challenges=None):
+        super().__init__(passwd)
+        self.challenges = challenges
+
+    @staticmethod
+    def _origin(req):
+        return (req.type, req.host)
+
+    def http_request(self, req):
+        if self.challenges is None or req.has_header('Authorization'):
+            return req
+        state = self.challenges.next_nonce(self._origin(req))
+        if state is not None:
+            auth = self._authorization(req, *state)
+            if auth:
+                req.add_unredirected_header('Authorization', 'Digest ' + auth)
+        return req
+
+    https_request = http_request
+
+    def get_authorization(self, req, chal):
+        if self.challenges is None:
+            return super().get_authorization(req, chal)
+        state = self.challenges.set_challenge(self._origin(req), chal)
+        return self._authorization(req, *state)
+
+    def _authorization(self, req, chal, nonce_count):
+        # Same as urllib's get_authorization, with the nonce count kept by
+        # ``challenges`` rather than the handler, which is shared between
+        # threads
+        try:
+            realm = chal['realm']
+            nonce = chal['nonce']
+            H, KD = self.get_algorithm_impls(chal.get('algorithm', 'MD5'))
+        except (KeyError, ValueError):
+            # Incomplete challenge, or unsupported algorithm
+            return None
+
+        user, pw = self.passwd.find_user_password(realm, req.full_url)
+        if user is None:
+            return None
+
+        A1 = '%s:%s:%s' % (user, realm, pw)
+        A2 = '%s:%s' % (req.get_method(), req.selector)
+        respdig, qop_params = self._response_digest(
+            H, KD, A1, A2, nonce, chal.get('qop'), nonce_count
+        )
+        return self._authorization_params(req, chal, user, respdig) + \
+            qop_params
+
+    @staticmethod
+    def _response_digest(H, KD, A1, A2, nonce, qop, nonce_count):
+        # Returns the request digest, and the qop parameters of the
+        # Authorization header
+        if qop is None:
+            return KD(H(A1), '%s:%s' % (nonce, H(A2))), ''
+        if 'auth' not in qop.split(','):
+            raise urllib.error.URLError("qop '%s' is not supported." % qop)
+
+        ncvalue = '%08x' % nonce_count
+        cnonce = os.urandom(8).hex()
+        noncebit = '%s:%s:%s:%s:%s' % (nonce, ncvalue, cnonce, 'auth', H(A2))
+        return (KD(H(A1), noncebit),
+                ', qop=auth, nc=%s, cnonce="%s"' % (ncvalue, cnonce))
+
+    def _authorization_params(self, req, chal, user, respdig):
+        base = ('username="%s", realm="%s", nonce="%s", uri="%s", '
+                'response="%s"' % (user, chal['realm'], chal['nonce'],
+                                   req.selector, respdig))
+        opaque = chal.get('opaque')
+        if opaque:
+            base += ', opaque="%s"' % opaque
+        if req.data is not None:
+            entdig = self.get_entity_digest(req.data, chal)
+            if entdig:
+                base += ', digest="%s"' % entdig
+        return base + ', algorithm="%s"' % chal.get('algorithm', 'MD5')
+
+    def http_error_auth_reqed(self, auth_header, host, req, headers):
+        # urllib counts retries on the handler, which is shared between
+        # threads, count them on the request instead. Retries answering a
+        # stale nonce, which other requests may keep renewing, are counted
+        # separately from those answering rejected credentials
+        challenge = headers.get(auth_header, '')
+        if challenge[:7].lower() != 'digest ':
+            return None
+        chal = urllib.request.parse_keqv_list(
+            filter(None, urllib.request.parse_http_list(challenge[7:]))
+        )
+        stale = chal.get('stale', '').lower() == 'true'
+        name = '_digest_stale' if stale else '_digest_retried'
+        retried = getattr(req, name, 0)
+        if retried >= (self.max_stale_retries if stale else
+                       self.max_retries):
+            raise urllib.error.HTTPError(req.full_url, 401,
+                                         'digest auth failed', headers, None)
+        setattr(req, name, retried + 1)
+        return self.retry_http_digest_auth(req, challenge)
+
+    def http_error_401(self, req, fp, code, msg, headers):
+        challenge = headers.get('www-authenticate', '')
+        if challenge[:7].lower() == 'digest ':
+            fp.read()
+            fp.close()
+        return self.http_error_auth_reqed('www-authenticate', req.host, req,
+                                          headers)
+
+
+class BearerAuthHandler(urllib.request.BaseHandler):
+    '''Adds the token of ``auth``, a ``requisitor.auth.HTTPBearerAuth``,
+    to requests for ``host``, and on a ``401`` invalidates the token and
+    retries the request once with a fresh one
+    '''
+
+    def __init__(self, auth, host):
+        self.auth = auth
+        self.host = host
+
+    def http_request(self, req):
+        if req.host == self.host and not req.has_header('Authorization'):
+            req.add_unredirected_header('Authorization',
+                                        'Bearer %s' % self.auth.token())
+        return req
+
+    https_request = http_request
+
+    def http_error_401(self, req, fp, code, msg, headers):
+        if req.host != self.host or getattr(req, '_bearer_retried', False):
+            return None
+
+        sent = req.get_header('Authorization', '')
+        if sent[:7] != 'Bearer ':
+            # Credentials set by the caller, rather than a token
+            return None
+        self.auth.invalidate(sent[7:])
+        # Consume the body, so that the connection can be reused for the
+        # retry
+        fp.read()
+        fp.close()
+        req._bearer_retried = True
+        req.add_unredirected_header('Authorization',
+                                    'Bearer %s' % self.auth.token())
+        return self.parent.open(req, timeout=req.timeout)
+
+
+IDEMPOTENT_METHODS = frozenset(
+    ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE')
+)
+
+# Errors indicating that a reused keep-alive connection was closed by
+# the peer before it received our request
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    BrokenPipeError,
+    ConnectionAbortedError,
+    ConnectionResetError,
+)
+
+
+def send_body(sock, body, chunked=False, chunk_size=CHUNK_SIZE):
+    '''Writes a streaming request ``body`` to ``sock``
+
+    ``body`` may be a readable file object or an iterable of bytes, and is
+    written in chunks of at least ``chunk_size`` bytes, using chunked
+    transfer encoding if ``chunked`` is ``True``. Regular files are handed
+    to ``socket.sendfile`` on plain, non-TLS sockets.
+    '''
+    if (not chunked and not isinstance(sock, ssl.SSLSocket) and
+            is_regular_file(body)):
+        sock.sendfile(body, body.tell())
+        return
+
+    for chunk in iter_body(body, chunk_size):
+        if chunked:
+            chunk = b'%x\r\n%s\r\n' % (len(chunk), chunk)
+        sock.sendall(chunk)
+    if chunked:
+        sock.sendall(b'0\r\n\r\n')
+
+
+def rewind_body(req):
+    '''Rewinds the streaming body of ``req`` before it is sent, as it is
+    again on redirects and authentication retries
+
+    Seekable files are rewound to their ``body_position``, set by
+    ``PreparedRequest.build_request``, other iterables are sent as they are.
+
+    :raises UnrewindableBodyError: if a body that can only be read once,
+        such as a generator, was already sent
+    '''
+    body = req.data
+    if isinstance(body, (bytes, bytearray, memoryview, type(None))):
+        return
+    position = getattr(req, 'body_position', None)
+    if position is not None:
+        body.seek(position)
+    elif getattr(req, 'body_sent', False) and (
+            hasattr(body, 'read') or iter(body) is body):
+        raise UnrewindableBodyError(
+            'Cannot send the body of %s %s again, as it can only be read '
+            'once' % (req.get_method(), req.full_url)
+        )
+    req.body_sent = True
+
+
+def get_request_timings(req):
+    '''Returns the list of ``Timings`` of ``req``, one per request made
+    for it, including redirects and authentication retries
+    '''
+    try:
+        return req.timings
+    except AttributeError:
+        req.timings = []
+        return req.timings
+
+
+def _close_unpooled(conn, reusable=True):
+    conn.close()
+
+
+class PooledHTTPResponse(http.client.HTTPResponse):
+    '''HTTPResponse that hands its connection back to a ``ConnectionPool``
+    once the body has been consumed, or discards it if the response is
+    closed early
+    '''
+
+    _release = None
+    _on_end = None
+    _sock = None
+    timings = None
+    # ``requisitor.timeouts.Timeout`` of the request, set by
+    # ``TimingConnectionMixin``
+    timeouts = None
+
+    def _release_conn(self, reusable):
+        release = self._release
+        if release is not None:
+            self._release = None
+            release(reusable=reusable and not self.will_close)
+
+    def _close_conn(self):
+        super()._close_conn()
+        timings = self.timings
+        if timings is not None and timings.end is None:
+            timings.end = time.monotonic()
+        self._release_conn(True)
+        on_end = self._on_end
+        if on_end is not None:
+            self._on_end = None
+            on_end(self)
+
+    def close(self):
+        if self.fp is not None:
+            self._release_conn(False)
+        super().close()
+
+    def read(self, amt=None):
+        timeouts = self.timeouts
+        if timeouts is None or timeouts.expires is None:
+            return super().read(amt)
+
+        # Read with one system call at a time, each limited to the time
+        # left until the deadline, so a slowly trickling body cannot
+        # exceed it
+        chunks = []
+        size = 0
+        while amt is None or size < amt:
+            if self.fp is None:
+                break
+            try:
+                self._sock.settimeout(timeouts.read_timeout())
+                chunk = self.read1(
+                    CHUNK_SIZE if amt is None else amt - size
+                )
+            except OSError as e:
+                # Discard the connection, rather than hold on to it with
+                # the rest of the body unread
+                self.close()
+                if isinstance(e, socket.timeout):
+                    timeouts.remaining()
+                raise
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+        if self.length == 0 and self.fp is not None:
+            # read1 does not close the connection at the end of the body
+            self._close_conn()
+        return b''.join(chunks)
+
+    def readinto(self, b):
+        timeouts = self.timeouts
+        if timeouts is None or timeouts.expires is None:
+            return super().readinto(b)
+        data = self.read(len(b))
+        b[:len(data)] = data
+        return len(data)
+
+
+class PooledConnectionMixin:
+    '''Mixin for ``urllib.request.AbstractHTTPHandler`` subclasses that
+    reuses persistent connections from a ``ConnectionPool`` instead of
+    opening a new connection per request
+    '''
+
+    _pool = None
+    # ``requisitor.hooks.Hooks`` to emit the request, connection, response
+    # and body events to, ``None`` when there are none
+    _hooks = None
+
+    def _pool_key(self, req):
+        return (req.type, req.host, req._tunnel_host)
+
+    def _request_headers(self, req):
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items()
+                        if k not in headers})
+        headers = {name.title(): val for name, val in headers.items()}
+
+        tunnel_headers = {}
+        if req._tunnel_host:
+            # Proxy-Authorization should not be sent to origin server
+            proxy_auth_hdr = 'Proxy-Authorization'
+            if proxy_auth_hdr in headers:
+                tunnel_headers[proxy_auth_hdr] = headers.pop(proxy_auth_hdr)
+        return headers, tunnel_headers
+
+    def _send(self, h, req, headers, reused):
+        timeouts = h.timeouts = getattr(req, 'timeouts', None)
+        if timeouts is not None:
+            h.timeout = timeouts.connect_timeout()
+            if reused:
+                h.sock.settimeout(timeouts.read_timeout())
+        else:
+            timeout = req.timeout
+            if timeout is socket._GLOBAL_DEFAULT_TIMEOUT:
+                timeout = socket.getdefaulttimeout()
+            h.timeout = timeout
+            if reused:
+                h.sock.settimeout(timeout)
+
+        body = req.data
+        chunked = req.has_header('Transfer-encoding')
+        try:
+            if isinstance(body, (bytes, bytearray, memoryview, type(None))):
+                h.request(req.get_method(), req.selector, body, headers,
+                          encode_chunked=chunked)
+            else:
+                # Send the headers only, and stream the body ourselves in
+                # larger writes than http.client would
+                h.request(req.get_method(), req.selector, None, headers)
+                send_body(h.sock, body, chunked)
+        except (DeadlineExceeded, *STALE_CONNECTION_ERRORS):
+            raise
+        except OSError as err:  # timeout error
+            if timeouts is not None and isinstance(err, socket.timeout):
+                timeouts.remaining()
+            raise urllib.error.URLError(err)
+        return h.getresponse()
+
+    def _emit(self, event, *args):
+        if self._hooks is not None:
+            self._hooks.emit(event, *args)
+
+    def do_open(self, http_class, req, **http_conn_args):
+        rewind_body(req)
+        self._emit('request', req)
+
+        if self._pool is None:
+            if self._hooks is not None or getattr(req, 'timeouts', None):
+                http_class = functools.partial(self._unpooled_conn,
+                                               http_class, req)
+            r = super().do_open(http_class, req, **http_conn_args)
+            self._opened(req, r)
+            return r
+
+        host = req.host
+        if not host:
+            raise urllib.error.URLError('no host given')
+
+        factory = functools.partial(self._new_conn, http_class, host, req,
+                                    **http_conn_args)
+        r, release = self._send_retrying(req, factory)
+
+        r._release = release
+        if r.will_close:
+            r._release_conn(False)
+        elif r.length == 0 and not r.chunked:
+            # Nothing to read, the connection can be reused right away
+            r._close_conn()
+        self._opened(req, r)
+
+        r.url = req.get_full_url()
+        r.msg = r.reason
+        return r
+
+    def _send_retrying(self, req, factory):
+        # Sends ``req`` on a pooled connection, retrying once on a new
+        # connection if a reused one turns out to have been closed by the
+        # server, when the request can safely be sent again. Returns the
+        # response, and the function releasing its connection
+        headers, tunnel_headers = self._request_headers(req)
+        factory = functools.partial(factory, tunnel_headers)
+        key = self._pool_key(req)
+        retry = (
+            req.get_method() in IDEMPOTENT_METHODS and
+            isinstance(req.data, (bytes, type(None)))
+        )
+        while True:
+            h, reused, release = self._acquire(key, factory)
+            self._emit('connection', req, h, reused)
+            try:
+                return self._send(h, req, headers, reused), release
+            except STALE_CONNECTION_ERRORS:
+                release(reusable=False)
+                if not (reused and retry):
+                    raise
+                retry = False
+            except BaseException:
+                release(reusable=False)
+                raise
+
+    def _acquire(self, key, factory):
+        # Returns ``(connection, reused, release)``, where ``release`` takes
+        # a ``reusable`` keyword argument
+        try:
+            h, reused = self._pool.acquire(key, factory)
+        except PoolError:
+            if self._pool.block:
+                raise
+            # The pool is full, use a connection of our own, that is closed
+            # rather than returned to the pool once the response is done
+            h = factory()
+            return h, False, functools.partial(_close_unpooled, h)
+        return h, reused, functools.partial(self._pool.release, key, h)
+
+    def _opened(self, req, r):
+        timings = getattr(r, 'timings', None)
+        if timings is not None:
+            timings.url = req.full_url
+            timings.status = r.status
+            get_request_timings(req).append(timings)
+
+        hooks = self._hooks
+        if hooks is not None:
+            hooks.emit('response', req, r)
+            if isinstance(r, PooledHTTPResponse):
+                if r.isclosed():
+                    hooks.emit('body', req, r)
+                else:
+                    r._on_end = functools.partial(hooks.emit, 'body', req)
+
+    def _unpooled_conn(self, http_class, req, host, **kwargs):
+        h = http_class(host, **kwargs)
+        timeouts = getattr(req, 'timeouts', None)
+        if timeouts is not None:
+            h.timeouts = timeouts
+            h.timeout = timeouts.connect_timeout()
+        self._emit('connection', req, h, False)
+        return h
+
+    def _new_conn(self, http_class, host, req, tunnel_headers,
+                  **http_conn_args):
+        h = http_class(host, timeout=req.timeout, **http_conn_args)
+        h.set_debuglevel(self._debuglevel)
+        h.response_class = PooledHTTPResponse
+        if req._tunnel_host:
+            h.set_tunnel(req._tunnel_host, headers=tunnel_headers)
+        return h
+
+
+class TimingConnectionMixin:
+    '''Mixin for ``http.client.HTTPConnection`` classes that records the
+    ``Timings`` of each request made on the connection, and sets them as
+    the ``timings`` attribute of the response
+    '''
+
+    response_class = PooledHTTPResponse
+    timings = None
+    # ``requisitor.timeouts.Timeout`` of the current request, if it has
+    # separate connect and read timeouts, or a deadline
+    timeouts = None
+
+    def _resolve(self, host, port):
+        timeouts = self.timeouts
+        if timeouts is not None:
+            # Name resolution cannot be interrupted, only checked
+            timeouts.remaining()
+        infos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        self._connected('dns')
+        return infos
+
+    @staticmethod
+    def _open_socket(info, timeout, source_address):
+        af, socktype, proto, _, sa = info
+        sock = socket.socket(af, socktype, proto)
+        try:
+            if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                sock.settimeout(timeout)
+            if source_address:
+                sock.bind(source_address)
+            sock.connect(sa)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    def _timed_create_connection(self, address,
+                                 timeout=socket._GLOBAL_DEFAULT_TIMEOUT,
+                                 source_address=None):
+        # ``socket.create_connection``, timing name resolution separately
+        # from connecting
+        err = None
+        for info in self._resolve(*address):
+            if self.timeouts is not None:
+                timeout = self.timeouts.connect_timeout()
+            try:
+                sock = self._open_socket(info, timeout, source_address)
+            except OSError as e:
+                err = e
+                continue
+            self._connected('connect')
+            return sock
+
+        if err is not None:
+            raise err
+        raise OSError('getaddrinfo returns an empty list')
+
+    def _connected(self, phase):
+        timings = self.timings
+        if timings is not None:
+            setattr(timings, phase, time.monotonic())
+
+    def _use_read_timeout(self):
+        # Switch from the connect to the read timeout once connected
+        if self.timeouts is not None:
+            self.sock.settimeout(self.timeouts.read_timeout())
+
+    def connect(self):
+        try:
+            super().connect()
+        except socket.timeout:
+            # Raise DeadlineExceeded if it was the deadline that timed out
+            if self.timeouts is not None:
+                self.timeouts.remaining()
+            raise
+        self._use_read_timeout()
+
+    def request(self, method, url, body=None, headers={}, *,
+                encode_chunked=False):
+        self.timings = Timings()
+        super().request(method, url, body, headers,
+                        encode_chunked=encode_chunked)
+
+    def getresponse(self):
+        timings = self.timings
+        if timings is not None:
+            timings.sent = time.monotonic()
+        timeouts = self.timeouts
+        if timeouts is not None and self.sock is not None:
+            self.sock.settimeout(timeouts.read_timeout())
+        try:
+            response = super().getresponse()
+        except socket.timeout:
+            if timeouts is not None:
+                timeouts.remaining()
+            raise
+        if timings is not None:
+            timings.headers = time.monotonic()
+            response.timings = timings
+        if timeouts is not None:
+            response.timeouts = timeouts
+            response._sock = self.sock
+        return response
+
+
+class TimedHTTPConnection(TimingConnectionMixin, http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = self._timed_create_connection
+
+
+class TimedHTTPSConnection(TimingConnectionMixin,
+                           http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = self._timed_create_connection
+
+    def connect(self):
+        super().connect()
+        self._connected('tls')
 
 
-class HTTPSClientAuthHandler(urllib.request.HTTPSHandler):
+class HTTPHandler(PooledConnectionMixin, urllib.request.HTTPHandler):
+    '''HTTPHandler that reuses connections from a ``ConnectionPool``'''
+
+    def __init__(self, pool=None, hooks=None, **kwargs):
+        urllib.request.HTTPHandler.__init__(self, **kwargs)
+        self._pool = pool
+        self._hooks = hooks
+
+    def http_open(self, req):
+        return self.do_open(TimedHTTPConnection, req)
+
+
+class HTTPSClientAuthHandler(PooledConnectionMixin,
+                             urllib.request.HTTPSHandler):
     '''Handles client authentication via cert/key
 
     This is a fairly lightweight extension on HTTPSHandler, and can be used
@@ -100,24 +794,43 @@ class HTTPSClientAuthHandler(urllib.request.HTTPSHandler):
     '''
 
     def __init__(self, client_cert=None, client_key=None, unix_socket=None,
-                 **kwargs):
+                 pool=None, context_factory=None, hooks=None, **kwargs):
         urllib.request.HTTPSHandler.__init__(self, **kwargs)
         self.client_cert = client_cert
         self.client_key = client_key
         self._unix_socket = unix_socket
+        self._pool = pool
+        self._context_factory = context_factory
+        self._hooks = hooks
+
+    def _get_context(self):
+        # Creating a context loads the CA certificates, a factory defers
+        # that until a HTTPS request is made
+        if self._context_factory is not None:
+            return self._context_factory()
+        return self._context
+
+    def _pool_key(self, req):
+        return (
+            req.type, req.host, req._tunnel_host, self._unix_socket,
+            self._get_context(), self.client_cert, self.client_key
+        )
 
     def https_open(self, req):
         return self.do_open(self._build_https_connection, req)
 
     def _build_https_connection(self, host, **kwargs):
-        kwargs.update({
-            'cert_file': self.client_cert,
-            'key_file': self.client_key,
-            'context': self._context,
-        })
+        kwargs['context'] = self._get_context()
+        if self.client_cert:
+            # Prefer loading the cert chain into the context once, these
+            # are only passed for callers constructing the handler directly
+            kwargs.update({
+                'cert_file': self.client_cert,
+                'key_file': self.client_key,
+            })
         if self._unix_socket:
             return UnixHTTPSConnection(self._unix_socket)(host, **kwargs)
-        return http.client.HTTPSConnection(host, **kwargs)
+        return TimedHTTPSConnection(host, **kwargs)
 
 
 @contextlib.contextmanager
@@ -133,7 +846,7 @@ def unix_socket_patch_httpconnection_connect():
     http.client.HTTPConnection.connect = _connect
 
 
-class UnixHTTPSConnection(http.client.HTTPSConnection):
+class UnixHTTPSConnection(TimingConnectionMixin, http.client.HTTPSConnection):
     def __init__(self, unix_socket):
         self._unix_socket = unix_socket
 
@@ -142,13 +855,14 @@ class UnixHTTPSConnection(http.client.HTTPSConnection):
         # http.client.HTTPConnection.connect to call UnixHTTPConnection.connect
         with unix_socket_patch_httpconnection_connect():
             super(UnixHTTPSConnection, self).connect()
+        self._connected('tls')
 
     def __call__(self, *args, **kwargs):
         http.client.HTTPSConnection.__init__(self, *args, **kwargs)
         return self
 
 
-class UnixHTTPConnection(http.client.HTTPConnection):
+class UnixHTTPConnection(TimingConnectionMixin, http.client.HTTPConnection):
     '''Handles http requests to a unix socket file'''
 
     def __init__(self, unix_socket):
@@ -162,20 +876,27 @@ class UnixHTTPConnection(http.client.HTTPConnection):
             raise OSError(
                 'Invalid Socket File (%s): %s' % (self._unix_socket, e)
             )
+        self._connected('connect')
         if self.timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
             self.sock.settimeout(self.timeout)
+        self._use_read_timeout()
 
     def __call__(self, *args, **kwargs):
         http.client.HTTPConnection.__init__(self, *args, **kwargs)
         return self
 
 
-class UnixHTTPHandler(urllib.request.HTTPHandler):
+class UnixHTTPHandler(PooledConnectionMixin, urllib.request.HTTPHandler):
     '''Handler for Unix urls'''
 
-    def __init__(self, unix_socket, **kwargs):
+    def __init__(self, unix_socket, pool=None, hooks=None, **kwargs):
         urllib.request.HTTPHandler.__init__(self, **kwargs)
         self._unix_socket = unix_socket
+        self._pool = pool
+        self._hooks = hooks
+
+    def _pool_key(self, req):
+        return (req.type, req.host, req._tunnel_host, self._unix_socket)
 
     def http_open(self, req):
         return self.do_open(UnixHTTPConnection(self._unix_socket), req)
@@ -2,70 +2,278 @@
 # Copyright 2020 Matt Martz
 
 import http.client
+from collections.abc import Mapping
+from collections.abc import MutableMapping
 
 from .sentinel import Sentinel
 
 
-class Headers(http.client.HTTPMessage):
+def _split_params(value):
+    # Splits on ``;``, ignoring those within quoted strings
+    parts = []
+    start = 0
+    quoted = False
+    escaped = False
+    for i, char in enumerate(value):
+        if escaped:
+            escaped = False
+        elif char == '\\' and quoted:
+            escaped = True
+        elif char == '"':
+            quoted = not quoted
+        elif char == ';' and not quoted:
+            parts.append(value[start:i])
+            start = i + 1
+    parts.append(value[start:])
+    return parts
+
+
+def _unquote(value):
+    if len(value) > 1 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\\\', '\\').replace('\\"', '"')
+    return value
+
+
+def parse_params(value, unquote=True):
+    '''Parses a header value such as ``text/html; charset="utf-8"`` into a
+    list of ``(name, value)`` tuples, the first being ``(value, '')``
+
+    Parameter names are lower cased, to match ``email.message.Message``
+    '''
+    parts = _split_params(value)
+    params = [(parts[0].strip(), '')]
+    for part in parts[1:]:
+        name, sep, val = part.partition('=')
+        name = name.strip().lower()
+        if not name:
+            continue
+        val = val.strip()
+        if unquote:
+            val = _unquote(val)
+        params.append((name, val))
+    return params
+
+
+class Headers(MutableMapping):
+    '''Case insensitive multi-dict of HTTP headers
+
+    Headers are stored in a ``dict`` keyed on the lower cased name, keeping
+    the original casing of the name first set, and every value. Looking up
+    a header returns its values joined with ``', '``, ``get_all`` returns
+    them individually.
+
+    Like ``email.message.Message``, looking up a missing header returns
+    ``None``, and setting a header adds a value, rather than replacing the
+    existing ones, which ``replace`` does.
+
+    Provides the subset of ``email.message.Message`` used with headers,
+    such as ``get_all``, ``add_header`` and ``get_param``.
+    '''
+
+    __slots__ = ('_dict',)
+
+    def __init__(self, *args, **kwargs):
+        self._dict = {}
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
     def __repr__(self):
         return repr(dict(self))
 
+    def __getitem__(self, name):
+        try:
+            values = self._dict[name.lower()][1]
+        except KeyError:
+            return None
+        if len(values) == 1:
+            return values[0]
+        return ', '.join(values)
+
+    def __setitem__(self, name, value):
+        self.append(name, value)
+
+    def __delitem__(self, name):
+        # Like ``email.message.Message``, deleting a missing header is not
+        # an error
+        self._dict.pop(name.lower(), None)
+
+    def __contains__(self, name):
+        return isinstance(name, str) and name.lower() in self._dict
+
+    def __iter__(self):
+        return (name for name, _ in self._dict.values())
+
+    def __len__(self):
+        return len(self._dict)
+
+    def get(self, name, default=None):
+        value = self[name]
+        if value is None:
+            return default
+        return value
+
+    def get_all(self, name, failobj=None):
+        '''Returns a list of every value of ``name``, or ``failobj``'''
+        try:
+            return list(self._dict[name.lower()][1])
+        except KeyError:
+            return failobj
+
+    def multi_items(self):
+        '''Returns a list of ``(name, value)`` tuples, with a tuple for
+        every value of headers with multiple values
+        '''
+        return [(name, value) for name, values in self._dict.values()
+                for value in values]
+
     def copy(self):
         headers = Headers()
-        headers.update(self)
+        headers._dict = self._dict.copy()
         return headers
 
-    def pop(self, key, default=Sentinel):
-        value = self.get(key, default)
-        if value is Sentinel:
-            raise KeyError(key)
-        del self[key]
+    # ``MutableMapping`` implements ``pop`` and ``setdefault`` by catching
+    # the ``KeyError`` that looking up a missing header does not raise
+    def pop(self, name, default=Sentinel):
+        if name not in self:
+            if default is Sentinel:
+                raise KeyError(name)
+            return default
+        value = self[name]
+        del self[name]
         return value
 
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self.replace(name, default)
+        return self[name]
+
     def update(self, *args, **kwds):
         if len(args) > 1:
             raise TypeError('update expected at most 1 arguments, got %d' %
                             len(args))
 
-        items = []
+        items = ()
         if args:
             other = args[0]
-            if isinstance(other, (dict, http.client.HTTPMessage)):
-                items[:] = other.items()
+            if isinstance(other, (Mapping, http.client.HTTPMessage)):
+                items = other.items()
             elif isinstance(other, list):
-                items[:] = other
+                items = other
             else:
                 raise TypeError
         for obj in (items, kwds.items()):
             for name, value in obj:
-                self.pop(name, None)
-                self[name] = value
+                self.replace(name, value)
+
+    def replace(self, name, value):
+        '''Sets ``name`` to ``value``, replacing any existing values'''
+        self._dict[name.lower()] = (name, (value,))
+
+    def append(self, name, value):
+        '''Adds ``value`` to any existing values of ``name``'''
+        key = name.lower()
+        try:
+            orig, values = self._dict[key]
+        except KeyError:
+            self._dict[key] = (name, (value,))
+        else:
+            self._dict[key] = (orig, values + (value,))
 
     def add_header(self, name, value, **params):
-        orig = self.pop(name, None)
-        super(Headers, self).add_header(name, value, **params)
-        if orig:
-            new = self.pop(name)
-            self[name] = '{}, {}'.format(orig, new)
+        '''Adds a header value, formatting ``params`` like
+        ``email.message.Message.add_header``, values of existing headers
+        are kept, and joined with ``', '`` when looked up
+        '''
+        parts = [value] if value is not None else []
+        for key, val in params.items():
+            key = key.replace('_', '-')
+            if val is None:
+                parts.append(key)
+            else:
+                val = str(val).replace('\\', '\\\\').replace('"', '\\"')
+                parts.append('%s="%s"' % (key, val))
+        self.append(name, '; '.join(parts))
+
+    def get_params(self, failobj=None, header='content-type', unquote=True):
+        value = self.get(header)
+        if value is None:
+            return failobj
+        return parse_params(value, unquote=unquote)
+
+    def get_param(self, param, failobj=None, header='content-type',
+                  unquote=True):
+        '''Returns the value of the ``param`` parameter of ``header``'''
+        param = param.lower()
+        params = self.get_params(header=header, unquote=unquote) or ()
+        for name, value in params[1:]:
+            if name == param:
+                return value
+        return failobj
+
+    def get_content_type(self):
+        value = self.get('content-type')
+        if value is None:
+            return 'text/plain'
+        ctype = parse_params(value)[0][0].lower()
+        if ctype.count('/') != 1:
+            return 'text/plain'
+        return ctype
+
+    def get_content_maintype(self):
+        return self.get_content_type().split('/')[0]
+
+    def get_content_subtype(self):
+        return self.get_content_type().split('/')[1]
+
+    def get_content_charset(self, failobj=None):
+        charset = self.get_param('charset')
+        if not charset:
+            return failobj
+        return charset.lower()
+
+    def get_boundary(self, failobj=None):
+        boundary = self.get_param('boundary')
+        if boundary is None:
+            return failobj
+        return boundary.rstrip()
+
+
+def parse_headers(lines):
+    '''Parses raw header lines, as ``bytes`` including line endings, into
+    ``Headers``, supporting obsolete line folding
+    '''
+    headers = Headers()
+    name = value = None
+    for line in lines:
+        line = line.decode('iso-8859-1').rstrip('\r\n')
+        if not line:
+            continue
+        if line[0] in ' \t' and name is not None:
+            value += ' ' + line.strip()
+            continue
+        if name is not None:
+            headers.append(name, value)
+        name, _, value = line.partition(':')
+        name = name.strip()
+        value = value.strip()
+    if name is not None:
+        headers.append(name, value)
+    return headers
 
 
 def normalize_headers(headers):
-    normalized = Headers()
+    if isinstance(headers, Headers):
+        return headers.copy()
 
-    if isinstance(headers, (dict, http.client.HTTPMessage)):
+    if isinstance(headers, (Mapping, http.client.HTTPMessage)):
         items = headers.items()
     elif isinstance(headers, list):
         items = headers
     else:
         raise TypeError
 
-    # Don't be lossy, append header values for duplicate headers
+    # Don't be lossy, keep every value of duplicate headers
+    normalized = Headers()
     for name, value in items:
-        if name in normalized:
-            old = normalized[name]
-            del normalized[name]
-            normalized[name] = ', '.join((old, value))
-        else:
-            normalized[name] = value
-
+        normalized.append(name, value)
     return normalized
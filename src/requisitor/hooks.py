@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+# Events of the request lifecycle, and the arguments their hooks are
+# called with:
+#
+# request: (req) a request is about to be sent, for every redirect hop
+#   and authentication retry
+# connection: (req, conn, reused) a connection was acquired for ``req``,
+#   ``reused`` is ``True`` if it came from the pool, a new connection
+#   connects when the request is sent
+# redirect: (req, new_req, code) a redirect is being followed
+# response: (req, response) the status line and headers were read
+# body: (req, response) the body was read to the end, or closed
+# error: (req, exc) the request failed, with an ``HTTPError`` for an
+#   error status, or any other exception, such as ``URLError``
+EVENTS = ('request', 'connection', 'redirect', 'response', 'body', 'error')
+
+
+class Hooks:
+    '''Callbacks for the events of the request lifecycle, see ``EVENTS``
+
+    An empty ``Hooks`` is falsy, and a ``Session`` only installs hooks in
+    its handlers once one is added, so unused hooks cost nothing.
+    Callbacks run on the thread making the request, exceptions they raise
+    propagate to the caller.
+    '''
+
+    __slots__ = ('_hooks',)
+
+    def __init__(self):
+        self._hooks = {}
+
+    def __bool__(self):
+        return bool(self._hooks)
+
+    def __repr__(self):
+        return '<Hooks %r>' % self._hooks
+
+    def add(self, event, func):
+        '''Calls ``func`` on ``event``'''
+        if event not in EVENTS:
+            raise ValueError(
+                'event must be one of %s, not %r' % (', '.join(EVENTS), event)
+            )
+        # Replace rather than mutate, so that emitting from other threads
+        # never sees a list being changed
+        self._hooks[event] = self._hooks.get(event, ()) + (func,)
+
+    def remove(self, event, func):
+        '''Stops calling ``func`` on ``event``'''
+        funcs = list(self._hooks.get(event, ()))
+        funcs.remove(func)
+        if funcs:
+            self._hooks[event] = tuple(funcs)
+        else:
+            del self._hooks[event]
+
+    def emit(self, event, *args):
+        for func in self._hooks.get(event, ()):
+            func(*args)
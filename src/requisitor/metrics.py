@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import bisect
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets, the same as
+# the Prometheus client defaults
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5,
+                   5.0, 7.5, 10.0)
+
+
+class Histogram:
+    '''Counts of observed values in cumulative ``buckets``, with their sum'''
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One more for values above the largest bucket, +Inf
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        '''Returns a list of ``(upper bound, count)`` tuples, ending with
+        ``float('inf')``
+        '''
+        out = []
+        total = 0
+        for le, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            out.append((le, total))
+        return out
+
+    def as_dict(self):
+        return {
+            'buckets': self.cumulative(),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class HostMetrics:
+    '''Counters and latency histograms of the requests to a single host'''
+
+    __slots__ = ('requests', 'responses', 'errors', 'redirects',
+                 'connections', 'duration', 'ttfb')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.requests = 0
+        # Keyed by status code
+        self.responses = {}
+        # Keyed by exception class name
+        self.errors = {}
+        self.redirects = 0
+        self.connections = {'new': 0, 'reused': 0}
+        # Seconds from the start of the request until the body was read
+        self.duration = Histogram(buckets)
+        # Seconds from the start of the request until the headers were read
+        self.ttfb = Histogram(buckets)
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'responses': dict(self.responses),
+            'errors': dict(self.errors),
+            'redirects': self.redirects,
+            'connections': dict(self.connections),
+            'duration': self.duration.as_dict(),
+            'ttfb': self.ttfb.as_dict(),
+        }
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join(
+        '%s="%s"' % (k, _escape(v)) for k, v in labels.items()
+    )
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    '''Per host counters and latency histograms of the requests sent by
+    the sessions it is registered with, using ``Session.hooks``
+
+    Hosts are the host and port of the request URL, as ``Request.host``.
+    Every redirect hop and authentication retry counts as a request.
+
+    .. code-block:: python
+
+        metrics = Metrics()
+        with Session() as s:
+            metrics.register(s)
+            s.get('https://example.org')
+        print(metrics.prometheus())
+    '''
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._hooks = (
+            ('request', self._on_request),
+            ('connection', self._on_connection),
+            ('redirect', self._on_redirect),
+            ('response', self._on_response),
+            ('body', self._on_body),
+            ('error', self._on_error),
+        )
+
+    def register(self, session):
+        '''Starts recording the requests sent by ``session``'''
+        for event, func in self._hooks:
+            session.hooks.add(event, func)
+
+    def unregister(self, session):
+        '''Stops recording the requests sent by ``session``'''
+        for event, func in self._hooks:
+            session.hooks.remove(event, func)
+
+    def clear(self):
+        with self._lock:
+            self._hosts.clear()
+
+    def _host(self, req):
+        # Called with the lock held
+        try:
+            return self._hosts[req.host]
+        except KeyError:
+            host = self._hosts[req.host] = HostMetrics(self.buckets)
+            return host
+
+    def _on_request(self, req):
+        with self._lock:
+            self._host(req).requests += 1
+
+    def _on_connection(self, req, conn, reused):
+        with self._lock:
+            self._host(req).connections['reused' if reused else 'new'] += 1
+
+    def _on_redirect(self, req, new, code):
+        with self._lock:
+            self._host(req).redirects += 1
+
+    def _on_response(self, req, response):
+        timings = getattr(response, 'timings', None)
+        with self._lock:
+            host = self._host(req)
+            host.responses[response.status] = (
+                host.responses.get(response.status, 0) + 1
+            )
+            if timings is not None and timings.headers is not None:
+                host.ttfb.observe(timings.headers - timings.start)
+
+    def _on_body(self, req, response):
+        timings = getattr(response, 'timings', None)
+        if timings is None or timings.end is None:
+            return
+        with self._lock:
+            self._host(req).duration.observe(timings.end - timings.start)
+
+    def _on_error(self, req, exc):
+        name = type(exc).__name__
+        with self._lock:
+            host = self._host(req)
+            host.errors[name] = host.errors.get(name, 0) + 1
+
+    def as_dict(self):
+        '''Returns a ``dict`` of the metrics of each host, keyed by host'''
+        with self._lock:
+            return {name: host.as_dict() for name, host in self._hosts.items()}
+
+    def prometheus(self, prefix='requisitor'):
+        '''Returns the metrics in the Prometheus text exposition format'''
+        with self._lock:
+            hosts = sorted(self._hosts.items())
+            lines = []
+
+            def counter(name, help, samples):
+                lines.append('# HELP %s_%s %s' % (prefix, name, help))
+                lines.append('# TYPE %s_%s counter' % (prefix, name))
+                for labels, value in samples:
+                    lines.append('%s_%s%s %s' % (prefix, name,
+                                                 _labels(**labels), value))
+
+            def histogram(name, help, attr):
+                lines.append('# HELP %s_%s %s' % (prefix, name, help))
+                lines.append('# TYPE %s_%s histogram' % (prefix, name))
+                for host, metrics in hosts:
+                    hist = getattr(metrics, attr)
+                    for le, count in hist.cumulative():
+                        lines.append('%s_%s_bucket%s %s' % (
+                            prefix, name,
+                            _labels(host=host, le=_number(le)), count
+                        ))
+                    labels = _labels(host=host)
+                    lines.append('%s_%s_sum%s %s' % (prefix, name, labels,
+                                                     _number(hist.sum)))
+                    lines.append('%s_%s_count%s %s' % (prefix, name, labels,
+                                                       hist.count))
+
+            counter('requests_total', 'Requests sent', (
+                ({'host': host}, m.requests) for host, m in hosts
+            ))
+            counter('responses_total', 'Responses received, by status', (
+                ({'host': host, 'status': status}, count)
+                for host, m in hosts
+                for status, count in sorted(m.responses.items())
+            ))
+            counter('errors_total', 'Failed requests, by exception', (
+                ({'host': host, 'error': error}, count)
+                for host, m in hosts
+                for error, count in sorted(m.errors.items())
+            ))
+            counter('redirects_total', 'Redirects followed', (
+                ({'host': host}, m.redirects) for host, m in hosts
+            ))
+            counter('connections_total',
+                    'Connections acquired, new or reused from the pool', (
+                        ({'host': host, 'state': state}, count)
+                        for host, m in hosts
+                        for state, count in sorted(m.connections.items())
+                    ))
+            histogram('request_duration_seconds',
+                      'Seconds from sending a request until its body was '
+                      'read', 'duration')
+            histogram('ttfb_seconds',
+                      'Seconds from sending a request until its response '
+                      'headers were read', 'ttfb')
+
+        return '\n'.join(lines) + '\n'
@@ -2,19 +2,17 @@
 # Copyright 2020 Matt Martz
 
 import mimetypes
+import os
 from collections import namedtuple
 from collections.abc import Mapping
-from email.mime.application import MIMEApplication
-from email.mime.multipart import MIMEMultipart
-from email.mime.nonmultipart import MIMENonMultipart
-from email.parser import BytesHeaderParser
-from email.policy import HTTP
 
 from .utils import ensure_bytes
+from .utils import get_file_size
 from .utils import get_filename
-from .utils import is_binary_data
-from .utils import read_bytes
+from .utils import is_binary_fileobj
+from .utils import iter_body
 
+CHUNK_SIZE = 64 * 1024
 
 Field = namedtuple('Field', ('file', 'content', 'main_type', 'sub_type'))
 
@@ -55,6 +53,123 @@ def _parse_field(field):
         )
 
 
+def _quote(value):
+    return value.replace(
+        '"', '%22'
+    ).replace(
+        '\r', '%0D'
+    ).replace(
+        '\n', '%0A'
+    )
+
+
+class _Part:
+    __slots__ = ('headers', 'content', 'file', 'position', 'size')
+
+    def __init__(self, name, field):
+        disposition = 'form-data; name="%s"' % _quote(name)
+        if field.file:
+            disposition += '; filename="%s"' % _quote(
+                get_filename(field.file)
+            )
+        self.headers = (
+            'Content-Type: %s/%s\r\n'
+            'Content-Disposition: %s\r\n'
+            '\r\n' % (field.main_type, field.sub_type, disposition)
+        ).encode('utf-8')
+
+        self.content = None
+        self.file = None
+        self.position = None
+        if field.content or not field.file:
+            self.content = ensure_bytes(field.content)
+            self.size = len(self.content)
+        elif is_binary_fileobj(field.file):
+            self.file = field.file
+            self.size = get_file_size(self.file)
+            if self.size is not None:
+                self.position = self.file.tell()
+        else:
+            self.file = os.fspath(field.file)
+            self.size = os.stat(self.file).st_size
+
+    def iter_content(self, chunk_size):
+        if self.content is not None:
+            yield self.content
+            return
+
+        if isinstance(self.file, str):
+            with open(self.file, 'rb') as f:
+                yield from iter(lambda: f.read(chunk_size), b'')
+            return
+
+        if self.position is not None:
+            self.file.seek(self.position)
+        yield from iter(lambda: self.file.read(chunk_size), b'')
+
+
+class MultipartEncoder:
+    """Lazily encodes a mapping of fields as a ``multipart/form-data``
+    body
+
+    :arg fields: Mapping, in the format accepted by
+        :func:`prepare_multipart`
+    :kwarg boundary: (optional) boundary to use, a random one is
+        generated by default
+    :kwarg chunk_size: Size of the chunks read from files, and yielded
+        when iterating
+
+    The encoder is an iterable of ``bytes``, file content is read from
+    paths and file objects only while iterating, and is sent as is,
+    without any ``Content-Transfer-Encoding``. Iterating again
+    re-opens paths, and rewinds seekable file objects, so the body can
+    be resent on redirects.
+
+    ``length`` is the size of the encoded body in bytes, or ``None``
+    if the size of a file object could not be determined, in which
+    case the body should be sent with chunked transfer encoding.
+    """
+
+    def __init__(self, fields, boundary=None, chunk_size=CHUNK_SIZE):
+        if not isinstance(fields, Mapping):
+            raise TypeError(
+                'Mapping is required, cannot be type %s' % (
+                    fields.__class__.__name__
+                )
+            )
+
+        self.boundary = boundary or os.urandom(16).hex()
+        self.chunk_size = chunk_size
+        self.content_type = 'multipart/form-data; boundary="%s"' % (
+            self.boundary
+        )
+
+        self._parts = [
+            _Part(field_name, _parse_field(fields[field_name]))
+            for field_name in sorted(fields)
+        ]
+
+        delimiter = len(self.boundary) + 4
+        self.length = delimiter + 2
+        for part in self._parts:
+            if part.size is None:
+                self.length = None
+                break
+            self.length += delimiter + len(part.headers) + part.size + 2
+
+    def _chunks(self):
+        boundary = self.boundary.encode('ascii')
+        for part in self._parts:
+            yield b'--%s\r\n' % boundary
+            yield part.headers
+            yield from part.iter_content(self.chunk_size)
+            yield b'\r\n'
+        yield b'--%s--\r\n' % boundary
+
+    def __iter__(self):
+        return iter_body(self._chunks(), self.chunk_size)
+
+
 def prepare_multipart(fields):
     """Takes a mapping, and prepares a multipart/form-data body
 
@@ -63,9 +178,8 @@ def prepare_multipart(fields):
         the ``multipart/form-data`` ``Content-Type`` header including
         ``boundary`` and ``body`` is the prepared bytestring body
 
-    Payload content from a file will be base64 encoded and will include
-    the appropriate ``Content-Transfer-Encoding`` and ``Content-Type``
-    headers.
+    Payload content from files is included as is, use
+    :class:`MultipartEncoder` to avoid building the body in memory.
 
     Example:
         {
@@ -81,58 +195,5 @@ def prepare_multipart(fields):
             "text_form_field": "value"
         }
     """
-
-    if not isinstance(fields, Mapping):
-        raise TypeError(
-            'Mapping is required, cannot be type %s' % (
-                fields.__class__.__name__
-            )
-        )
-
-    m = MIMEMultipart('form-data')
-    for field_name in sorted(fields):
-        field = _parse_field(fields[field_name])
-
-        if not field.content and field.file:
-            content = read_bytes(field.file)
-        else:
-            content = ensure_bytes(field.content)
-
-        if is_binary_data(content[:1024]):
-            part = MIMEApplication(content)
-            del part['Content-Type']
-            part.add_header(
-                'Content-Type',
-                '%s/%s' % (field.main_type, field.sub_type)
-            )
-        else:
-            part = MIMENonMultipart(field.main_type, field.sub_type)
-            part.set_payload(content)
-
-        part.add_header('Content-Disposition', 'form-data')
-        del part['MIME-Version']
-        part.set_param(
-            'name',
-            field_name,
-            header='Content-Disposition'
-        )
-        if field.file:
-            part.set_param(
-                'filename',
-                get_filename(field.file),
-                header='Content-Disposition'
-            )
-
-        m.attach(part)
-
-    data = m.as_bytes(policy=HTTP)
-    del m
-
-    headers, _, content = data.partition(b'\r\n\r\n')
-    del data
-
-    parser = BytesHeaderParser().parsebytes
-    return (
-        parser(headers)['content-type'],
-        content
-    )
+    encoder = MultipartEncoder(fields)
+    return encoder.content_type, b''.join(encoder)
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import collections
+import select
+import threading
+import time
+
+from .errors import PoolError
+
+
+def is_connection_dropped(conn):
+    '''Returns ``True`` if an idle connection can no longer be used
+
+    An idle HTTP/1.1 connection should never be readable, if it is, the
+    peer has either closed the connection, or sent data we did not ask for
+    '''
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+class ConnectionPool:
+    '''Thread safe pool of persistent ``http.client`` connections
+
+    Connections are grouped by a hashable ``key``, typically made up
+    of the scheme, host, port, unix socket and TLS settings of a request.
+
+    :kwarg max_per_host: Maximum number of connections, idle or in use,
+        per key
+    :kwarg max_total: Maximum number of connections, idle or in use,
+        across all keys
+    :kwarg block: When the pool is full, wait for a connection to be
+        released instead of raising ``PoolError``. Sessions use a
+        connection outside of a full, non blocking, pool instead
+    :kwarg timeout: Maximum number of seconds to wait when ``block``
+        is ``True``, ``None`` waits forever
+    '''
+
+    def __init__(self, max_per_host=10, max_total=100, block=False,
+                 timeout=None):
+        self.max_per_host = max_per_host
+        self.max_total = max_total
+        self.block = block
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._idle = collections.OrderedDict()
+        self._counts = collections.Counter()
+
+    def size(self, key=None):
+        '''Returns the number of connections, idle or in use, for ``key``,
+        or across all keys if ``key`` is ``None``
+        '''
+        with self._cond:
+            if key is None:
+                return sum(self._counts.values())
+            return self._counts[key]
+
+    def idle(self, key):
+        '''Returns the number of idle connections for ``key``'''
+        with self._cond:
+            return len(self._idle.get(key, ()))
+
+    def _pop_idle(self, key):
+        idle = self._idle.get(key)
+        while idle:
+            conn = idle.pop()
+            if not idle:
+                del self._idle[key]
+            if not self._is_dropped(conn):
+                return conn
+            self._remove(key, conn)
+            idle = self._idle.get(key)
+        return None
+
+    def _evict_idle(self):
+        # Only called once ``_pop_idle`` found no idle connection for the
+        # key, so any idle connection is for another key
+        if not self._idle:
+            return False
+        key, idle = next(iter(self._idle.items()))
+        conn = idle.popleft()
+        if not idle:
+            del self._idle[key]
+        self._remove(key, conn)
+        return True
+
+    def _has_room(self, key):
+        if self._counts[key] >= self.max_per_host:
+            return False
+        if sum(self._counts.values()) < self.max_total:
+            return True
+        return self._evict_idle()
+
+    def _is_dropped(self, conn):
+        return is_connection_dropped(conn)
+
+    def _forget(self, key):
+        self._counts[key] -= 1
+        if self._counts[key] <= 0:
+            del self._counts[key]
+        self._cond.notify()
+
+    def _remove(self, key, conn):
+        conn.close()
+        self._forget(key)
+
+    def _wait(self, key, deadline):
+        if not self.block:
+            raise PoolError('Connection pool is full for %r' % (key,))
+
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise PoolError(
+                    'Timed out waiting for a connection for %r' % (key,)
+                )
+        self._cond.wait(remaining)
+
+    def acquire(self, key, factory):
+        '''Returns a tuple of ``(connection, reused)``
+
+        An idle connection for ``key`` is returned if one is available,
+        otherwise ``factory`` is called to create a new one
+        '''
+        deadline = None
+        if self.timeout is not None:
+            deadline = time.monotonic() + self.timeout
+
+        with self._cond:
+            while True:
+                conn = self._pop_idle(key)
+                if conn is not None:
+                    return conn, True
+
+                if self._has_room(key):
+                    self._counts[key] += 1
+                    break
+
+                self._wait(key, deadline)
+
+        try:
+            return factory(), False
+        except BaseException:
+            with self._cond:
+                self._forget(key)
+            raise
+
+    def release(self, key, conn, reusable=True):
+        '''Returns ``conn`` to the pool, or closes it if it cannot be reused
+        '''
+        with self._cond:
+            if reusable and getattr(conn, 'sock', None) is not None:
+                self._idle.setdefault(key, collections.deque()).append(conn)
+                self._idle.move_to_end(key)
+                self._cond.notify()
+            else:
+                self._remove(key, conn)
+
+    def clear(self):
+        '''Closes all idle connections'''
+        with self._cond:
+            for key, idle in list(self._idle.items()):
+                while idle:
+                    self._remove(key, idle.pop())
+            self._idle.clear()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import collections
+import threading
+import time
+import urllib.request
+
+from .handlers import REDIRECT_CONTENT_HEADERS
+from .handlers import redirect_method
+from .utils import parse_cache_control
+
+
+class RedirectCache:
+    '''Thread safe, bounded, mapping of URLs to the target and status code
+    of their permanent redirect
+
+    Entries are evicted least recently used first, and expire after the
+    ``max-age`` of the redirect's ``Cache-Control``, or ``ttl``, whichever
+    is shorter.
+
+    :kwarg max_entries: Maximum number of redirects to remember
+    :kwarg ttl: Maximum number of seconds to remember a redirect for,
+        ``None`` remembers it until the server says otherwise
+    '''
+
+    def __init__(self, max_entries=1000, ttl=86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        '''Returns a ``(url, code)`` tuple of the redirect of ``key``, or
+        ``None``
+        '''
+        with self._lock:
+            try:
+                url, code, expires = self._entries[key]
+            except KeyError:
+                return None
+            if expires is not None and expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return url, code
+
+    def set(self, key, url, code, max_age=None):
+        '''Remembers that ``key`` permanently redirects to ``url`` with
+        ``code``, for ``max_age`` seconds, if given
+        '''
+        ttl = self.ttl
+        if max_age is not None:
+            ttl = max_age if ttl is None else min(ttl, max_age)
+        if ttl is not None and ttl <= 0:
+            self.delete(key)
+            return
+
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (url, code, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class PermanentRedirectHandler(urllib.request.BaseHandler):
+    '''Sends requests for URLs that permanently redirected, with a ``301``
+    or ``308``, straight to the final target remembered in ``cache``,
+    applying the same method and payload rules as following the redirects
+
+    Redirects are recorded by ``requisitor.handlers.RedirectHandler``.
+
+    :arg cache: ``RedirectCache`` to remember redirects in
+    :kwarg namespace: (optional) prefix for keys, such as the unix socket
+        requests are sent over
+    '''
+
+    # Rewrite the URL before any other processor, such as
+    # HTTPCookieProcessor, looks at it
+    handler_order = 100
+
+    max_redirections = urllib.request.HTTPRedirectHandler.max_redirections
+
+    def __init__(self, cache, namespace=None):
+        self.cache = cache
+        self.namespace = namespace
+
+    def _key(self, url):
+        return (self.namespace, url.partition('#')[0])
+
+    def record(self, req, code, headers, newurl):
+        cc = parse_cache_control(headers.get('cache-control'))
+        if 'no-store' in cc or 'no-cache' in cc:
+            max_age = 0
+        else:
+            try:
+                max_age = max(int(cc['max-age']), 0)
+            except (KeyError, TypeError, ValueError):
+                max_age = None
+        self.cache.set(self._key(req.full_url), newurl, code, max_age)
+
+    def http_request(self, req):
+        url = req.full_url
+        method = req.get_method()
+        keep_payload = True
+        seen = {url}
+        for _ in range(self.max_redirections):
+            redirect = self.cache.get(self._key(url))
+            if redirect is None or redirect[0] in seen:
+                break
+            url, code = redirect
+            seen.add(url)
+            method = redirect_method(code, method)
+            keep_payload = keep_payload and code == 308
+
+        if url == req.full_url:
+            return req
+
+        req.full_url = url
+        if method != req.get_method():
+            req.method = method
+        if not keep_payload:
+            req.data = None
+            for name in REDIRECT_CONTENT_HEADERS:
+                req.remove_header(name.capitalize())
+        return req
+
+    https_request = http_request
@@ -1,41 +1,288 @@
 # -*- coding: utf-8 -*-
 # Copyright 2020 Matt Martz
 
+import codecs
+import datetime
 import io
-import json
 from functools import partial
 
 from .headers import normalize_headers
 
 try:
-    import gzip
+    import zlib
 except ImportError:
-    gzip = None
+    zlib = None
 
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
 
-class GzipDecodedResponse(gzip.GzipFile if gzip else object):
-    """A file-like object to decode a response encoded with the gzip
-        method, as described in RFC 1952.
+CHUNK_SIZE = 64 * 1024
 
-        Largely copied from ``xmlrpclib``/``xmlrpc.client``
-        """
-    def __init__(self, response):
-        if not gzip:
+SUPPORTED_ENCODINGS = frozenset(
+    ('gzip', 'x-gzip', 'deflate') + (('zstd',) if zstd else ())
+)
+
+# Value of the Accept-Encoding header sent when compression is enabled
+ACCEPT_ENCODING = 'gzip, deflate' + (', zstd' if zstd else '')
+
+# Charsets ``json.loads`` detects itself when given bytes, RFC 8259 Section
+# 8.1 and RFC 7159 Section 8.1
+JSON_BYTES_ENCODINGS = frozenset(
+    ('utf-8', 'utf-8-sig', 'utf-16', 'utf-16-le', 'utf-16-be', 'utf-32',
+     'utf-32-le', 'utf-32-be')
+)
+
+# Content types of newline delimited JSON, a body of which is never treated
+# as a single top level array by ``Response.iter_json``
+NDJSON_CONTENT_TYPES = frozenset((
+    'application/x-ndjson', 'application/ndjson', 'application/jsonl',
+    'application/x-jsonlines', 'application/jsonlines',
+))
+
+
+def parse_content_encoding(value):
+    """Returns the list of codings from a ``Content-Encoding`` header, in
+    the order they were applied, omitting ``identity``
+    """
+    encodings = []
+    for encoding in (value or '').split(','):
+        encoding = encoding.strip().lower()
+        if encoding and encoding != 'identity':
+            encodings.append(encoding)
+    return encodings
+
+
+class _Decompressor:
+    def __init__(self, encoding):
+        self._zstd = encoding == 'zstd'
+        self._gzip = encoding in ('gzip', 'x-gzip')
+        self._first = not (self._zstd or self._gzip)
+        self._obj = self._new()
+
+    def _new(self, wbits=None):
+        if self._zstd:
+            return zstd.ZstdDecompressor()
+        if wbits is None:
+            wbits = 16 + zlib.MAX_WBITS if self._gzip else zlib.MAX_WBITS
+        return zlib.decompressobj(wbits)
+
+    def _decompress(self, data):
+        if not self._first:
+            return self._obj.decompress(data)
+
+        # Servers disagree on whether deflate means a zlib stream, as the
+        # RFC says, or a raw deflate stream, try both
+        self._first = False
+        try:
+            return self._obj.decompress(data)
+        except zlib.error:
+            self._obj = self._new(-zlib.MAX_WBITS)
+            return self._obj.decompress(data)
+
+    def decompress(self, data):
+        out = [self._decompress(data)]
+        # Concatenated gzip members, or zstd frames, are decoded as a single
+        # stream
+        multi = self._gzip or self._zstd
+        while multi and self._obj.eof and self._obj.unused_data:
+            data = self._obj.unused_data
+            self._obj = self._new()
+            out.append(self._obj.decompress(data))
+        return b''.join(out)
+
+    def flush(self):
+        if self._zstd:
+            return b''
+        return self._obj.flush()
+
+
+class ContentDecoder:
+    """Incrementally decodes data encoded with one or more content codings
+
+    :arg encodings: list of codings, in the order they were applied, as
+        returned by ``parse_content_encoding``
+    """
+
+    def __init__(self, encodings):
+        if not zlib:
             raise NotImplementedError
 
-        # response doesn't support tell() and read(), required by
-        # GzipFile
-        self.io = io.BytesIO()
-        for block in iter(partial(response.read, 1024), b''):
-            self.io.write(block)
-        self.io.seek(0)
-        gzip.GzipFile.__init__(self, mode='rb', fileobj=self.io)
+        unsupported = set(encodings) - SUPPORTED_ENCODINGS
+        if unsupported:
+            raise ValueError(
+                'Unsupported content encoding: %s' % ', '.join(
+                    sorted(unsupported)
+                )
+            )
+        self._decompressors = [_Decompressor(e) for e in reversed(encodings)]
+
+    def decompress(self, data):
+        for decompressor in self._decompressors:
+            data = decompressor.decompress(data)
+        return data
+
+    def flush(self):
+        data = b''
+        for decompressor in self._decompressors:
+            data = decompressor.decompress(data) + decompressor.flush()
+        return data
+
+
+class DecodedResponse(io.RawIOBase):
+    """A file-like object that decodes a response body encoded with one or
+    more content codings, as the body is read
+    """
+
+    def __init__(self, response, encodings, chunk_size=CHUNK_SIZE):
+        self._decoder = ContentDecoder(encodings)
+        self._fp = response
+        self._buffer = bytearray()
+        self._eof = False
+        self.chunk_size = chunk_size
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        data = self._fp.read(self.chunk_size)
+        if data:
+            self._buffer += self._decoder.decompress(data)
+        else:
+            self._buffer += self._decoder.flush()
+            self._eof = True
+
+    def read(self, amt=None):
+        if amt is None or amt < 0:
+            while not self._eof:
+                self._fill()
+            amt = len(self._buffer)
+
+        while len(self._buffer) < amt and not self._eof:
+            self._fill()
+
+        data = bytes(self._buffer[:amt])
+        del self._buffer[:amt]
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, b):
+        data = self.read(len(b))
+        n = len(data)
+        b[:n] = data
+        return n
 
     def close(self):
         try:
-            gzip.GzipFile.close(self)
+            self._fp.close()
         finally:
-            self.io.close()
+            super().close()
+
+
+class GzipDecodedResponse(DecodedResponse):
+    """A file-like object to decode a response encoded with the gzip
+    method, as described in RFC 1952.
+    """
+
+    def __init__(self, response):
+        super().__init__(response, ['gzip'])
+
+
+def _skip_whitespace(s, pos):
+    end = len(s)
+    while pos < end and s[pos] in ' \t\n\r':
+        pos += 1
+    return pos
+
+
+class _JSONStream:
+    '''Decodes JSON values one at a time from an iterator of ``str``
+    chunks, for ``Response.iter_json``
+    '''
+
+    def __init__(self, text, decoder):
+        self._text = text
+        self._decoder = decoder
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _read(self, size):
+        # Drop consumed text, and read until ``size`` characters are
+        # buffered
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        while not self.eof and len(self.buf) < size:
+            try:
+                self.buf += next(self._text)
+            except StopIteration:
+                self.eof = True
+
+    def _error(self, msg, pos):
+        import json
+        return json.JSONDecodeError(msg, self.buf, pos)
+
+    def peek(self):
+        '''Returns the next non whitespace character, without consuming
+        it, or an empty string at the end of the body
+        '''
+        while True:
+            self.pos = _skip_whitespace(self.buf, self.pos)
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self._read(1)
+
+    def decode(self):
+        '''Decodes the next JSON value'''
+        import json
+        if not self.peek():
+            raise self._error('Expecting value', self.pos)
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # Wait for the buffer to double before retrying, so large
+                # values are not re-parsed for every chunk
+                self._read(2 * (len(self.buf) - self.pos))
+                continue
+            if end == len(self.buf) and not self.eof:
+                # Numbers and literals may continue in the next chunk
+                self._read(len(self.buf) - self.pos + 1)
+                continue
+            self.pos = end
+            return value
+
+    def values(self):
+        '''Yields whitespace separated JSON values'''
+        while self.peek():
+            yield self.decode()
+
+    def array(self):
+        '''Yields the elements of a single top level array'''
+        if self.peek() != '[':
+            raise self._error("Expecting '['", self.pos)
+        self.pos += 1
+        if self.peek() == ']':
+            self.pos += 1
+        else:
+            yield from self._elements()
+        if self.peek():
+            raise self._error('Extra data', self.pos)
+
+    def _elements(self):
+        while True:
+            yield self.decode()
+            char = self.peek()
+            self.pos += 1
+            if char == ']':
+                return
+            if char != ',':
+                raise self._error("Expecting ',' delimiter", self.pos - 1)
 
 
 class Response:
@@ -43,20 +290,22 @@ class Response:
         'status_code': 'status',
     }
 
-    def __init__(self, response, request=None, _error=False):
+    def __init__(self, response, request=None, _error=False,
+                 json_loads=None):
 
         self._response = response
+        self._headers = None
         if _error:
             self.response = self._response
-            self.headers = normalize_headers(self.headers)
-        else:
-            response.headers = normalize_headers(response.headers)
+            self.headers = self._headers = normalize_headers(self.headers)
         self.request = request
 
         self._set_stream(response)
 
         self._bytes = None
+        self._buffer = None
         self._encoding = None
+        self._json_loads = json_loads
 
     def __getattr__(self, name):
         if name == 'read':
@@ -67,12 +316,57 @@ class Response:
             Response._attr_map.get(name, name)
         )
 
+    @property
+    def headers(self):
+        """Response headers as ``Headers``, normalized from the underlying
+        response the first time they are accessed
+        """
+        if self._headers is None:
+            self._headers = normalize_headers(self._response.headers)
+        return self._headers
+
+    def _get_header(self, name):
+        headers = self._headers
+        if headers is None:
+            headers = self._response.headers
+        return headers.get(name)
+
     def _set_stream(self, stream):
-        if self.headers.get('content-encoding', '') == 'gzip':
-            self.raw = stream.fp = GzipDecodedResponse(stream)
+        encodings = parse_content_encoding(
+            self._get_header('content-encoding')
+        )
+        if encodings and SUPPORTED_ENCODINGS.issuperset(encodings):
+            self.raw = DecodedResponse(stream, encodings)
         else:
             self.raw = stream
 
+    @property
+    def timings(self):
+        """List of ``requisitor.timings.Timings``, one per request made,
+        in order, including every redirect hop and authentication retry
+        """
+        return getattr(self.request, 'timings', None) or []
+
+    @property
+    def elapsed(self):
+        """``datetime.timedelta`` from starting the first request, until
+        the headers of the final response were read, or ``None`` if no
+        request was made, such as for a response served from a cache
+        """
+        timings = self.timings
+        if not timings or timings[-1].headers is None:
+            return None
+        return datetime.timedelta(
+            seconds=timings[-1].headers - timings[0].start
+        )
+
+    @property
+    def from_cache(self):
+        """``True`` if the response was served by a ``CacheHandler``,
+        either fresh or after a ``304 Not Modified``
+        """
+        return getattr(self._response, 'from_cache', False)
+
     @property
     def encoding(self):
         if self._encoding:
@@ -84,18 +378,156 @@ class Response:
     def encoding(self, value):
         self._encoding = value
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Closes the response, if the body was not read to the end, the
+        connection is discarded rather than reused
+        """
+        self.raw.close()
+
     @property
     def bytes(self):
-        if self._bytes:
+        if self._bytes is not None:
             return self._bytes
 
         self._bytes = self.raw.read()
         return self._bytes
 
+    def _stream(self):
+        if self._bytes is None:
+            return self.raw
+        if self._buffer is None:
+            self._buffer = io.BytesIO(self._bytes)
+        return self._buffer
+
+    def readinto(self, buffer):
+        """Reads decoded body bytes into ``buffer``, returning the number of
+        bytes read, ``0`` once the body is exhausted
+        """
+        stream = self._stream()
+        readinto = getattr(stream, 'readinto', None)
+        if readinto is not None:
+            return readinto(buffer)
+
+        data = stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def iter_content(self, chunk_size=CHUNK_SIZE):
+        """Iterates over the decoded body in chunks of up to ``chunk_size``
+        bytes, without holding the whole body in memory
+
+        The connection is released once the body is exhausted, or discarded
+        if iteration stops early.
+        """
+        if self._bytes is not None:
+            for i in range(0, len(self._bytes), chunk_size):
+                yield self._bytes[i:i + chunk_size]
+            return
+
+        try:
+            for chunk in iter(partial(self.raw.read, chunk_size), b''):
+                yield chunk
+        finally:
+            self.raw.close()
+
+    def iter_lines(self, chunk_size=CHUNK_SIZE, delimiter=b'\n',
+                   keepends=False):
+        """Iterates over the decoded body one line at a time
+
+        Lines are split on ``delimiter``, a trailing ``\\r`` is also removed
+        when splitting on the default ``\\n``, unless ``keepends`` is
+        ``True``.
+        """
+        pending = bytearray()
+        for chunk in self.iter_content(chunk_size):
+            start = len(pending) - len(delimiter) + 1
+            pending += chunk
+            end = pending.find(delimiter, max(start, 0))
+            start = 0
+            while end != -1:
+                yield self._line(pending[start:end], delimiter, keepends)
+                start = end + len(delimiter)
+                end = pending.find(delimiter, start)
+            del pending[:start]
+
+        if pending:
+            yield bytes(pending)
+
+    @staticmethod
+    def _line(line, delimiter, keepends):
+        if keepends:
+            return bytes(line + delimiter)
+        if delimiter == b'\n' and line.endswith(b'\r'):
+            return bytes(line[:-1])
+        return bytes(line)
+
+    def iter_text(self, chunk_size=CHUNK_SIZE):
+        """Iterates over the body decoded to ``str`` with an incremental
+        decoder, so multi-byte characters split across chunks are handled
+        """
+        decoder = codecs.getincrementaldecoder(self.encoding or 'utf-8')()
+        for chunk in self.iter_content(chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text
+
+    def iter_json(self, chunk_size=CHUNK_SIZE, array=None, **kwargs):
+        """Iterates over JSON values in the body one at a time, without
+        loading the whole body
+
+        ``array`` selects between a single top level array, whose elements
+        are yielded individually, and a sequence of newline delimited, or
+        otherwise whitespace separated, JSON values. By default a body is
+        an array if it starts with ``[``, unless the content type is
+        newline delimited JSON, such as ``application/x-ndjson``, whose
+        records may themselves be arrays. ``kwargs`` are passed to
+        ``json.JSONDecoder``.
+        """
+        import json
+        stream = _JSONStream(self.iter_text(chunk_size),
+                             json.JSONDecoder(**kwargs))
+        if array is None:
+            array = (
+                self.headers.get_content_type() not in NDJSON_CONTENT_TYPES
+                and stream.peek() == '['
+            )
+        if array:
+            yield from stream.array()
+        else:
+            yield from stream.values()
+
     @property
     def text(self):
         encoding = self.encoding or 'utf-8'
         return self.bytes.decode(encoding)
 
-    def json(self):
-        return json.loads(self.text)
+    def json(self, **kwargs):
+        """Parses the body as JSON, with the session's ``json_loads`` if
+        one was set, or ``json.loads``
+
+        The body is passed as ``bytes`` when the charset is UTF-8, UTF-16
+        or UTF-32, or not specified, avoiding decoding it to ``str`` first.
+        """
+        loads = self._json_loads
+        if loads is None:
+            import json
+            loads = json.loads
+        encoding = self.encoding
+        if encoding:
+            try:
+                encoding = codecs.lookup(encoding).name
+            except LookupError:
+                pass
+        if not encoding or encoding in JSON_BYTES_ENCODINGS:
+            return loads(self.bytes, **kwargs)
+        return loads(self.text, **kwargs)
@@ -1,26 +1,55 @@
 # -*- coding: utf-8 -*-
 # Copyright 2020 Matt Martz
 
-import http.client
-import http.cookiejar
-import json as _json
+import collections
+import contextlib
+import copy
+import functools
 import ssl
+import threading
 import urllib.request
-from urllib.parse import urlparse
+from collections import namedtuple
+from collections.abc import Mapping
 
 from .auth import validate_auth
+from .errors import DeadlineExceeded
+from .errors import HTTPError
+from .handlers import AcceptEncodingProcessor
 from .handlers import HTTPErrorHandler
+from .handlers import HTTPHandler
 from .handlers import HTTPSClientAuthHandler
 from .handlers import RedirectHandler
 from .handlers import UnixHTTPHandler
 from .headers import Headers
 from .headers import normalize_headers
-from .multipart import prepare_multipart
+from .hooks import Hooks
+from .pool import ConnectionPool
+from .redirects import PermanentRedirectHandler
+from .redirects import RedirectCache
 from .response import Response
 from .sentinel import Sentinel
+from .timeouts import Timeout
+from .utils import get_file_position
+from .utils import get_file_size
+from .utils import is_binary_fileobj
+from .utils import join_url
+from .utils import parse_url
 from .utils import update_url_params
 
 
+def _parse_spec(spec):
+    if isinstance(spec, Mapping):
+        kwargs = dict(spec)
+        return kwargs.pop('method'), kwargs.pop('url'), kwargs
+    elif isinstance(spec, (tuple, list)) and len(spec) in (2, 3):
+        method, url, *kwargs = spec
+        return method, url, dict(*kwargs)
+    raise TypeError(
+        'request spec must be a mapping, or a (method, url[, kwargs]) tuple, '
+        'cannot be type %s' % spec.__class__.__name__
+    )
+
+
 def _validate_cert(value):
     if value in (None, Sentinel):
         return value
@@ -29,18 +58,79 @@ def _validate_cert(value):
     raise TypeError
 
 
-class Session:
-    def __init__(self):
+class PreparedRequest(namedtuple(
+        'PreparedRequest',
+        ('method', 'url', 'headers', 'data', 'auth', 'auth_handlers', 'cert',
+         'cookies', 'unix_socket', 'verify', 'compression',
+         'body_position'))):
+    """Immutable request returned by ``Session.prepare``, with the session
+    defaults applied, and the URL, headers and body fully built
+
+    ``headers`` is a tuple of ``(name, value)`` tuples. A prepared request
+    can be sent any number of times with ``Session.send``, except when
+    ``data`` is a generator, or other stream that can only be read once.
+    ``body_position`` is the position a seekable file ``data`` started at,
+    which it is rewound to each time it is sent.
+    """
+
+    __slots__ = ()
+
+    @property
+    def host(self):
+        return parse_url(self.url).netloc
+
+    def build_request(self):
+        """Returns a new ``urllib.request.Request`` for this request"""
+        req = urllib.request.Request(
+            self.url,
+            data=self.data,
+            method=self.method,
+            headers=dict(self.headers),
+        )
+        req.body_position = self.body_position
+        return req
+
+
+class BaseSession:
+    """Configuration and request preparation shared by ``Session`` and
+    ``AsyncSession``
+    """
+
+    def __init__(self, cookies=None):
         self._auth = None
         self._cert = None
         self._headers = Headers()
 
-        self.cookies = http.cookiejar.CookieJar()
-
-        self.handlers = []
+        # ``None`` creates a ``requisitor.cookies.CookieJar`` on first use,
+        # ``False`` disables cookie processing
+        self._cookies = Sentinel
+        if cookies is not None:
+            self.cookies = cookies
+
+        self.compression = True
+        # JSON backend used to encode ``json=`` request bodies, and to parse
+        # ``Response.json``, defaulting to ``json.dumps`` and ``json.loads``.
+        # ``json_dumps`` may return ``str`` or ``bytes``
+        self.json_dumps = None
+        self.json_loads = None
         self.params = {}
         self.unix_socket = None
-        self.verify = True
+        self._contexts = {}
+        self._verify = True
+        self._base_url = None
+        self._base = None
+
+    @property
+    def cookies(self):
+        # ``http.cookiejar`` is only imported once the cookie jar is used
+        if self._cookies is Sentinel:
+            from .cookies import CookieJar
+            self._cookies = CookieJar()
+        return self._cookies
+
+    @cookies.setter
+    def cookies(self, value):
+        self._cookies = None if value is False else value
 
     @property
     def auth(self):
@@ -57,6 +147,28 @@ class Session:
     @cert.setter
     def cert(self, value):
         self._cert = _validate_cert(value)
+        self.clear_contexts()
+
+    @property
+    def verify(self):
+        return self._verify
+
+    @verify.setter
+    def verify(self, value):
+        self._verify = value
+        self.clear_contexts()
+
+    @property
+    def base_url(self):
+        """URL that relative request URLs are joined to, parsed once when
+        set
+        """
+        return self._base_url
+
+    @base_url.setter
+    def base_url(self, value):
+        self._base_url = value
+        self._base = parse_url(value) if value else None
 
     @property
     def headers(self):
@@ -71,7 +183,19 @@ class Session:
             return fallback
         return value
 
-    def _create_context(self, verify):
+    def clear_contexts(self):
+        """Discards all cached ``ssl.SSLContext`` objects, so that CA
+        bundles and client certificates are loaded again on the next request
+        """
+        self._contexts.clear()
+
+    def _create_context(self, verify, cert=(None, None)):
+        key = (verify, cert)
+        try:
+            return self._contexts[key]
+        except KeyError:
+            pass
+
         context = ssl.create_default_context()
         if not verify:
             context.check_hostname = False
@@ -80,82 +204,107 @@ class Session:
         if verify and verify is not True:
             context.load_verify_locations(cafile=verify)
 
+        if cert[0]:
+            context.load_cert_chain(cert[0], keyfile=cert[1])
+
+        self._contexts[key] = context
         return context
 
-    def request(self, method, url, params=Sentinel, data=None,
-                headers=Sentinel, cookies=Sentinel, files=None, auth=Sentinel,
-                timeout=None, allow_redirects=True, verify=Sentinel,
-                cert=Sentinel, json=Sentinel, unix_socket=Sentinel):
+    def _merge_params(self, params):
+        if params:
+            return {**self.params, **params}
+        return self.params
+
+    def _join_base_url(self, url):
+        if self._base is not None:
+            return join_url(self._base, url)
+        return url
+
+    def _prepare_body(self, headers, data, json, files):
+        # Returns the body to send, and the position to rewind a file body
+        # to before sending it, adding the content headers it needs to the
+        # per request ``headers``
+        def has_header(name):
+            return name in headers or name in self.headers
 
+        if json is not Sentinel:
+            if not has_header('content-type'):
+                headers['content-type'] = 'application/json'
+            ctype = headers if 'content-type' in headers else self.headers
+            encoding = ctype.get_param('charset', 'utf-8')
+            if self.json_dumps:
+                data = self.json_dumps(json)
+            else:
+                import json as _json
+                data = _json.dumps(json)
+            if not isinstance(data, bytes):
+                data = data.encode(encoding)
+
+        if files:
+            from .multipart import MultipartEncoder
+            data = MultipartEncoder(files)
+            headers['content-type'] = data.content_type
+            if data.length is not None:
+                headers['content-length'] = str(data.length)
+
+        position = get_file_position(data)
+        if is_binary_fileobj(data) and not has_header('content-length'):
+            size = get_file_size(data)
+            if size is not None:
+                headers['content-length'] = str(size)
+        return data, position
+
+    def prepare(self, method, url, params=Sentinel, data=None,
+                headers=Sentinel, cookies=Sentinel, files=None, auth=Sentinel,
+                cert=Sentinel, json=Sentinel, unix_socket=Sentinel,
+                verify=Sentinel, compression=Sentinel):
+        """Applies the session defaults to a request, and builds its URL,
+        headers and body. Takes the same arguments as ``request``, except
+        for ``timeout``, ``deadline`` and ``allow_redirects``, which are
+        passed to ``send``.
+
+        :returns: PreparedRequest
+        """
         if sum(bool(x) for x in (data, json, files)) > 1:
             raise TypeError(
                 '"data", "json", and "files" are mutually exclusive'
             )
 
-        _headers = self.headers.copy()
-        _headers.update(headers or {})
-
-        _params = self.params.copy()
-        _params.update(params or {})
+        # Per request headers are layered over the session headers, which
+        # are only consulted, not copied
+        _headers = Headers(headers) if headers else Headers()
+        _params = self._merge_params(params)
 
         auth = self._fallback(auth, self.auth)
         cert = _validate_cert(self._fallback(cert, self.cert)) or (None, None)
         cookies = self._fallback(cookies, self.cookies)
+        if cookies is False:
+            cookies = None
         unix_socket = self._fallback(unix_socket, self.unix_socket)
         verify = self._fallback(verify, self.verify)
+        compression = self._fallback(compression, self.compression)
 
-        if json is not Sentinel:
-            if 'content-type' not in _headers:
-                _headers['content-type'] = 'application/json'
-            encoding = _headers.get_param('charset', 'utf-8')
-            data = _json.dumps(json).encode(encoding)
-
-        if files:
-            content_type, data = prepare_multipart(files)
-            _headers['content-type'] = content_type
-
-        https_kwargs = {
-            'context': self._create_context(verify),
-            'client_cert': cert[0],
-            'client_key': cert[1],
-            'unix_socket': unix_socket,
-        }
+        data, body_position = self._prepare_body(_headers, data, json,
+                                                 files)
+        url = self._join_base_url(url)
 
-        handlers = [
-            HTTPSClientAuthHandler(**https_kwargs),
-            RedirectHandler(allow_redirects=allow_redirects),
-            HTTPErrorHandler,
-            urllib.request.HTTPCookieProcessor(cookies),
-        ]
-
-        if unix_socket:
-            handlers.append(UnixHTTPHandler(unix_socket))
-
-        o = urlparse(url)
+        auth_handlers = ()
         if auth:
-            auth_info = validate_auth(auth)(o)
+            auth = validate_auth(auth)
+            auth_info = auth(parse_url(url))
             _headers.update(
                 auth_info.get('headers', {})
             )
-            handlers.extend(
-                auth_info.get('handlers', [])
-            )
+            auth_handlers = tuple(auth_info.get('handlers', ()))
 
-        handlers.extend(self.handlers)
+        merged = [(name, value) for name, value in self.headers.items()
+                  if name not in _headers]
+        merged.extend(_headers.items())
 
-        opener = urllib.request.build_opener(*handlers)
-        req = urllib.request.Request(
-            update_url_params(o, _params),
-            data=data or None,
-            method=method,
-            headers=_headers,
-        )
-        return Response(
-            opener.open(
-                req,
-                timeout=timeout,
-            ),
-            request=req
+        return PreparedRequest(
+            method, update_url_params(url, _params), tuple(merged),
+            data or None, auth, auth_handlers, cert, cookies, unix_socket,
+            verify, compression, body_position
         )
 
     def get(self, url, **kwargs):
@@ -192,8 +341,8 @@ class Session:
         r"""Sends a POST request. Returns :class:`HTTPResponse` object.
 
         :arg url: URL to request.
-        :kwarg data: (optional) bytes, or file-like object to send in the body
-            of the request.
+        :kwarg data: (optional) bytes, file-like object, or iterable of bytes
+            to send in the body of the request.
         :kwarg \*\*kwargs: Optional arguments that ``open`` takes.
         :returns: requisitor.response.Response
         """
@@ -204,8 +353,8 @@ class Session:
         r"""Sends a PUT request. Returns :class:`HTTPResponse` object.
 
         :arg url: URL to request.
-        :kwarg data: (optional) bytes, or file-like object to send in the body
-            of the request.
+        :kwarg data: (optional) bytes, file-like object, or iterable of bytes
+            to send in the body of the request.
         :kwarg \*\*kwargs: Optional arguments that ``open`` takes.
         :returns: requisitor.response.Response
         """
@@ -216,8 +365,8 @@ class Session:
         r"""Sends a PATCH request. Returns :class:`HTTPResponse` object.
 
         :arg url: URL to request.
-        :kwarg data: (optional) bytes, or file-like object to send in the body
-            of the request.
+        :kwarg data: (optional) bytes, file-like object, or iterable of bytes
+            to send in the body of the request.
         :kwarg \*\*kwargs: Optional arguments that ``open`` takes.
         :returns: requisitor.response.Response
         """
@@ -233,3 +382,271 @@ class Session:
         """
 
         return self.request('DELETE', url, **kwargs)
+
+
+class Session(BaseSession):
+    def __init__(self, pool=None, cache=None, base_url=None, cookies=None,
+                 redirect_cache=None):
+        super().__init__(cookies=cookies)
+
+        self.handlers = []
+        # Callbacks for the events of the request lifecycle, see
+        # ``requisitor.hooks.EVENTS``
+        self.hooks = Hooks()
+        self.pool = ConnectionPool() if pool is None else pool or None
+        # Optional ``requisitor.cache.BaseCache`` backend responses to GET
+        # requests are cached in
+        self.cache = cache
+        # ``requisitor.redirects.RedirectCache`` of the permanent redirects
+        # followed, that later requests skip. ``False`` disables it
+        self.redirect_cache = (
+            RedirectCache() if redirect_cache is None else
+            redirect_cache or None
+        )
+        self.base_url = base_url
+        self._openers = collections.OrderedDict()
+        self._openers_lock = threading.Lock()
+
+        self.max_openers = 32
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Closes all idle pooled connections"""
+        if self.pool is not None:
+            self.pool.clear()
+
+    def clear_contexts(self):
+        super().clear_contexts()
+        self._openers.clear()
+
+    def _build_opener(self, allow_redirects, verify, cert, cookies,
+                      unix_socket, compression, auth_handlers, hooks):
+        permanent_redirects = None
+        if allow_redirects and self.redirect_cache is not None:
+            permanent_redirects = PermanentRedirectHandler(
+                self.redirect_cache, namespace=unix_socket
+            )
+
+        handlers = [
+            HTTPSClientAuthHandler(
+                context_factory=functools.partial(
+                    self._create_context, verify, cert
+                ),
+                unix_socket=unix_socket,
+                pool=self.pool,
+                hooks=hooks,
+            ),
+            RedirectHandler(allow_redirects=allow_redirects, hooks=hooks,
+                            permanent_redirects=permanent_redirects),
+            HTTPErrorHandler(hooks=hooks),
+        ]
+
+        if permanent_redirects is not None:
+            handlers.append(permanent_redirects)
+
+        if cookies is not None:
+            handlers.append(urllib.request.HTTPCookieProcessor(cookies))
+
+        if unix_socket:
+            handlers.append(UnixHTTPHandler(unix_socket, pool=self.pool,
+                                            hooks=hooks))
+        else:
+            handlers.append(HTTPHandler(pool=self.pool, hooks=hooks))
+
+        if compression:
+            handlers.append(AcceptEncodingProcessor())
+
+        if self.cache is not None:
+            from .cache import CacheHandler
+            handlers.append(CacheHandler(self.cache, namespace=unix_socket))
+
+        handlers.extend(auth_handlers)
+        # build_opener sets the parent of each handler to the opener, so
+        # every opener gets its own copies of the session handlers, rather
+        # than sharing them with, and calling into, the last opener built
+        handlers.extend(copy.copy(handler) for handler in self.handlers)
+
+        return urllib.request.build_opener(*handlers)
+
+    def _get_opener(self, allow_redirects, verify, cert, cookies,
+                    unix_socket, compression, auth_key, auth_handlers):
+        # Handlers are stateless for a given configuration, so the built
+        # OpenerDirector is reused while the configuration stays the same.
+        # Per request values, such as timeout, are carried on the Request.
+        # Handlers only get hooks once there are any, so that sessions
+        # without hooks do not pay for emitting events
+        hooks = self.hooks if self.hooks else None
+        key = (
+            allow_redirects, verify, cert, cookies, unix_socket,
+            compression, auth_key, tuple(self.handlers), self.pool,
+            self.cache, self.redirect_cache, self.hooks, hooks is None,
+        )
+        with self._openers_lock:
+            try:
+                self._openers.move_to_end(key)
+                return self._openers[key]
+            except KeyError:
+                pass
+
+            opener = self._build_opener(allow_redirects, verify, cert,
+                                        cookies, unix_socket, compression,
+                                        auth_handlers, hooks)
+            self._openers[key] = opener
+            while len(self._openers) > self.max_openers:
+                self._openers.popitem(last=False)
+            return opener
+
+    def request(self, method, url, params=Sentinel, data=None,
+                headers=Sentinel, cookies=Sentinel, files=None, auth=Sentinel,
+                timeout=None, allow_redirects=True, verify=Sentinel,
+                cert=Sentinel, json=Sentinel, unix_socket=Sentinel,
+                compression=Sentinel, deadline=None):
+
+        prepared = self.prepare(
+            method, url, params=params, data=data, headers=headers,
+            cookies=cookies, files=files, auth=auth, cert=cert, json=json,
+            unix_socket=unix_socket, verify=verify, compression=compression,
+        )
+        return self.send(prepared, timeout=timeout,
+                         allow_redirects=allow_redirects, deadline=deadline)
+
+    def send(self, prepared, timeout=None, allow_redirects=True,
+             deadline=None):
+        """Sends a ``PreparedRequest`` created by ``prepare``
+
+        :kwarg timeout: Seconds to wait for connecting and each read, a
+            ``(connect, read)`` tuple, or a ``requisitor.timeouts.Timeout``
+        :kwarg deadline: Seconds the request may take in total, including
+            redirects and reading the body, after which
+            ``requisitor.errors.DeadlineExceeded`` is raised
+        :returns: requisitor.response.Response
+        """
+        auth_key = None
+        if prepared.auth_handlers:
+            auth_key = (prepared.auth, prepared.host)
+
+        opener = self._get_opener(
+            allow_redirects=allow_redirects,
+            verify=prepared.verify,
+            cert=prepared.cert,
+            cookies=prepared.cookies,
+            unix_socket=prepared.unix_socket,
+            compression=prepared.compression,
+            auth_key=auth_key,
+            auth_handlers=prepared.auth_handlers,
+        )
+        req = prepared.build_request()
+        timeouts = Timeout.from_args(timeout, deadline)
+        if timeouts is not None:
+            # The handlers apply the separate timeouts and the deadline,
+            # urllib only sees the connect timeout
+            req.timeouts = timeouts
+            timeout = timeouts.connect
+        try:
+            response = opener.open(req, timeout=timeout)
+        except HTTPError as e:
+            e._json_loads = self.json_loads
+            raise
+        except Exception as e:
+            if isinstance(getattr(e, 'reason', None), DeadlineExceeded):
+                # Wrapped in a URLError by urllib's own connection handling
+                e = e.reason
+            # HTTPError is emitted by HTTPErrorHandler
+            if self.hooks:
+                self.hooks.emit('error', req, e)
+            raise e
+        return Response(response, request=req, json_loads=self.json_loads)
+
+    def _execute(self, spec):
+        try:
+            if isinstance(spec, PreparedRequest):
+                response = self.send(spec)
+            else:
+                method, url, kwargs = _parse_spec(spec)
+                response = self.request(method, url, **kwargs)
+            # Read the body on the worker, which also returns the connection
+            # to the pool before the result is handed back
+            response.bytes
+        except HTTPError as e:
+            with contextlib.suppress(Exception):
+                e.bytes
+            return e
+        except Exception as e:
+            return e
+        return response
+
+    def _max_workers(self, max_workers):
+        if max_workers is not None:
+            return max_workers
+        if self.pool is not None:
+            # More workers than pooled connections would only wait on, or
+            # bypass, the pool
+            return self.pool.max_per_host
+        return 10
+
+    def imap(self, requests, max_workers=None):
+        r"""Concurrently sends ``requests`` on a thread pool, yielding
+        results in the order of ``requests``
+
+        :arg requests: Iterable of request specs, each either a mapping of
+            ``method``, ``url`` and the keyword arguments ``request`` takes,
+            a ``(method, url[, kwargs])`` tuple, or a ``PreparedRequest``.
+        :kwarg max_workers: Number of threads, defaults to the pool's
+            ``max_per_host``. Workers beyond it wait for a connection with
+            a blocking pool, otherwise they use unpooled connections
+        :returns: Generator of ``Response`` objects, or the exception raised
+            for that request
+
+        At most ``2 * max_workers`` requests are in flight at any time, so
+        ``requests`` may be arbitrarily large, or infinite.
+        """
+        max_workers = self._max_workers(max_workers)
+        pending = collections.deque()
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            for spec in requests:
+                pending.append(executor.submit(self._execute, spec))
+                if len(pending) >= max_workers * 2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def imap_unordered(self, requests, max_workers=None):
+        r"""Concurrently sends ``requests`` on a thread pool, yielding
+        results as they complete
+
+        Takes the same arguments as ``imap``, but yields
+        ``(index, result)`` tuples, where ``index`` is the position of the
+        request spec in ``requests``.
+        """
+        max_workers = self._max_workers(max_workers)
+        pending = {}
+        import concurrent.futures
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            for i, spec in enumerate(requests):
+                pending[executor.submit(self._execute, spec)] = i
+                if len(pending) < max_workers * 2:
+                    continue
+                done, _ = concurrent.futures.wait(
+                    pending,
+                    return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    yield pending.pop(future), future.result()
+            for future in concurrent.futures.as_completed(pending):
+                yield pending[future], future.result()
+
+    def map(self, requests, max_workers=None):
+        r"""Concurrently sends ``requests`` on a thread pool
+
+        Takes the same arguments as ``imap``.
+
+        :returns: list of ``Response`` objects, or the exception raised for
+            that request, in the order of ``requests``
+        """
+        return list(self.imap(requests, max_workers=max_workers))
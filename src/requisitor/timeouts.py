@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import time
+
+from .errors import DeadlineExceeded
+
+
+class Timeout:
+    '''Separate connect and read timeouts of a request, and an overall
+    deadline
+
+    A timeout of ``None`` waits forever.
+
+    :kwarg connect: Seconds to wait for each connection attempt, including
+        the TLS handshake
+    :kwarg read: Seconds to wait for each read from the socket
+    :kwarg deadline: Seconds the whole request may take, across name
+        resolution, connecting, the TLS handshake, every redirect and
+        authentication retry, and reading the body through ``Response``.
+        Every connect and read timeout is shortened to the time left, and
+        ``DeadlineExceeded`` raised once it passed
+    '''
+
+    __slots__ = ('connect', 'read', 'deadline', 'expires')
+
+    def __init__(self, connect=None, read=None, deadline=None):
+        self.connect = connect
+        self.read = read
+        self.deadline = deadline
+        # ``time.monotonic`` the deadline passes at, set by ``start``
+        self.expires = None
+
+    def __repr__(self):
+        return '<Timeout connect=%r read=%r deadline=%r>' % (
+            self.connect, self.read, self.deadline
+        )
+
+    @classmethod
+    def from_args(cls, timeout=None, deadline=None):
+        '''Returns a started ``Timeout`` for the ``timeout`` and
+        ``deadline`` arguments of ``Session.request``, or ``None`` if
+        ``timeout`` is a plain number of seconds, and there is no deadline
+
+        :kwarg timeout: Number of seconds, a ``(connect, read)`` tuple, or
+            a ``Timeout``
+        :kwarg deadline: Number of seconds, overrides the deadline of a
+            ``Timeout``
+        '''
+        if isinstance(timeout, cls):
+            timeout = cls(timeout.connect, timeout.read,
+                          timeout.deadline if deadline is None else deadline)
+        elif isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = cls(connect, read, deadline)
+        elif deadline is not None:
+            timeout = cls(timeout, timeout, deadline)
+        else:
+            return None
+        return timeout.start()
+
+    def start(self):
+        '''Starts counting towards the deadline, returns ``self``'''
+        if self.deadline is not None:
+            self.expires = time.monotonic() + self.deadline
+        return self
+
+    def remaining(self):
+        '''Returns the number of seconds left until the deadline, or
+        ``None`` without one
+
+        :raises DeadlineExceeded: if the deadline passed
+        '''
+        if self.expires is None:
+            return None
+        remaining = self.expires - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(
+                'deadline of %s seconds exceeded' % self.deadline
+            )
+        return remaining
+
+    def _bound(self, timeout):
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        if timeout is None:
+            return remaining
+        return min(timeout, remaining)
+
+    def connect_timeout(self):
+        '''Returns the timeout of the next connection attempt'''
+        return self._bound(self.connect)
+
+    def read_timeout(self):
+        '''Returns the timeout of the next read'''
+        return self._bound(self.read)
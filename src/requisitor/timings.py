@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+# Copyright 2020 Matt Martz
+
+import time
+
+
+class Timings:
+    '''Timestamps, from ``time.monotonic``, of the phases of a single
+    request and response
+
+    A phase that did not happen is ``None``, such as DNS, connect and TLS
+    on a reused connection, DNS for a unix socket, or TLS for plain HTTP.
+
+    :ivar url: URL of the request
+    :ivar status: Status code of the response
+    :ivar start: Request started, before connecting if a new connection
+        was needed
+    :ivar dns: Host name resolved
+    :ivar connect: TCP, or unix socket, connection established
+    :ivar tls: TLS handshake completed
+    :ivar sent: Request line, headers and body written
+    :ivar headers: Status line and headers of the response read
+    :ivar end: Body of the response read to the end, or the response
+        closed
+    '''
+
+    __slots__ = ('url', 'status', 'start', 'dns', 'connect', 'tls', 'sent',
+                 'headers', 'end')
+
+    def __init__(self, start=None):
+        self.url = self.status = None
+        self.start = time.monotonic() if start is None else start
+        self.dns = self.connect = self.tls = None
+        self.sent = self.headers = self.end = None
+
+    def __repr__(self):
+        return '<Timings %s %s>' % (self.url, self.durations())
+
+    @property
+    def reused(self):
+        '''``True`` if the request was sent on a reused connection'''
+        return self.connect is None
+
+    def durations(self):
+        '''Returns a ``dict`` of the seconds spent in each phase, ``dns``,
+        ``connect``, ``tls``, ``send``, ``ttfb`` (waiting for the response
+        headers), ``body``, and the ``total``
+        '''
+        durations = {}
+        previous = self.start
+        for name, stamp in (('dns', self.dns), ('connect', self.connect),
+                            ('tls', self.tls), ('send', self.sent),
+                            ('ttfb', self.headers), ('body', self.end)):
+            if stamp is None:
+                durations[name] = None
+                continue
+            durations[name] = stamp - previous
+            previous = stamp
+        durations['total'] = previous - self.start
+        return durations
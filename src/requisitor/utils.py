@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 # Copyright 2020 Matt Martz
 
+import functools
 import io
 import os
-import pathlib
+import re
+import stat
 import urllib.parse
 
 TEXTCHARS = bytearray(
@@ -11,11 +13,64 @@ TEXTCHARS = bytearray(
 )
 
 
+# A scheme followed by an authority, marking an absolute URL
+ABSOLUTE_URL = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*://')
+
+# ``urlparse`` results are immutable, so they are shared between
+# requests to the same URL
+parse_url = functools.lru_cache(maxsize=1024)(urllib.parse.urlparse)
+
+
+def join_url(base, url):
+    '''Joins ``url`` to ``base``, a ``urlparse`` result, like
+    ``urllib.parse.urljoin``, without re-parsing ``base``
+
+    Absolute URLs are returned unchanged, and plain relative paths are
+    joined by string concatenation.
+    '''
+    if ABSOLUTE_URL.match(url):
+        return url
+    if url.startswith('//'):
+        return '%s:%s' % (base.scheme, url)
+
+    prefix = '%s://%s' % (base.scheme, base.netloc)
+    if url.startswith('/'):
+        return prefix + url
+
+    segments = url.partition('?')[0].split('/')
+    if (not url or url[0] in '?#;' or ':' in segments[0] or
+            '' in segments[:-1] or
+            any(s in ('.', '..') for s in segments)):
+        return urllib.parse.urljoin(base.geturl(), url)
+    return '%s%s%s' % (prefix, base.path.rpartition('/')[0], '/' + url)
+
+
+def parse_cache_control(value):
+    '''Parses a ``Cache-Control`` header value into a dict of lowercase
+    directive names to their value, or ``None`` for directives without
+    a value
+    '''
+    directives = {}
+    if not value:
+        return directives
+    for directive in value.split(','):
+        name, _, arg = directive.partition('=')
+        name = name.strip().lower()
+        if name:
+            directives[name] = arg.strip().strip('"') if arg else None
+    return directives
+
+
 def update_url_params(url, params):
+    if not params or all(v is None for v in params.values()):
+        if isinstance(url, urllib.parse.ParseResult):
+            return url.geturl()
+        return url
+
     if isinstance(url, urllib.parse.ParseResult):
         o = url
     else:
-        o = urllib.parse.urlparse(url)
+        o = parse_url(url)
     _params = {
         **urllib.parse.parse_qs(o.query),
         **{k: v for k, v in params.items() if v is not None}
@@ -46,8 +101,9 @@ def is_binary_fileobj(obj):
 
 
 def get_filename(obj, basename=True):
-    if isinstance(obj, pathlib.Path):
-        return obj.name if basename else str(obj)
+    if isinstance(obj, os.PathLike):
+        path = os.fspath(obj)
+        return os.path.basename(path) if basename else path
     elif is_binary_fileobj(obj):
         return os.path.basename(obj.name) if basename else obj.name
     elif isinstance(obj, str):
@@ -64,10 +120,9 @@ def get_filename(obj, basename=True):
 def read_bytes(obj):
     if is_binary_fileobj(obj):
         return obj.read()
-    elif isinstance(obj, pathlib.Path):
-        return obj.read_bytes()
-    elif isinstance(obj, str):
-        return pathlib.Path(obj).read_bytes()
+    elif isinstance(obj, (str, os.PathLike)):
+        with open(obj, 'rb') as f:
+            return f.read()
     else:
         raise TypeError(
             'value must be a str, pathlib.Path, or binary file object, '
@@ -81,3 +136,79 @@ def ensure_bytes(obj, encoding='utf-8'):
     if isinstance(obj, bytes):
         return obj
     return obj.encode(encoding)
+
+
+def get_file_size(fileobj):
+    '''Returns the number of bytes left to read from ``fileobj``, or
+    ``None`` if it cannot be determined without reading it
+    '''
+    try:
+        st = os.fstat(fileobj.fileno())
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+    else:
+        if stat.S_ISREG(st.st_mode):
+            return max(st.st_size - fileobj.tell(), 0)
+
+    try:
+        if not fileobj.seekable():
+            return None
+        position = fileobj.tell()
+        size = fileobj.seek(0, os.SEEK_END) - position
+        fileobj.seek(position)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    return size
+
+
+def get_file_position(fileobj):
+    '''Returns the position of a seekable ``fileobj``, to rewind it to
+    before sending it again, or ``None`` if it cannot be rewound
+    '''
+    try:
+        if fileobj.seekable():
+            return fileobj.tell()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+    return None
+
+
+def is_regular_file(fileobj):
+    '''Returns ``True`` if ``fileobj`` is a binary file object backed by a
+    regular file on disk, suitable for ``socket.sendfile``
+    '''
+    if not is_binary_fileobj(fileobj):
+        return False
+    try:
+        return stat.S_ISREG(os.fstat(fileobj.fileno()).st_mode)
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+
+
+def iter_body(body, chunk_size):
+    '''Yields a request body, which may be a readable file object or an
+    iterable of bytes, in chunks of at least ``chunk_size`` bytes, except
+    for the last
+    '''
+    if hasattr(body, 'read'):
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                return
+            if isinstance(chunk, str):
+                chunk = chunk.encode('iso-8859-1')
+            yield chunk
+
+    buf = bytearray()
+    for chunk in body:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('iso-8859-1')
+        if not buf and len(chunk) >= chunk_size:
+            yield chunk
+            continue
+        buf += chunk
+        if len(buf) >= chunk_size:
+            yield bytes(buf)
+            buf.clear()
+    if buf:
+        yield bytes(buf)
@@ -0,0 +1,234 @@
+import gzip
+import hashlib
+import http.server
+import json
+import os
+import socketserver
+import threading
+import time
+import urllib.request
+
+import pytest
+
+
+DIGEST_REALM = 'test'
+DIGEST_USER = 'user'
+DIGEST_PASSWORD = 'pass'
+
+
+def _md5(*parts):
+    return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _send(self, code, body=b'', headers=None):
+        self.send_response(code)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _body(self):
+        if self.headers.get('transfer-encoding', '') == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().split(b';')[0], 16)
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if not size:
+                    return b''.join(chunks)
+                chunks.append(chunk)
+        return self.rfile.read(int(self.headers.get('content-length', 0)))
+
+    def _digest(self):
+        # Returns the nonce count of a valid Digest Authorization header,
+        # ``False`` if its nonce is stale, or ``None``
+        scheme, _, params = self.headers.get('authorization', '').partition(
+            ' '
+        )
+        if scheme.lower() != 'digest':
+            return None
+        params = urllib.request.parse_keqv_list(
+            urllib.request.parse_http_list(params)
+        )
+        ha1 = _md5(DIGEST_USER, DIGEST_REALM, DIGEST_PASSWORD)
+        ha2 = _md5(self.command, params.get('uri', ''))
+        expected = _md5(
+            ha1, params.get('nonce', ''), params.get('nc', ''),
+            params.get('cnonce', ''), params.get('qop', ''), ha2
+        )
+        if params.get('response') != expected:
+            return None
+        if params['nonce'] != self.server.nonce:
+            return False
+        return params['nc']
+
+    def _echo(self, body):
+        self._send(200, json.dumps({
+            'method': self.command,
+            'path': self.path,
+            'headers': dict(self.headers),
+            'body': body.decode('latin-1'),
+        }).encode(), {'Content-Type': 'application/json'})
+
+    def _redirect(self, arg, query, body):
+        code, _, location = arg.partition('/')
+        headers = {'Location': '/' + location}
+        if query.startswith('cc='):
+            headers['Cache-Control'] = query[3:].replace('%20', ' ')
+        self._send(int(code), headers=headers)
+
+    def _gzip(self, arg, query, body):
+        self._send(200, gzip.compress(b'{"foo": "bar"}'), {
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+        })
+
+    def _chunked(self, arg, query, body):
+        self.send_response(200)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for chunk in (b'foo', b'bar', b''):
+            self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+
+    def _cookie(self, arg, query, body):
+        self._send(200, b'', {'Set-Cookie': 'foo=bar; Path=/'})
+
+    def _status(self, arg, query, body):
+        self._send(int(arg), b'error')
+
+    def _cache(self, arg, query, body):
+        self.server.hits += 1
+        headers = {
+            'Cache-Control': 'max-age=%s' % arg,
+            'ETag': '"v1"',
+            'Vary': 'X-Variant',
+        }
+        if self.headers.get('if-none-match') == '"v1"':
+            return self._send(304, headers=headers)
+        variant = self.headers.get('x-variant', '')
+        self._send(200, b'cached' + variant.encode(), headers)
+
+    def _digest_auth(self, arg, query, body):
+        nc = self._digest()
+        self.server.digest.append(nc)
+        if nc:
+            return self._echo(body)
+        challenge = (
+            'Digest realm="%s", qop="auth", nonce="%s", '
+            'opaque="op", algorithm=MD5' % (DIGEST_REALM, self.server.nonce)
+        )
+        if nc is False:
+            challenge += ', stale=true'
+        self._send(401, b'unauthorized', {'WWW-Authenticate': challenge})
+
+    def _bearer(self, arg, query, body):
+        auth = self.headers.get('authorization')
+        self.server.bearer.append(auth)
+        if auth == 'Bearer %s' % self.server.token:
+            return self._echo(body)
+        self._send(401, b'unauthorized', {'WWW-Authenticate': 'Bearer'})
+
+    def _slow(self, arg, query, body):
+        time.sleep(float(arg))
+        self._echo(body)
+
+    def _trickle(self, arg, query, body):
+        # Sends a byte of the body every ``interval`` seconds
+        interval = float(arg)
+        self.send_response(200)
+        self.send_header('Content-Length', '10')
+        self.end_headers()
+        for _ in range(10):
+            self.wfile.write(b'x')
+            self.wfile.flush()
+            time.sleep(interval)
+
+    def _close(self, arg, query, body):
+        self.close_connection = True
+        self._send(200, b'closed', {'Connection': 'close'})
+
+    # First path segment to route, any other path is echoed back as JSON
+    routes = {
+        'redirect': _redirect,
+        'gzip': _gzip,
+        'chunked': _chunked,
+        'cookie': _cookie,
+        'status': _status,
+        'cache': _cache,
+        'digest': _digest_auth,
+        'bearer': _bearer,
+        'slow': _slow,
+        'trickle': _trickle,
+        'close': _close,
+    }
+
+    def do_GET(self):
+        body = self._body()
+        path, _, query = self.path.partition('?')
+        name, _, arg = path[1:].partition('/')
+        route = self.routes.get(name)
+        if route is None:
+            return self._echo(body)
+        route(self, arg, query, body)
+
+    do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = do_OPTIONS = do_GET
+
+    def log_message(self, *args):
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn,
+                     socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        return request, ('local', 0)
+
+
+def _serve(httpd):
+    httpd.connections = 0
+    httpd.hits = 0
+    httpd.nonce = 'n1'
+    httpd.digest = []
+    httpd.token = 't1'
+    httpd.bearer = []
+    verify_request = httpd.verify_request
+
+    def _verify_request(request, client_address):
+        httpd.connections += 1
+        return verify_request(request, client_address)
+
+    httpd.verify_request = _verify_request
+    httpd.handle_error = lambda request, client_address: None
+    t = threading.Thread(target=httpd.serve_forever, args=(0.01,),
+                         daemon=True)
+    t.start()
+    return httpd
+
+
+@pytest.fixture
+def server():
+    httpd = _serve(
+        http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    )
+    httpd.url = 'http://127.0.0.1:%d' % httpd.server_address[1]
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def unix_server(tmp_path):
+    path = str(tmp_path / 'http.sock')
+    httpd = _serve(UnixHTTPServer(path, Handler))
+    httpd.path = path
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+    os.unlink(path)
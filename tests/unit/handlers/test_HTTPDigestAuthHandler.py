@@ -0,0 +1,145 @@
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+
+from requisitor.handlers import HTTPDigestAuthHandler
+
+
+CHALLENGE = {'realm': 'foo', 'nonce': 'bar', 'qop': 'auth',
+             'opaque': 'baz'}
+
+
+@pytest.mark.parametrize('challenge,drained', (
+    ('Digest realm="foo", nonce="bar", qop="auth"', True),
+    ('Basic realm="foo"', False),
+    ('', False),
+))
+def test_HTTPDigestAuthHandler(mocker, challenge, drained):
+    retry = mocker.patch.object(HTTPDigestAuthHandler,
+                                'retry_http_digest_auth',
+                                return_value='retried')
+    fp = MagicMock()
+    headers = {'www-authenticate': challenge} if challenge else {}
+    req = urllib.request.Request('http://foo.bar/')
+
+    handler = HTTPDigestAuthHandler()
+    result = handler.http_error_401(req, fp, 401, 'msg', headers)
+    assert fp.read.called is drained
+    assert fp.close.called is drained
+    if drained:
+        assert result == 'retried'
+        retry.assert_called_once_with(req, challenge)
+    else:
+        assert result is None
+        retry.assert_not_called()
+
+
+@pytest.mark.parametrize('challenge,retries', (
+    ('Digest realm="foo"', 6),
+    ('Digest realm="foo", stale=TRUE', 20),
+))
+def test_HTTPDigestAuthHandler_retries_per_request(mocker, challenge,
+                                                   retries):
+    mocker.patch.object(HTTPDigestAuthHandler, 'retry_http_digest_auth',
+                        return_value=None)
+    headers = {'www-authenticate': challenge}
+    handler = HTTPDigestAuthHandler()
+    req = urllib.request.Request('http://foo.bar/')
+    for _ in range(retries):
+        handler.http_error_401(req, MagicMock(), 401, 'msg', headers)
+    # Another request is not affected by the retries of the first
+    other = urllib.request.Request('http://foo.bar/')
+    assert handler.http_error_401(other, MagicMock(), 401, 'msg',
+                                  headers) is None
+    with pytest.raises(urllib.error.HTTPError) as excinfo:
+        handler.http_error_401(req, MagicMock(), 401, 'msg', headers)
+    assert excinfo.value.msg == 'digest auth failed'
+
+
+def handler():
+    passwd = urllib.request.HTTPPasswordMgrWithDefaultRealm()
+    passwd.add_password(None, 'foo.bar', 'user', 'pass')
+    return HTTPDigestAuthHandler(passwd)
+
+
+def params(auth):
+    return urllib.request.parse_keqv_list(
+        urllib.request.parse_http_list(auth)
+    )
+
+
+def test_authorization(mocker):
+    mocker.patch('os.urandom', return_value=b'\x00' * 8)
+    req = urllib.request.Request('http://foo.bar/baz?a=b')
+    auth = params(handler()._authorization(req, CHALLENGE, 3))
+    H = handler().get_algorithm_impls('MD5')[0]
+    assert auth == {
+        'username': 'user', 'realm': 'foo', 'nonce': 'bar',
+        'uri': '/baz?a=b', 'opaque': 'baz', 'algorithm': 'MD5',
+        'qop': 'auth', 'nc': '00000003', 'cnonce': '0000000000000000',
+        'response': H('%s:bar:00000003:0000000000000000:auth:%s' % (
+            H('user:foo:pass'), H('GET:/baz?a=b')
+        )),
+    }
+
+
+def test_authorization_without_qop():
+    req = urllib.request.Request('http://foo.bar/', data=b'data')
+    chal = {'realm': 'foo', 'nonce': 'bar', 'algorithm': 'SHA'}
+    auth = params(handler()._authorization(req, chal, 1))
+    H = handler().get_algorithm_impls('SHA')[0]
+    assert auth['response'] == H(
+        '%s:bar:%s' % (H('user:foo:pass'), H('POST:/'))
+    )
+    assert auth['algorithm'] == 'SHA'
+    for name in ('qop', 'nc', 'cnonce', 'opaque', 'digest'):
+        assert name not in auth
+
+
+def test_authorization_entity_digest(mocker):
+    h = handler()
+    mocker.patch.object(h, 'get_entity_digest', return_value='d')
+    req = urllib.request.Request('http://foo.bar/', data=b'data')
+    assert params(h._authorization(req, CHALLENGE, 1))['digest'] == 'd'
+
+
+@pytest.mark.parametrize('chal', (
+    {'nonce': 'bar'},
+    {'realm': 'foo'},
+    {'realm': 'foo', 'nonce': 'bar', 'algorithm': 'MD5-sess'},
+    {'realm': 'other', 'nonce': 'bar'},
+))
+def test_authorization_unusable(chal):
+    passwd = urllib.request.HTTPPasswordMgr()
+    passwd.add_password('foo', 'foo.bar', 'user', 'pass')
+    req = urllib.request.Request('http://foo.bar/')
+    assert HTTPDigestAuthHandler(passwd)._authorization(req, chal, 1) is None
+
+
+def test_authorization_unsupported_qop():
+    req = urllib.request.Request('http://foo.bar/')
+    chal = dict(CHALLENGE, qop='auth-int')
+    with pytest.raises(urllib.error.URLError):
+        handler()._authorization(req, chal, 1)
+
+
+def test_preemptive():
+    challenges = MagicMock()
+    h = handler()
+    h.challenges = challenges
+    challenges.next_nonce.return_value = (CHALLENGE, 1)
+    req = h.http_request(urllib.request.Request('http://foo.bar/'))
+    assert req.unredirected_hdrs['Authorization'].startswith('Digest ')
+
+    # Unusable challenges are not answered
+    challenges.next_nonce.return_value = ({'realm': 'foo'}, 1)
+    req = h.http_request(urllib.request.Request('http://foo.bar/'))
+    assert 'Authorization' not in req.unredirected_hdrs
+
+
+def test_get_authorization_without_challenges():
+    req = urllib.request.Request('http://foo.bar/')
+    auth = handler().get_authorization(req, CHALLENGE)
+    assert params(auth)['nc'] == '00000001'
@@ -0,0 +1,168 @@
+import http.client
+import io
+import socket
+import ssl
+from unittest.mock import MagicMock
+from unittest.mock import call
+from urllib.error import URLError
+from urllib.request import Request
+
+import pytest
+
+from requisitor.handlers import HTTPHandler
+from requisitor.handlers import HTTPSClientAuthHandler
+from requisitor.handlers import PooledHTTPResponse
+from requisitor.handlers import UnixHTTPHandler
+from requisitor.handlers import send_body
+from requisitor.pool import ConnectionPool
+
+
+class Sock:
+    def __init__(self, data):
+        self.data = data
+
+    def makefile(self, *args):
+        return io.BytesIO(self.data)
+
+    def sendall(self, data):
+        pass
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        pass
+
+
+def connection(data, error=None):
+    class Connection:
+        def __init__(self, host, timeout=None):
+            self._conn = http.client.HTTPConnection(host, timeout=timeout)
+            self._conn.sock = Sock(data)
+            if error:
+                self._conn.sock.sendall = MagicMock(side_effect=error)
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+        def __setattr__(self, name, value):
+            if name == '_conn':
+                return super().__setattr__(name, value)
+            setattr(self._conn, name, value)
+
+    return Connection
+
+
+def request(url='http://foo.bar/', method='GET', timeout=None):
+    req = Request(url, method=method)
+    req.timeout = timeout
+    return req
+
+
+def test_will_close():
+    pool = ConnectionPool()
+    h = HTTPHandler(pool=pool)
+    data = b'HTTP/1.1 200 OK\r\nConnection: close\r\n\r\nfoo'
+    r = h.do_open(connection(data), request())
+    assert isinstance(r, PooledHTTPResponse)
+    assert pool.size() == 0
+    assert r.read() == b'foo'
+
+
+def test_empty_body_released():
+    pool = ConnectionPool()
+    h = HTTPHandler(pool=pool)
+    data = b'HTTP/1.1 204 No Content\r\n\r\n'
+    req = request(timeout=socket._GLOBAL_DEFAULT_TIMEOUT)
+    r = h.do_open(connection(data), req)
+    assert r.isclosed()
+    assert pool.idle(h._pool_key(request())) == 1
+
+
+def test_early_close_discards():
+    pool = ConnectionPool()
+    h = HTTPHandler(pool=pool)
+    data = b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nfoo'
+    r = h.do_open(connection(data), request())
+    assert pool.size() == 1
+    r.close()
+    assert pool.size() == 0
+
+
+def test_no_host():
+    h = HTTPHandler(pool=ConnectionPool())
+    pytest.raises(URLError, h.do_open, MagicMock(), request('http:///foo'))
+
+
+def test_send_error():
+    pool = ConnectionPool()
+    h = HTTPHandler(pool=pool)
+    conn = connection(b'', error=socket.timeout)
+    pytest.raises(URLError, h.do_open, conn, request())
+    assert pool.size() == 0
+
+
+def test_stale_not_retried():
+    pool = ConnectionPool()
+    h = HTTPHandler(pool=pool)
+    conn = connection(b'', error=BrokenPipeError)
+    pytest.raises(BrokenPipeError, h.do_open, conn, request(method='POST'))
+    assert pool.size() == 0
+
+
+def test_tunnel_headers():
+    h = HTTPHandler()
+    req = request()
+    req.set_proxy('proxy:3128', 'http')
+    req._tunnel_host = 'foo.bar'
+    req.add_header('Proxy-Authorization', 'foo')
+    headers, tunnel_headers = h._request_headers(req)
+    assert 'Proxy-Authorization' not in headers
+    assert tunnel_headers == {'Proxy-Authorization': 'foo'}
+
+    conn = h._new_conn(http.client.HTTPConnection, req.host, req,
+                       tunnel_headers)
+    assert conn.host == 'proxy'
+    assert conn._tunnel_host == 'foo.bar'
+    assert conn._tunnel_headers == tunnel_headers
+
+    req.remove_header('Proxy-authorization')
+    assert h._request_headers(req)[1] == {}
+
+
+def test_pool_keys():
+    req = request('https://foo.bar/')
+    context = object()
+    h = HTTPSClientAuthHandler(context=context, client_cert='cert')
+    assert h._pool_key(req)[-3:] == (context, 'cert', None)
+    h = UnixHTTPHandler('/foo/bar')
+    assert h._pool_key(request())[-1] == '/foo/bar'
+
+
+def test_send_body_chunked():
+    sock = MagicMock()
+    send_body(sock, (c for c in (b'foo', b'', b'bar')), chunked=True,
+              chunk_size=2)
+    sock.sendall.assert_has_calls([
+        call(b'3\r\nfoo\r\n'), call(b'3\r\nbar\r\n'), call(b'0\r\n\r\n')
+    ])
+    sock.sendfile.assert_not_called()
+
+
+def test_send_body_sendfile(tmp_path):
+    path = tmp_path / 'body'
+    path.write_bytes(b'foobar')
+    sock = MagicMock()
+    with open(path, 'rb') as f:
+        f.read(3)
+        send_body(sock, f)
+        sock.sendfile.assert_called_once_with(f, 3)
+        sock.sendall.assert_not_called()
+
+        # Not for TLS sockets, or with chunked transfer encoding
+        for sock, chunked in ((MagicMock(spec=ssl.SSLSocket), False),
+                              (MagicMock(), True)):
+            f.seek(3)
+            send_body(sock, f, chunked=chunked)
+            sock.sendfile.assert_not_called()
+            assert b'bar' in sock.sendall.call_args_list[0][0][0]
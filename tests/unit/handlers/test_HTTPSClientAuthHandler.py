@@ -1,15 +1,34 @@
+import pathlib
+
 import pytest
 
+from requisitor.handlers import HTTPSClientAuthHandler
 from requisitor.session import Session
 
 
+fixtures = pathlib.Path(__file__).parent.parent / 'fixtures'
+
+
 def test_client_cert_auth(mocker):
-    conn = mocker.patch('http.client.HTTPSConnection',
+    conn = mocker.patch('requisitor.handlers.TimedHTTPSConnection',
                         side_effect=RuntimeError)
 
+    cert = (str(fixtures / 'cacert.pem'), str(fixtures / 'cakey.pem'))
     s = Session()
     with pytest.raises(RuntimeError):
-        s.request('GET', 'https://foo.bar', cert=('cert', 'key'))
+        s.request('GET', 'https://foo.bar', cert=cert)
+
+    args, kwargs = conn.call_args
+    assert kwargs['context'] is s._create_context(True, cert)
+    assert 'cert_file' not in kwargs
+    assert 'key_file' not in kwargs
+
+
+def test_client_cert_handler(mocker):
+    conn = mocker.patch('requisitor.handlers.TimedHTTPSConnection')
+
+    h = HTTPSClientAuthHandler(client_cert='cert', client_key='key')
+    h._build_https_connection('foo.bar')
 
     args, kwargs = conn.call_args
     assert kwargs['cert_file'] == 'cert'
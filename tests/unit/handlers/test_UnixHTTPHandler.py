@@ -4,7 +4,7 @@ from requisitor.session import Session
 
 
 def test_UnitHTTPHandler(mocker):
-    mocker.patch('urllib.request.HTTPHandler.do_open',
+    mocker.patch('requisitor.handlers.UnixHTTPHandler.do_open',
                  side_effect=RuntimeError)
     conn = mocker.patch('requisitor.handlers.UnixHTTPConnection')
 
@@ -0,0 +1,745 @@
+import asyncio
+import http.client
+import http.cookiejar
+import io
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+
+from requisitor.asyncsession import AsyncConnection
+from requisitor.asyncsession import AsyncConnectionPool
+from requisitor.asyncsession import AsyncHTTPResponse
+from requisitor.asyncsession import AsyncResponse
+from requisitor.asyncsession import AsyncSession
+from requisitor.auth import HTTPBearerAuth
+from requisitor.auth import HTTPDigestAuth
+from requisitor.errors import DeadlineExceeded
+from requisitor.errors import HTTPError
+from requisitor.errors import PoolError
+from requisitor.errors import UnrewindableBodyError
+from requisitor.response import ACCEPT_ENCODING
+from requisitor.response import ContentDecoder
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_get(server):
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.get(server.url + '/foo', params={'a': 'b'},
+                            headers={'X-Foo': 'bar'})
+            assert isinstance(r, AsyncResponse)
+            assert r.status_code == 200
+            assert r.headers['content-type'] == 'application/json'
+            data = r.json()
+            assert data['path'] == '/foo?a=b'
+            assert data['headers']['X-Foo'] == 'bar'
+            assert data['headers']['Host'] == server.url[7:]
+            assert data['headers']['Accept-Encoding'] == ACCEPT_ENCODING
+
+            r = await s.get(server.url, compression=False)
+            assert r.json()['headers']['Accept-Encoding'] == 'identity'
+
+    run(main())
+
+
+@pytest.mark.parametrize('method', ('post', 'put', 'patch'))
+def test_data(server, method):
+    async def main():
+        s = AsyncSession()
+        r = await getattr(s, method)(server.url, json={'foo': 'bar'})
+        data = r.json()
+        assert data['method'] == method.upper()
+        assert data['body'] == '{"foo": "bar"}'
+        assert data['headers']['Content-Type'] == 'application/json'
+        await s.close()
+
+    run(main())
+
+
+def test_send(server):
+    async def main():
+        async with AsyncSession() as s:
+            prepared = s.prepare('POST', server.url, json={'foo': 'bar'})
+            for _ in range(2):
+                data = (await s.send(prepared)).json()
+                assert data['method'] == 'POST'
+                assert data['body'] == '{"foo": "bar"}'
+
+    run(main())
+
+
+@pytest.mark.parametrize('method', ('options', 'delete', 'head'))
+def test_methods(server, method):
+    async def main():
+        async with AsyncSession() as s:
+            r = await getattr(s, method)(server.url)
+            assert r.status_code == 200
+
+    run(main())
+
+
+def test_keep_alive(server):
+    async def main():
+        async with AsyncSession() as s:
+            for _ in range(3):
+                assert (await s.get(server.url)).status_code == 200
+            await s.head(server.url)
+            await s.get(server.url + '/chunked')
+            await s.get(server.url)
+
+    run(main())
+    assert server.connections == 1
+
+
+def test_concurrent(server):
+    async def main():
+        async with AsyncSession() as s:
+            responses = await asyncio.gather(
+                *(s.get(server.url + '/%d' % i) for i in range(20))
+            )
+            for i, r in enumerate(responses):
+                assert r.json()['path'] == '/%d' % i
+
+    run(main())
+    assert server.connections <= 10
+
+
+def test_connection_close(server):
+    async def main():
+        async with AsyncSession() as s:
+            assert (await s.get(server.url + '/close')).text == 'closed'
+            assert (await s.get(server.url + '/close')).text == 'closed'
+
+    run(main())
+    assert server.connections == 2
+
+
+def test_without_pool(server):
+    async def main():
+        s = AsyncSession(pool=False)
+        assert s.pool is None
+        await s.get(server.url)
+        await s.get(server.url)
+        await s.close()
+
+    run(main())
+    assert server.connections == 2
+
+
+def test_stale_retry(server):
+    async def main():
+        async with AsyncSession() as s:
+            await s.get(server.url)
+            conn = next(iter(s.pool._idle.values()))[0]
+            conn.is_dropped = MagicMock(return_value=False)
+            sock = conn.writer.get_extra_info('socket')
+            sock.shutdown(socket.SHUT_WR)
+            await asyncio.sleep(0.05)
+            assert (await s.get(server.url)).status_code == 200
+
+    run(main())
+    assert server.connections == 2
+
+
+def test_stale_not_retried(server, mocker):
+    async def main():
+        async with AsyncSession() as s:
+            begin = mocker.patch.object(
+                AsyncHTTPResponse, 'begin',
+                side_effect=http.client.RemoteDisconnected('closed')
+            )
+            # Only requests on a reused connection are retried
+            with pytest.raises(http.client.RemoteDisconnected):
+                await s.get(server.url)
+            assert begin.call_count == 1
+            assert s.pool.size() == 0
+
+    run(main())
+
+
+def test_cancel(server):
+    async def main():
+        async with AsyncSession() as s:
+            task = asyncio.ensure_future(s.get(server.url + '/slow/1'))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            # The connection is discarded, rather than reused with the
+            # response still pending
+            assert s.pool.size() == 0
+            r = await s.get(server.url + '/foo')
+            assert r.json()['path'] == '/foo'
+
+    run(main())
+    assert server.connections == 2
+
+
+def test_chunked(server):
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.get(server.url + '/chunked')
+            assert r.bytes == b'foobar'
+
+    run(main())
+
+
+def test_gzip(server):
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.get(server.url + '/gzip')
+            assert r.json() == {'foo': 'bar'}
+
+            r = await s.get(server.url + '/gzip', stream=True)
+            assert await r.aread() == b'{"foo": "bar"}'
+            assert await r.aread() == b'{"foo": "bar"}'
+            assert r.json() == {'foo': 'bar'}
+
+    run(main())
+
+
+def test_gzip_stream(server, mocker):
+    mocker.patch.object(ContentDecoder, 'flush', return_value=b'!')
+
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.get(server.url + '/gzip', stream=True)
+            # The gzip header decodes to nothing, and is not yielded
+            chunks = [c async for c in r.aiter_content(4)]
+            assert all(chunks)
+            assert b''.join(chunks) == b'{"foo": "bar"}!'
+
+    run(main())
+
+
+def test_stream(server):
+    async def main():
+        async with AsyncSession() as s:
+            async with await s.get(server.url + '/chunked',
+                                   stream=True) as r:
+                pytest.raises(RuntimeError, getattr, r, 'bytes')
+                chunks = [c async for c in r.aiter_content(2)]
+                assert b''.join(chunks) == b'foobar'
+                assert len(chunks) > 1
+
+            r = await s.get(server.url, stream=True)
+            await r.aclose()
+            r = await s.get(server.url)
+            assert [c async for c in r.aiter_content(8)]
+
+    run(main())
+
+
+def test_redirect(server):
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.get(server.url + '/redirect/302/redirect/301/foo')
+            assert r.json()['path'] == '/foo'
+
+            r = await s.post(server.url + '/redirect/307/foo', data=b'foo')
+            assert r.json()['method'] == 'POST'
+            assert r.json()['body'] == 'foo'
+
+            r = await s.post(server.url + '/redirect/303/foo', data=b'foo')
+            assert r.json()['method'] == 'GET'
+
+            r = await s.get(server.url + '/redirect/302/foo',
+                            allow_redirects=False)
+            assert r.status_code == 302
+            assert r.headers['location'] == '/foo'
+
+            s.max_redirects = 1
+            with pytest.raises(HTTPError) as excinfo:
+                await s.get(server.url + '/redirect/302/redirect/302/foo')
+            assert excinfo.value.code == 302
+
+    run(main())
+
+
+def test_permanent_redirect(server):
+    async def main():
+        async with AsyncSession() as s:
+            url = server.url + '/redirect/308/foo'
+            r = await s.post(url, data=b'foo')
+            assert len(s.redirect_cache) == 1
+
+            # Sent straight to the target, without following a redirect
+            s.max_redirects = 0
+            r = await s.post(url, data=b'foo')
+            assert r.json()['path'] == '/foo'
+            assert r.json()['body'] == 'foo'
+
+    run(main())
+
+
+def test_http_error(server):
+    async def main():
+        async with AsyncSession() as s:
+            with pytest.raises(HTTPError) as excinfo:
+                await s.get(server.url + '/status/404')
+            assert excinfo.value.code == 404
+            assert excinfo.value.text == 'error'
+
+    run(main())
+
+
+def test_cookies(server):
+    async def main():
+        async with AsyncSession() as s:
+            await s.get(server.url + '/cookie')
+            assert [c.name for c in s.cookies] == ['foo']
+            r = await s.get(server.url)
+            assert r.json()['headers']['Cookie'] == 'foo=bar'
+
+            jar = http.cookiejar.CookieJar()
+            r = await s.get(server.url, cookies=jar)
+            assert 'Cookie' not in r.json()['headers']
+
+            # Disabled for a single request
+            r = await s.get(server.url, cookies=None)
+            assert 'Cookie' not in r.json()['headers']
+            s.cookies.clear()
+            await s.get(server.url + '/cookie', cookies=None)
+            assert len(s.cookies) == 0
+
+    run(main())
+
+
+def test_https(mocker):
+    kwargs = {}
+
+    async def open_connection(host, port, **kw):
+        kwargs.update(kw, host=host, port=port)
+        raise ConnectionRefusedError()
+
+    mocker.patch('asyncio.open_connection', open_connection)
+
+    async def main():
+        async with AsyncSession() as s:
+            with pytest.raises(urllib.error.URLError):
+                await s.get('https://foo.bar/')
+            assert kwargs['ssl'].check_hostname
+            assert (kwargs['host'], kwargs['port']) == ('foo.bar', 443)
+            assert kwargs['server_hostname'] == 'foo.bar'
+
+    run(main())
+
+
+def test_unix_socket(unix_server):
+    async def main():
+        async with AsyncSession() as s:
+            s.unix_socket = unix_server.path
+            r = await s.get('http://localhost/foo')
+            assert r.json()['path'] == '/foo'
+
+    run(main())
+
+
+def test_timeout(server, mocker):
+    async def main():
+        async with AsyncSession() as s:
+            async def readline(self):
+                await asyncio.sleep(1)
+
+            mocker.patch('asyncio.StreamReader.readline', readline)
+            with pytest.raises(socket.timeout):
+                await s.get(server.url, timeout=0.01)
+
+    run(main())
+
+
+def test_timeouts(server):
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.get(server.url + '/foo', timeout=(1, 5))
+            assert r.json()['path'] == '/foo'
+
+            with pytest.raises(socket.timeout) as excinfo:
+                await s.get(server.url + '/slow/0.5', timeout=(5, 0.05))
+            assert not isinstance(excinfo.value, DeadlineExceeded)
+
+            start = time.monotonic()
+            with pytest.raises(DeadlineExceeded):
+                await s.get(server.url + '/slow/1', deadline=0.1)
+            assert time.monotonic() - start < 0.5
+
+            # Across redirects, and reading a streamed body
+            with pytest.raises(DeadlineExceeded):
+                await s.get(server.url + '/redirect/302/slow/0.15',
+                            timeout=5, deadline=0.1)
+            r = await s.get(server.url + '/trickle/0.05', deadline=0.2,
+                            stream=True)
+            with pytest.raises(DeadlineExceeded):
+                await r.aread()
+
+            r = await s.get(server.url + '/trickle/0.01', deadline=2)
+            assert r.bytes == b'x' * 10
+
+    run(main())
+
+
+def test_connect_deadline(mocker):
+    async def open_connection(*args, **kwargs):
+        await asyncio.sleep(1)
+
+    mocker.patch('asyncio.open_connection', open_connection)
+
+    async def main():
+        async with AsyncSession() as s:
+            # Not wrapped in a URLError, unlike other connection errors
+            with pytest.raises(DeadlineExceeded):
+                await s.get('http://foo.bar/', deadline=0.05)
+            with pytest.raises(OSError) as excinfo:
+                await s.get('http://foo.bar/', timeout=(0.05, 5))
+            assert not isinstance(excinfo.value, DeadlineExceeded)
+
+    run(main())
+
+
+def test_connect_error(tmp_path):
+    async def main():
+        s = AsyncSession()
+        with pytest.raises(OSError):
+            await s.get('http://localhost/',
+                        unix_socket=str(tmp_path / 'missing'))
+        assert s.pool.size() == 0
+
+    run(main())
+
+
+def test_redirect_scheme(mocker):
+    async def main():
+        raw, release = response(
+            b'HTTP/1.1 302 Found\r\nLocation: ftp://foo.bar/\r\n'
+            b'Content-Length: 0\r\n\r\n'
+        )
+        await raw.begin()
+
+        async def send(self, req, options, timeouts):
+            return raw
+
+        mocker.patch.object(AsyncSession, '_send', send)
+        async with AsyncSession() as s:
+            with pytest.raises(HTTPError) as excinfo:
+                await s.get('http://foo.bar/')
+            assert excinfo.value.code == 302
+            assert excinfo.value.url == 'ftp://foo.bar/'
+
+    run(main())
+
+
+def test_errors():
+    async def main():
+        s = AsyncSession()
+        with pytest.raises(OSError):
+            await s.get('ftp://foo.bar/')
+        with pytest.raises(TypeError):
+            await s.post('http://foo.bar/', data='foo')
+        with pytest.raises(TypeError):
+            await s.post('http://foo.bar/', data=5)
+        with pytest.raises(ValueError):
+            await s.get('http://foo.bar/', headers={'foo': 'bar\r\nbaz'})
+        with pytest.raises(TypeError, match='HTTPDigestAuth'):
+            await s.get('http://foo.bar/', auth=HTTPDigestAuth('foo', 'bar'))
+
+    run(main())
+
+
+def test_bearer_auth(server):
+    calls = []
+
+    def fetch_token():
+        calls.append(threading.get_ident())
+        time.sleep(0.05)
+        return 't%d' % len(calls)
+
+    async def main():
+        async with AsyncSession() as s:
+            s.auth = HTTPBearerAuth(fetch_token)
+            url = server.url + '/bearer'
+            await asyncio.gather(*(s.get(url) for _ in range(5)))
+            assert len(calls) == 1
+            assert server.bearer == ['Bearer t1'] * 5
+
+            # Invalidated and retried once
+            del server.bearer[:]
+            server.token = 't2'
+            r = await s.get(url)
+            assert r.status_code == 200
+            assert server.bearer == ['Bearer t1', 'Bearer t2']
+
+            server.token = 'other'
+            with pytest.raises(HTTPError) as excinfo:
+                await s.get(url)
+            assert excinfo.value.code == 401
+
+    run(main())
+
+
+def test_bearer_auth_rules(server):
+    tokens = iter('t%d' % i for i in range(1, 10))
+
+    async def main():
+        async with AsyncSession() as s:
+            s.auth = HTTPBearerAuth(lambda: next(tokens))
+
+            # Added again after a redirect to the same host
+            r = await s.get(server.url + '/redirect/302/bearer')
+            assert r.status_code == 200
+            assert server.bearer == ['Bearer t1']
+
+            # The Authorization header of the caller is neither replaced,
+            # nor retried
+            del server.bearer[:]
+            with pytest.raises(HTTPError) as excinfo:
+                await s.get(server.url + '/bearer',
+                            headers={'Authorization': 'Basic abc'})
+            assert excinfo.value.code == 401
+            assert server.bearer == ['Basic abc']
+
+            # Only sent to the host the auth was prepared for
+            prepared = s.prepare('GET', server.url)
+            req = urllib.request.Request('http://other/')
+            await s._authorize(req, prepared)
+            assert not req.has_header('Authorization')
+
+    run(main())
+
+
+@pytest.mark.parametrize('path', ['/redirect/307/foo', '/bearer'])
+def test_body_resent(server, tmp_path, path):
+    body = tmp_path / 'body'
+    body.write_bytes(b'prefix' + b'x' * 1000)
+
+    def session():
+        s = AsyncSession(redirect_cache=False)
+        if path == '/bearer':
+            tokens = iter(('t0', 't1'))
+            s.auth = HTTPBearerAuth(lambda: next(tokens))
+        return s
+
+    async def main():
+        async with session() as s:
+            with open(str(body), 'rb') as f:
+                f.read(6)
+                r = await s.post(server.url + path, data=f)
+            assert r.json()['body'] == 'x' * 1000
+
+        async with session() as s:
+            with pytest.raises(UnrewindableBodyError):
+                await s.post(server.url + path,
+                             data=(b'foo%d' % i for i in range(3)))
+
+    run(main())
+
+
+def test_pool_full():
+    async def main():
+        pool = AsyncConnectionPool(max_per_host=1)
+        conn = MagicMock()
+
+        async def factory():
+            return conn
+
+        assert await pool.acquire('a', factory) == (conn, False)
+        with pytest.raises(PoolError):
+            await pool.acquire('a', factory)
+
+        pool.block = True
+        pool.timeout = 0.01
+        with pytest.raises(PoolError):
+            await pool.acquire('a', factory)
+
+        pool.timeout = None
+        loop = asyncio.get_event_loop()
+        loop.call_later(0.01, pool.release, 'a', conn, False)
+        assert await pool.acquire('a', factory) == (conn, False)
+
+    run(main())
+
+
+def test_pool_cancelled_waiter():
+    async def main():
+        pool = AsyncConnectionPool(max_per_host=1, block=True)
+        conn = MagicMock()
+        conn.is_dropped.return_value = False
+
+        async def factory():
+            return conn
+
+        assert await pool.acquire('a', factory) == (conn, False)
+        loop = asyncio.get_event_loop()
+        b = loop.create_task(pool.acquire('a', factory))
+        c = loop.create_task(pool.acquire('a', factory))
+        d = loop.create_task(pool.acquire('a', factory))
+        await asyncio.sleep(0)
+        d.cancel()
+        await asyncio.sleep(0)
+
+        # b is woken up, but cancelled before it can take the connection
+        pool.release('a', conn)
+        b.cancel()
+        assert await asyncio.wait_for(c, 1) == (conn, True)
+        for task in (b, d):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    run(main())
+
+
+def response(data, method='GET'):
+    reader = asyncio.StreamReader()
+    reader.feed_data(data)
+    reader.feed_eof()
+    conn = MagicMock(reader=reader)
+    release = MagicMock()
+    return AsyncHTTPResponse(conn, method, 'http://foo.bar/',
+                             release=release), release
+
+
+def test_AsyncHTTPResponse():
+    async def main():
+        raw, release = response(
+            b'HTTP/1.0 200 OK\r\nFoo: bar\r\nFoo: baz\r\n\r\nfoo'
+        )
+        pytest.raises(http.client.ResponseNotReady, raw.getheader, 'foo')
+        pytest.raises(http.client.ResponseNotReady, raw.getheaders)
+        await raw.begin()
+        assert raw.will_close
+        assert raw.code == raw.getcode() == 200
+        assert raw.msg == 'OK'
+        assert raw.geturl() == 'http://foo.bar/'
+        assert raw.info() is raw.headers
+        assert raw.getheader('foo') == 'bar, baz'
+        assert raw.getheader('missing', 'default') == 'default'
+        assert ('Foo', 'bar') in raw.getheaders()
+        pytest.raises(RuntimeError, raw.read)
+        assert await raw.aread(2) == b'fo'
+        assert await raw.aread() == b'o'
+        assert raw.isclosed()
+        assert await raw.aread() == b''
+        assert raw.read() == b''
+        release.assert_called_once_with(reusable=False)
+
+    run(main())
+
+
+def test_AsyncHTTPResponse_chunked():
+    async def main():
+        raw, release = response(
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'3\r\nfoo\r\n0\r\nFoo: bar\r\n\r\n'
+        )
+        await raw.begin()
+        assert not raw.will_close
+        assert await raw.aread(2) == b'fo'
+        assert await raw.aread() == b'o'
+        assert raw.isclosed()
+        release.assert_called_once_with(reusable=True)
+
+        raw, release = response(
+            b'HTTP/1.1 200 OK\r\nContent-Length: 3\r\n\r\nfoo'
+        )
+        await raw.begin()
+        assert await raw.aread(2) == b'fo'
+        assert not raw.isclosed()
+        await raw.load()
+        await raw.load()
+        assert await raw.aread() == b'o'
+        assert raw.read() == b''
+        release.assert_called_once_with(reusable=True)
+
+    run(main())
+
+
+def test_AsyncHTTPResponse_without_release():
+    async def main():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'HTTP/1.1 204 No Content\r\n\r\n')
+        writer = MagicMock()
+        writer.is_closing.return_value = True
+        conn = AsyncConnection(reader, writer)
+        assert conn.sock is None
+        raw = AsyncHTTPResponse(conn, 'GET', 'http://foo.bar/')
+        await raw.begin()
+        assert raw.isclosed()
+        raw.close()
+
+    run(main())
+
+
+@pytest.mark.parametrize('data,exc', [
+    (b'', http.client.RemoteDisconnected),
+    (b'foo\r\n', http.client.BadStatusLine),
+    (b'FOO/1.1 200 OK\r\n', http.client.BadStatusLine),
+    (b'HTTP/1.1 200 OK\r\nFoo: ' + b'a' * 70000 + b'\r\n\r\n',
+     http.client.LineTooLong),
+    (b'HTTP/1.1 foo\r\n', http.client.BadStatusLine),
+    (b'HTTP/1.1 200 OK\r\n' + b'Foo: bar\r\n' * 101,
+     http.client.HTTPException),
+    (b'HTTP/1.1 200 OK\r\nContent-Length: 5\r\n\r\nfoo',
+     http.client.IncompleteRead),
+    (b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\nfoo\r\n',
+     http.client.IncompleteRead),
+])
+def test_AsyncHTTPResponse_errors(data, exc):
+    async def main():
+        raw, release = response(data)
+        with pytest.raises(exc):
+            await raw.begin()
+            await raw.aread()
+
+    run(main())
+
+
+def test_AsyncHTTPResponse_continue():
+    async def main():
+        raw, release = response(
+            b'HTTP/1.1 100 Continue\r\n\r\n'
+            b'HTTP/1.1 200 OK\r\nContent-Length: bad\r\n\r\nfoo'
+        )
+        await raw.begin()
+        assert raw.status == 200
+        assert raw.length is None
+        assert await raw.aread() == b'foo'
+
+    run(main())
+
+
+def test_files(server):
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.post(server.url, files={'a': 'b', 'c': {
+                'content': b'\x00\x01', 'file': 'c.bin'}})
+            data = r.json()
+            assert int(data['headers']['Content-Length']) == len(data['body'])
+            assert '\r\n\r\n\x00\x01\r\n' in data['body']
+            assert data['headers']['Content-Type'].startswith(
+                'multipart/form-data; boundary='
+            )
+
+    run(main())
+
+
+def test_streaming_body(server):
+    async def main():
+        async with AsyncSession() as s:
+            r = await s.post(server.url, data=(b'foo%d' % i for i in range(3)))
+            data = r.json()
+            assert data['headers']['Transfer-Encoding'] == 'chunked'
+            assert data['body'] == 'foo0foo1foo2'
+
+            r = await s.post(server.url, data=io.BytesIO(b'foobar'))
+            data = r.json()
+            assert data['headers']['Content-Length'] == '6'
+            assert data['body'] == 'foobar'
+
+    run(main())
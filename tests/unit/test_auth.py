@@ -1,11 +1,20 @@
+import asyncio
+import concurrent.futures
+import itertools
+import threading
+import time
+import urllib.error
 from urllib.parse import urlparse
 from urllib.request import HTTPDigestAuthHandler
+from urllib.request import Request
 
 import pytest
 
 from requisitor.auth import HTTPBasicAuth
+from requisitor.auth import HTTPBearerAuth
 from requisitor.auth import HTTPDigestAuth
 from requisitor.auth import validate_auth
+from requisitor.session import Session
 
 
 @pytest.mark.parametrize(
@@ -38,3 +47,233 @@ def test_HTTPDigestAuth():
         HTTPDigestAuth('user', 'pass')(urlparse(''))['handlers'][0],
         HTTPDigestAuthHandler
     )
+
+
+def test_HTTPDigestAuth_nonce_count():
+    auth = HTTPDigestAuth('user', 'pass')
+    assert auth.next_nonce('origin') is None
+
+    assert auth.set_challenge('origin', {'nonce': 'a'}) == ({'nonce': 'a'}, 1)
+    assert auth.next_nonce('origin') == ({'nonce': 'a'}, 2)
+    # The same nonce keeps counting
+    assert auth.set_challenge('origin', {'nonce': 'a'}) == ({'nonce': 'a'}, 3)
+    assert auth.next_nonce('origin') == ({'nonce': 'a'}, 4)
+    assert auth.set_challenge('origin', {'nonce': 'b'}) == ({'nonce': 'b'}, 1)
+    assert auth.next_nonce('origin') == ({'nonce': 'b'}, 2)
+    assert auth.next_nonce('other') is None
+
+    auth.clear()
+    assert auth.next_nonce('origin') is None
+
+
+def test_HTTPDigestAuth_threads():
+    auth = HTTPDigestAuth('user', 'pass')
+    auth.set_challenge('origin', {'nonce': 'a'})
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        counts = list(executor.map(
+            lambda _: auth.next_nonce('origin')[1], range(200)
+        ))
+    assert sorted(counts) == list(range(2, 202))
+
+
+def test_HTTPDigestAuth_preemptive(server):
+    with Session() as s:
+        s.auth = HTTPDigestAuth('user', 'pass')
+        url = server.url + '/digest'
+        for _ in range(3):
+            s.get(url).bytes
+        # Only the first request waits for a challenge
+        assert server.digest == [None, '00000001', '00000002', '00000003']
+        assert server.connections == 1
+
+        # A stale nonce is retried with the new one
+        del server.digest[:]
+        server.nonce = 'n2'
+        assert s.get(url).status == 200
+        assert s.get(url).status == 200
+        assert server.digest == [False, '00000001', '00000002']
+
+        # Credentials are per origin
+        del server.digest[:]
+        assert s.get(url.replace('127.0.0.1', 'localhost')).status == 200
+        assert server.digest == [None, '00000001']
+
+
+def test_HTTPDigestAuth_concurrent(server):
+    # The nonce expires every 20 requests, while 16 threads share the
+    # session's Digest handler
+    lock = threading.Lock()
+    count = itertools.count(1)
+
+    def get(_):
+        with lock:
+            n = next(count)
+            if not n % 20:
+                server.nonce = 'n%d' % n
+        return s.get(url).status_code
+
+    with Session() as s:
+        s.auth = HTTPDigestAuth('user', 'pass')
+        url = server.url + '/digest'
+        with concurrent.futures.ThreadPoolExecutor(16) as executor:
+            assert list(executor.map(get, range(400))) == [200] * 400
+
+
+def test_HTTPDigestAuth_rejected(server):
+    with Session() as s:
+        s.auth = HTTPDigestAuth('user', 'wrong')
+        # Retried until urllib gives up
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            s.get(server.url + '/digest')
+        assert excinfo.value.code == 401
+        assert server.digest == [None] * 7
+
+
+class Tokens:
+    def __init__(self, expires_in=None, delay=0):
+        self.expires_in = expires_in
+        self.delay = delay
+        self.calls = 0
+        self.error = None
+
+    def __call__(self):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return 't%d' % self.calls, self.expires_in
+
+
+def test_HTTPBearerAuth(mocker):
+    tokens = Tokens(expires_in=120)
+    auth = HTTPBearerAuth(tokens, refresh_margin=60)
+    assert auth.token() == 't1'
+    assert auth.token() == 't1'
+    assert tokens.calls == 1
+
+    # Refreshed in the background shortly before it expires
+    now = time.monotonic()
+    mocker.patch('time.monotonic', return_value=now + 90)
+    thread = mocker.spy(threading, 'Thread')
+    assert auth.token() == 't1'
+    thread.spy_return.join()
+    assert auth.token() == 't2'
+    assert thread.call_count == 1
+
+    # Expired, fetched in the foreground
+    mocker.patch('time.monotonic', return_value=now + 500)
+    assert auth.token() == 't3'
+
+    auth.invalidate('other')
+    assert auth.token() == 't3'
+    auth.invalidate('t3')
+    assert auth.token() == 't4'
+
+    tokens.error = ValueError('no token')
+    auth.invalidate()
+    with pytest.raises(ValueError):
+        auth.token()
+
+    auth = HTTPBearerAuth(lambda: 'forever')
+    assert auth.token() == 'forever'
+
+    # Only sent to the host it was given for
+    handler, = auth(urlparse('http://foo.bar/'))['handlers']
+    req = handler.http_request(Request('http://foo.bar/baz'))
+    assert req.get_header('Authorization') == 'Bearer forever'
+    req = handler.http_request(Request('http://other/baz'))
+    assert not req.has_header('Authorization')
+
+    # Credentials set by the caller are neither replaced, nor retried
+    req = handler.http_request(Request('http://foo.bar/baz', headers={
+        'Authorization': 'Basic Zm9vOmJhcg=='
+    }))
+    assert req.get_header('Authorization') == 'Basic Zm9vOmJhcg=='
+    assert handler.http_error_401(req, None, 401, 'Unauthorized',
+                                  {}) is None
+
+
+def test_HTTPBearerAuth_refresh_margin(mocker):
+    with pytest.raises(ValueError):
+        HTTPBearerAuth(Tokens(), refresh_margin=-1)
+
+    # Capped at half the lifetime, rather than refreshing on every call
+    tokens = Tokens(expires_in=30)
+    auth = HTTPBearerAuth(tokens, refresh_margin=60)
+    thread = mocker.spy(threading, 'Thread')
+    assert auth.token() == 't1'
+    assert auth.token() == 't1'
+    assert thread.call_count == 0
+
+    now = time.monotonic()
+    mocker.patch('time.monotonic', return_value=now + 16)
+    assert auth.token() == 't1'
+    thread.spy_return.join()
+    assert auth.token() == 't2'
+    assert thread.call_count == 1
+    assert tokens.calls == 2
+
+    # A failed background refresh keeps the current token in use
+    tokens.error = ValueError('no token')
+    mocker.patch('time.monotonic', return_value=now + 32)
+    assert auth.token() == 't2'
+    thread.spy_return.join()
+    assert tokens.calls == 3
+    assert auth.token() == 't2'
+
+
+def test_HTTPBearerAuth_atoken(mocker):
+    tokens = Tokens(expires_in=120)
+    auth = HTTPBearerAuth(tokens)
+    spy = mocker.spy(auth, 'token')
+
+    # Fetched in an executor, then reused without one
+    assert asyncio.run(auth.atoken()) == 't1'
+    assert spy.call_count == 1
+    assert asyncio.run(auth.atoken()) == 't1'
+    assert spy.call_count == 1
+    assert tokens.calls == 1
+
+    auth.invalidate()
+    assert asyncio.run(auth.atoken()) == 't2'
+    assert spy.call_count == 2
+
+
+def test_HTTPBearerAuth_single_flight():
+    tokens = Tokens(delay=0.05)
+    auth = HTTPBearerAuth(tokens)
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        results = list(executor.map(lambda _: auth.token(), range(8)))
+    assert results == ['t1'] * 8
+    assert tokens.calls == 1
+
+    # Waiters see the error of the fetch they waited for
+    tokens.error = ValueError('no token')
+    auth.invalidate()
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(auth.token) for _ in range(4)]
+    assert all(isinstance(f.exception(), ValueError) for f in futures)
+    assert tokens.calls == 2
+
+
+def test_HTTPBearerAuth_session(server):
+    tokens = Tokens()
+    with Session() as s:
+        s.auth = HTTPBearerAuth(tokens)
+        url = server.url + '/bearer'
+        s.get(url).bytes
+        s.get(url).bytes
+        assert server.bearer == ['Bearer t1', 'Bearer t1']
+
+        # Invalidated and retried once
+        del server.bearer[:]
+        server.token = 't2'
+        s.get(url).bytes
+        assert server.bearer == ['Bearer t1', 'Bearer t2']
+
+        del server.bearer[:]
+        server.token = 'other'
+        with pytest.raises(urllib.error.HTTPError) as excinfo:
+            s.get(url)
+        assert excinfo.value.code == 401
+        assert server.bearer == ['Bearer t2', 'Bearer t3']
@@ -0,0 +1,386 @@
+import http.client
+import io
+import os
+import time
+import urllib.request
+
+import pytest
+
+from requisitor.cache import BaseCache
+from requisitor.cache import CacheEntry
+from requisitor.cache import CacheHandler
+from requisitor.cache import CachedResponse
+from requisitor.cache import FileCache
+from requisitor.cache import MemoryCache
+from requisitor.cache import current_age
+from requisitor.cache import freshness_lifetime
+from requisitor.cache import parse_cache_control
+from requisitor.errors import HTTPError
+from requisitor.session import Session
+
+
+def entry(headers=(), body=b'foo', status=200, response_time=1000,
+          vary=None):
+    return CacheEntry(
+        url='http://foo.bar/', status=status, reason='OK', version=11,
+        headers=list(headers), body=body, vary=vary or {},
+        request_time=response_time, response_time=response_time,
+    )
+
+
+class FakeResponse(io.BytesIO):
+    def __init__(self, body=b'foo', status=200, headers=()):
+        super().__init__(body)
+        self.status = status
+        self.reason = 'OK'
+        self.version = 11
+        self.length = len(body)
+        self.headers = http.client.HTTPMessage()
+        for name, value in headers:
+            self.headers[name] = value
+
+    def isclosed(self):
+        return self.closed
+
+
+def request(method='GET', headers=None, url='http://foo.bar/'):
+    return urllib.request.Request(url, method=method, headers=headers or {})
+
+
+def test_parse_cache_control():
+    assert parse_cache_control(None) == {}
+    assert parse_cache_control('Max-Age=60, no-cache, private="foo"') == {
+        'max-age': '60', 'no-cache': None, 'private': 'foo',
+    }
+    assert parse_cache_control('no-store,, ') == {'no-store': None}
+
+
+@pytest.mark.parametrize('headers,expected', [
+    ((), 0),
+    ((('Cache-Control', 'max-age=60'),), 60),
+    ((('Cache-Control', 'max-age=60, no-cache'),), 0),
+    ((('Cache-Control', 'max-age=foo'),), 0),
+    ((('Date', 'Thu, 01 Jan 1970 00:00:00 GMT'),
+      ('Expires', 'Thu, 01 Jan 1970 00:01:00 GMT')), 60),
+    ((('Expires', '0'),), 0),
+    ((('Date', 'Thu, 01 Jan 1970 00:16:40 GMT'),
+      ('Last-Modified', 'Thu, 01 Jan 1970 00:00:00 GMT')), 100),
+])
+def test_freshness_lifetime(headers, expected):
+    assert freshness_lifetime(entry(headers)) == expected
+
+
+def test_parse_date_error(mocker):
+    mocker.patch('email.utils.parsedate_tz', side_effect=ValueError)
+    assert freshness_lifetime(entry([('Expires', 'foo')])) == 0
+
+
+def test_current_age():
+    e = entry([('Age', '10')])
+    assert current_age(e, now=1005) == 15
+    e = entry([('Date', 'Thu, 01 Jan 1970 00:16:20 GMT')])
+    assert current_age(e, now=1000) == 20
+
+
+def test_memory_cache_bounds():
+    cache = MemoryCache(max_entries=2, max_bytes=10)
+    cache.set('a', entry(body=b'a' * 4))
+    cache.set('b', entry(body=b'b' * 4))
+    cache.get('a')
+    cache.set('c', entry(body=b'c' * 4))
+    assert cache.get('b') is None
+    assert len(cache) == 2
+    assert cache.size == 8
+
+    cache.set('d', entry(body=b'd' * 8))
+    assert cache.get('a') is None and cache.get('c') is None
+    assert cache.size == 8
+
+    cache.set('e', entry(body=b'e' * 11))
+    assert cache.get('e') is None
+
+    cache.delete('d')
+    assert len(cache) == 0 and cache.size == 0
+
+    cache.set('f', entry())
+    cache.clear()
+    assert len(cache) == 0 and cache.size == 0
+
+
+def test_memory_cache_unbounded_size():
+    cache = MemoryCache(max_entries=2, max_bytes=None)
+    for key in 'abc':
+        cache.set(key, entry(body=b'x' * 1024))
+    assert len(cache) == 2
+    assert cache.size == 2048
+    assert cache.get('a') is None
+
+
+def test_base_cache():
+    cache = BaseCache()
+    pytest.raises(NotImplementedError, cache.get, 'a')
+    pytest.raises(NotImplementedError, cache.set, 'a', entry())
+    pytest.raises(NotImplementedError, cache.delete, 'a')
+    pytest.raises(NotImplementedError, cache.clear)
+
+
+def test_file_cache(tmp_path):
+    cache = FileCache(tmp_path / 'cache', max_bytes=10)
+    e = entry([('ETag', '"v1"')])
+    cache.set('http://foo.bar/', e)
+    assert FileCache(tmp_path / 'cache').get('http://foo.bar/') == e
+    assert cache.get('http://foo.bar/baz') is None
+
+    cache.set('big', entry(body=b'x' * 11))
+    assert cache.get('big') is None
+
+    cache.clear()
+    assert cache.get('http://foo.bar/') is None
+
+
+def test_file_cache_eviction(tmp_path, mocker):
+    cache = FileCache(tmp_path)
+    cache.set('foo', entry())
+    tmp_path.joinpath('other').write_bytes(b'')
+    cache.clear()
+    assert os.listdir(tmp_path) == ['other']
+
+    # Removed concurrently
+    cache.delete('foo')
+    mocker.patch('os.listdir', return_value=[cache._path('foo')[-64:]])
+    cache.clear()
+
+
+def test_file_cache_write_error(tmp_path, mocker):
+    cache = FileCache(tmp_path)
+    mocker.patch('os.replace', side_effect=OSError)
+    pytest.raises(OSError, cache.set, 'foo', entry())
+    assert os.listdir(tmp_path) == []
+
+
+def test_file_cache_key_collision(tmp_path):
+    cache = FileCache(tmp_path)
+    cache.set('foo', entry())
+    os.replace(cache._path('foo'), cache._path('bar'))
+    assert cache.get('bar') is None
+
+
+def test_file_cache_corrupt(tmp_path):
+    cache = FileCache(tmp_path)
+    cache.set('foo', entry())
+    path = cache._path('foo')
+    with open(path, 'wb') as f:
+        f.write(b'not json\n')
+    assert cache.get('foo') is None
+    assert not tmp_path.joinpath(path).exists()
+
+
+@pytest.mark.parametrize('cache', [
+    MemoryCache(), 'file',
+])
+def test_session_cache(server, cache, tmp_path):
+    if cache == 'file':
+        cache = FileCache(tmp_path)
+
+    with Session(cache=cache) as s:
+        url = server.url + '/cache/60'
+        r = s.get(url)
+        assert not r.from_cache
+        assert r.bytes == b'cached'
+
+        r = s.get(url)
+        assert r.from_cache
+        assert r.bytes == b'cached'
+        assert r.headers['etag'] == '"v1"'
+        assert server.hits == 1
+
+        # Vary
+        r = s.get(url, headers={'X-Variant': 'a'})
+        assert not r.from_cache
+        assert r.bytes == b'cacheda'
+        assert s.get(url, headers={'X-Variant': 'a'}).from_cache
+        assert server.hits == 2
+
+        # Request directives
+        assert not s.get(url, headers={'Cache-Control': 'no-store'}).from_cache
+        assert server.hits == 3
+
+
+def test_session_cache_revalidate(server):
+    cache = MemoryCache()
+    with Session(cache=cache) as s:
+        url = server.url + '/cache/0'
+        assert s.get(url).bytes == b'cached'
+        stored = cache.get(url)
+
+        time.sleep(0.01)
+        r = s.get(url)
+        assert r.from_cache
+        assert r.status_code == 200
+        assert r.bytes == b'cached'
+        assert server.hits == 2
+        assert cache.get(url).response_time > stored.response_time
+
+        # A caller's own conditional request is passed through
+        with pytest.raises(HTTPError) as e:
+            s.get(url, headers={'If-None-Match': '"v1"'})
+        assert e.value.code == 304
+
+
+def test_session_cache_not_stored(server):
+    cache = MemoryCache()
+    with Session(cache=cache) as s:
+        s.get(server.url).bytes
+        s.post(server.url + '/cache/60').bytes
+        assert len(cache) == 0
+
+        # Unread bodies are not stored
+        s.get(server.url + '/cache/60').close()
+        assert len(cache) == 0
+
+        s.get(server.url + '/cache/60').bytes
+        assert len(cache) == 1
+
+        # Unsafe methods invalidate
+        s.delete(server.url + '/cache/60').bytes
+        assert len(cache) == 0
+
+
+def test_cached_response():
+    r = CachedResponse(entry([('Age', '5'), ('Foo', 'bar')]),
+                       'http://foo.bar/', age=10)
+    assert r.info() is r.headers
+    assert r.geturl() == 'http://foo.bar/'
+    assert r.getheader('age') == '10'
+    assert r.getheader('missing', 'default') == 'default'
+    assert r.getheaders() == [('Foo', 'bar'), ('Age', '10')]
+    assert not r.isclosed()
+    assert r.read() == b'foo'
+
+
+def test_handler_tee():
+    cache = MemoryCache()
+    handler = CacheHandler(cache, namespace='/tmp/sock')
+    req = request()
+    handler.http_open(req)
+    r = handler.http_response(req, FakeResponse(
+        b'foobar', headers=[('Cache-Control', 'max-age=60'),
+                            ('Vary', 'Accept, ,X-Foo')]
+    ))
+    key = '/tmp/sock|http://foo.bar/'
+    buf = bytearray(4)
+    assert r.readinto(buf) == 4 and buf == b'foob'
+    assert cache.get(key) is None
+    assert r.read(4) == b'ar'
+    assert cache.get(key) is None
+    assert r.read(4) == b''
+    assert cache.get(key).body == b'foobar'
+    assert cache.get(key).vary == {'accept': None, 'x-foo': None}
+    assert r.read() == b''
+
+
+def test_handler_tee_max_bytes():
+    cache = MemoryCache(max_bytes=4)
+    handler = CacheHandler(cache)
+    headers = [('Cache-Control', 'max-age=60')]
+
+    # The length is known up front
+    response = FakeResponse(b'foobar', headers=headers)
+    assert handler.http_response(request(), response) is response
+
+    # A chunked body grows past max_bytes while being read
+    response.length = None
+    response.seek(0)
+    r = handler.http_response(request(), response)
+    assert r.read(4) == b'foob'
+    assert r.read(4) == b'ar'
+    assert r.read() == b''
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize('req_headers,resp_headers', [
+    ({}, [('Cache-Control', 'no-store, max-age=60')]),
+    ({}, [('Cache-Control', 'max-age=60'), ('Vary', '*')]),
+    ({'Cache-Control': 'no-store'}, [('Cache-Control', 'max-age=60')]),
+    ({}, [('Content-Type', 'text/plain')]),
+])
+def test_handler_no_store(req_headers, resp_headers):
+    cache = MemoryCache()
+    handler = CacheHandler(cache)
+    req = request(headers=req_headers)
+    response = FakeResponse(headers=resp_headers)
+    assert handler.http_response(req, response) is response
+    assert response.read() == b'foo'
+    assert len(cache) == 0
+
+
+def test_handler_unsafe_method():
+    cache = MemoryCache()
+    handler = CacheHandler(cache)
+    cache.set('http://foo.bar/', entry())
+    handler.http_response(request('POST'), FakeResponse(status=500))
+    assert len(cache) == 1
+    handler.http_response(request('POST'), FakeResponse(status=201))
+    assert len(cache) == 0
+
+
+@pytest.mark.parametrize('headers,expected', [
+    ([('Cache-Control', 'max-age=60')], True),
+    ([('Cache-Control', 'max-age=60'), ('X-Foo', 'baz')], False),
+    ([('Pragma', 'no-cache')], False),
+    ([('Cache-Control', 'max-age=0')], False),
+    ([('Cache-Control', 'max-age=30')], True),
+])
+def test_handler_open(headers, expected):
+    cache = MemoryCache()
+    handler = CacheHandler(cache)
+    cache.set('http://foo.bar/', entry(
+        [('Cache-Control', 'max-age=60')], vary={'x-foo': 'bar'},
+        response_time=time.time() - 1,
+    ))
+    req = request(headers={'X-Foo': 'bar'})
+    for name, value in headers:
+        req.add_header(name, value)
+    r = handler.http_open(req)
+    assert isinstance(r, CachedResponse) is expected
+    assert req._cache_entry is None
+
+
+@pytest.mark.parametrize('headers,conditional', [
+    ([], {}),
+    ([('ETag', '"v1"')], {'If-none-match': '"v1"'}),
+    ([('Last-Modified', 'Thu, 01 Jan 1970 00:00:00 GMT')],
+     {'If-modified-since': 'Thu, 01 Jan 1970 00:00:00 GMT'}),
+])
+def test_handler_revalidate(headers, conditional):
+    cache = MemoryCache()
+    handler = CacheHandler(cache)
+    stored = entry([('Cache-Control', 'max-age=0'), ('Content-Length', '3'),
+                    ('X-Old', 'old'), ('X-Same', 'old')] + headers)
+    cache.set('http://foo.bar/', stored)
+    req = request()
+    assert handler.http_open(req) is None
+    assert req.unredirected_hdrs == conditional
+    if not conditional:
+        assert req._cache_entry is None
+        return
+    assert req._cache_entry is stored
+
+    # A 304 is merged into the stored entry, except the headers describing
+    # the stored content
+    response = FakeResponse(b'', status=304, headers=[
+        ('Cache-Control', 'max-age=60'), ('Content-Length', '0'),
+        ('X-Same', 'new'),
+    ])
+    r = handler.http_response(req, response)
+    assert isinstance(r, CachedResponse)
+    assert response.closed
+    assert r.read() == b'foo'
+    assert r.headers['content-length'] == '3'
+    assert r.headers['x-old'] == 'old'
+    assert r.headers['x-same'] == 'new'
+    assert r.headers['cache-control'] == 'max-age=60'
+    assert cache.get('http://foo.bar/').headers == [
+        (n, v) for n, v in r.headers.items() if n != 'Age'
+    ]
+    assert handler.http_response(req, r) is r
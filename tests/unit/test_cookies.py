@@ -0,0 +1,169 @@
+import copy
+import email.message
+import http.cookiejar
+import time
+import urllib.request
+
+import pytest
+
+from requisitor.cookies import CookieJar
+from requisitor.session import Session
+
+
+class FakeResponse:
+    def __init__(self, *set_cookies):
+        self._headers = email.message.Message()
+        for value in set_cookies:
+            self._headers['Set-Cookie'] = value
+
+    def info(self):
+        return self._headers
+
+
+def set_cookies(jar, url, *set_cookies):
+    jar.extract_cookies(FakeResponse(*set_cookies),
+                        urllib.request.Request(url))
+
+
+def cookie_header(jar, url):
+    req = urllib.request.Request(url)
+    jar.add_cookie_header(req)
+    return req.unredirected_hdrs.get('Cookie')
+
+
+URLS = (
+    'http://example.com/',
+    'http://www.example.com/',
+    'http://a.b.example.com/path/',
+    'http://fooexample.com/',
+    'http://example.org/',
+    'http://localhost/',
+    'http://127.0.0.1/',
+)
+
+
+@pytest.mark.parametrize('url', URLS)
+def test_matches_stdlib(url):
+    jars = (CookieJar(), http.cookiejar.CookieJar())
+    for jar in jars:
+        set_cookies(jar, 'http://www.example.com/', 'host=1',
+                    'domain=2; Domain=example.com', 'path=3; Path=/path')
+        set_cookies(jar, 'http://a.b.example.com/path/', 'sub=4; Path=/')
+        set_cookies(jar, 'http://example.com/', 'apex=5')
+        set_cookies(jar, 'http://localhost/', 'local=6')
+        set_cookies(jar, 'http://127.0.0.1/', 'ip=7')
+    assert len(jars[0]) == len(jars[1]) == 7
+    # Cookies are ordered by path length, the order of cookies with
+    # paths of the same length differs
+    expected = cookie_header(jars[1], url)
+    header = cookie_header(jars[0], url)
+    if expected is None:
+        assert header is None
+    else:
+        assert sorted(header.split('; ')) == sorted(expected.split('; '))
+
+
+def test_only_relevant_domains(mocker):
+    jar = CookieJar()
+    for i in range(20):
+        set_cookies(jar, 'http://host%d.example.org/' % i, 'foo=bar')
+    set_cookies(jar, 'http://foo.bar/', 'baz=qux')
+
+    spy = mocker.spy(jar, '_cookies_for_domain')
+    assert cookie_header(jar, 'http://foo.bar/') == 'baz=qux'
+    assert [c[0][0] for c in spy.call_args_list] == ['foo.bar']
+
+
+def test_fast_paths(mocker):
+    jar = CookieJar()
+    make_cookies = mocker.spy(jar, 'make_cookies')
+    set_cookies(jar, 'http://foo.bar/')
+    assert make_cookies.call_count == 0
+
+    clear_expired = mocker.spy(jar, 'clear_expired_cookies')
+    assert cookie_header(jar, 'http://foo.bar/') is None
+    assert clear_expired.call_count == 0
+
+
+def test_expiry():
+    jar = CookieJar()
+    now = time.time()
+    set_cookies(jar, 'http://foo.bar/', 'a=1; Max-Age=3600', 'b=2',
+                'c=3; Max-Age=7200')
+    assert jar._next_expiry == pytest.approx(now + 3600, abs=5)
+
+    for cookie in jar:
+        if cookie.name == 'a':
+            cookie.expires = int(now) - 1
+    jar._next_expiry = int(now) - 1
+
+    assert cookie_header(jar, 'http://foo.bar/') == 'b=2; c=3'
+    assert sorted(c.name for c in jar) == ['b', 'c']
+    assert jar._next_expiry == pytest.approx(now + 7200, abs=5)
+
+    jar.clear('foo.bar', '/', 'c')
+    jar.clear_expired_cookies(force=True)
+    assert len(jar) == 1
+    assert jar._next_expiry is None
+
+    set_cookies(jar, 'http://foo.bar/', 'b=2; Max-Age=0')
+    assert len(jar) == 0
+    assert jar._cookies == {}
+
+
+def test_size_bound():
+    jar = CookieJar(max_cookies=5, max_cookies_per_domain=3)
+    for i in range(5):
+        set_cookies(jar, 'http://foo.bar/', 'c%d=%d' % (i, i))
+    assert sorted(c.name for c in jar) == ['c2', 'c3', 'c4']
+
+    # Setting an existing cookie again makes it the most recent
+    set_cookies(jar, 'http://foo.bar/', 'c2=new')
+    set_cookies(jar, 'http://foo.bar/', 'c5=5')
+    assert sorted(c.name for c in jar) == ['c2', 'c4', 'c5']
+
+    for host in ('a', 'b', 'c'):
+        set_cookies(jar, 'http://%s.baz/' % host, 'x=1')
+    assert len(jar) == 5
+    assert sorted(c.domain for c in jar) == [
+        'a.baz', 'b.baz', 'c.baz', 'foo.bar', 'foo.bar'
+    ]
+
+    # An expired cookie is discarded while making room for it
+    cookie = copy.copy(next(iter(jar)))
+    cookie.domain = 'expired.baz'
+    cookie.expires = int(time.time()) - 1
+    jar.set_cookie(cookie)
+    assert len(jar) == 5
+    assert 'expired.baz' not in jar._cookies
+
+    jar.clear('foo.bar')
+    assert len(jar) == 3
+    jar.clear()
+    assert len(jar) == 0
+
+
+def test_session_cookies(server):
+    with Session() as s:
+        assert isinstance(s.cookies, CookieJar)
+        s.get(server.url + '/cookie')
+        assert s.get(server.url).json()['headers']['Cookie'] == 'foo=bar'
+
+        r = s.get(server.url, cookies=None)
+        assert 'Cookie' not in r.json()['headers']
+        r = s.get(server.url, cookies=False)
+        assert 'Cookie' not in r.json()['headers']
+
+
+def test_session_cookies_disabled(server):
+    with Session(cookies=False) as s:
+        assert s.cookies is None
+        s.get(server.url + '/cookie')
+        assert 'Cookie' not in s.get(server.url).json()['headers']
+        opener = next(iter(s._openers.values()))
+        assert not any(isinstance(h, urllib.request.HTTPCookieProcessor)
+                       for h in opener.handlers)
+
+        jar = CookieJar()
+        s.get(server.url + '/cookie', cookies=jar)
+        assert [c.name for c in jar] == ['foo']
@@ -4,6 +4,7 @@ import pytest
 
 from requisitor.headers import Headers
 from requisitor.headers import normalize_headers
+from requisitor.headers import parse_headers
 
 
 def test_Headers_repr():
@@ -64,6 +65,23 @@ def test_Headers_pop():
     h['foo'] = 'bar'
     assert h.pop('foo') == 'bar'
     pytest.raises(KeyError, h.pop, 'foo')
+    h.replace('Foo', None)
+    assert h.pop('foo', 'default') is None
+    assert 'foo' not in h
+    h.append('Foo', 'bar')
+    h.append('foo', 'baz')
+    assert h.pop('FOO') == 'bar, baz'
+    assert not h
+
+
+def test_Headers_setdefault():
+    h = Headers()
+    assert h.setdefault('Foo', 'bar') == 'bar'
+    assert h.multi_items() == [('Foo', 'bar')]
+    assert h.setdefault('foo', 'baz') == 'bar'
+    assert h.multi_items() == [('Foo', 'bar')]
+    assert h.setdefault('Qux') is None
+    assert 'qux' in h
 
 
 def test_Headers_add_header():
@@ -110,3 +128,85 @@ def test_normalize_headers():
     assert len(new) == 2
     assert new['cookie'] == 'foo'
     assert new['bar'] == 'baz'
+
+
+def test_Headers_case():
+    h = Headers()
+    h['Content-Type'] = 'text/html'
+    assert 'content-type' in h
+    assert h['CONTENT-TYPE'] == 'text/html'
+    assert list(h) == ['Content-Type']
+    h['content-type'] = 'text/plain'
+    assert h['content-type'] == 'text/html, text/plain'
+    h.replace('content-type', 'text/plain')
+    assert list(h.items()) == [('content-type', 'text/plain')]
+    del h['CONTENT-type']
+    del h['missing']
+    assert len(h) == 0
+    assert h['missing'] is None
+    assert h.get('missing', 'default') == 'default'
+
+
+def test_Headers_multi_values():
+    h = normalize_headers([('Set-Cookie', 'a=1'), ('set-cookie', 'b=2'),
+                           ('Foo', 'bar')])
+    assert h['set-cookie'] == 'a=1, b=2'
+    assert h.get_all('SET-COOKIE') == ['a=1', 'b=2']
+    assert h.get_all('missing', []) == []
+    assert h.multi_items() == [
+        ('Set-Cookie', 'a=1'), ('Set-Cookie', 'b=2'), ('Foo', 'bar'),
+    ]
+
+    copy = h.copy()
+    copy.append('foo', 'baz')
+    assert copy.get_all('foo') == ['bar', 'baz']
+    assert h.get_all('foo') == ['bar']
+
+
+def test_Headers_params():
+    h = Headers()
+    assert h.get_content_type() == 'text/plain'
+    assert h.get_param('charset') is None
+    assert h.get_params() is None
+
+    h['Content-Type'] = ('Multipart/Form-Data; Charset="utf-8"; '
+                         'boundary="a;b\\"c"; flag')
+    assert h.get_content_type() == 'multipart/form-data'
+    assert h.get_content_maintype() == 'multipart'
+    assert h.get_content_subtype() == 'form-data'
+    assert h.get_param('charset') == 'utf-8'
+    assert h.get_content_charset() == 'utf-8'
+    assert h.get_boundary() == 'a;b"c'
+    assert h.get_param('flag') == ''
+    assert h.get_param('charset', unquote=False) == '"utf-8"'
+    assert h.get_param('missing', 'default') == 'default'
+
+    h.replace('content-type', 'text/plain; ; =foo')
+    assert h.get_params() == [('text/plain', '')]
+    assert h.get_content_charset('ascii') == 'ascii'
+    assert h.get_boundary() is None
+
+    h.replace('content-type', 'bogus')
+    assert h.get_content_type() == 'text/plain'
+
+    h = Headers()
+    h.add_header('Content-Disposition', 'attachment', filename='a "b"',
+                 creation_date=None)
+    assert h['content-disposition'] == (
+        'attachment; filename="a \\"b\\""; creation-date'
+    )
+    assert h.get_param('filename', header='content-disposition') == 'a "b"'
+
+
+def test_parse_headers():
+    h = parse_headers([
+        b'Foo: bar\r\n',
+        b'Folded: a\r\n',
+        b' b\r\n',
+        b'foo:baz\r\n',
+        b'Latin: \xe4\r\n',
+        b'\r\n',
+    ])
+    assert h.get_all('foo') == ['bar', 'baz']
+    assert h['folded'] == 'a b'
+    assert h['latin'] == '\xe4'
@@ -0,0 +1,125 @@
+import urllib.error
+import urllib.request
+from unittest.mock import MagicMock
+
+import pytest
+
+from requisitor.errors import HTTPError
+from requisitor.handlers import HTTPHandler
+from requisitor.hooks import Hooks
+from requisitor.session import Session
+
+
+def record(session):
+    events = []
+    for event in ('request', 'connection', 'redirect', 'response', 'body',
+                  'error'):
+        session.hooks.add(
+            event, lambda *args, event=event: events.append((event, args))
+        )
+    return events
+
+
+def test_hooks():
+    hooks = Hooks()
+    assert not hooks
+
+    calls = []
+    hooks.add('request', calls.append)
+    assert hooks
+    hooks.emit('request', 1)
+    hooks.emit('response', 2)
+    assert calls == [1]
+
+    hooks.add('request', calls.extend)
+    assert repr(hooks) == '<Hooks %r>' % {
+        'request': (calls.append, calls.extend)
+    }
+    hooks.remove('request', calls.append)
+    hooks.emit('request', [3])
+    assert calls == [1, 3]
+
+    hooks.remove('request', calls.extend)
+    assert not hooks
+
+    with pytest.raises(ValueError):
+        hooks.add('foo', calls.append)
+
+
+def test_no_hooks(server):
+    with Session() as s:
+        s.get(server.url).bytes
+        opener = next(iter(s._openers.values()))
+        assert all(getattr(h, '_hooks', None) is None and
+                   getattr(h, 'hooks', None) is None
+                   for h in opener.handlers)
+
+
+def test_session_hooks(server):
+    with Session() as s:
+        events = record(s)
+        r = s.get(server.url + '/redirect/302/foo')
+        assert [e for e, _ in events] == [
+            # The empty body of the redirect is complete with its headers
+            'request', 'connection', 'response', 'body', 'redirect',
+            'request', 'connection', 'response',
+        ]
+        (_, (req,)), (_, (_, conn, reused)) = events[:2]
+        assert req.full_url == server.url + '/redirect/302/foo'
+        assert not reused
+        _, (_, response) = events[2]
+        assert response.status == 302
+        _, (_, new, code) = events[4]
+        assert new.full_url == server.url + '/foo'
+        assert code == 302
+        assert events[5][1] == (new,)
+        _, (_, _, reused) = events[6]
+        assert reused
+
+        del events[:]
+        r.bytes
+        assert events == [('body', (new, r._response))]
+
+
+def test_error_hooks(server):
+    with Session() as s:
+        events = record(s)
+        with pytest.raises(HTTPError) as excinfo:
+            s.get(server.url + '/status/404')
+        assert [e for e, _ in events] == [
+            'request', 'connection', 'response', 'error'
+        ]
+        assert events[-1][1][1] is excinfo.value
+
+        del events[:]
+        with pytest.raises(urllib.error.URLError):
+            s.get('http://127.0.0.1:1/')
+        # New connections connect when the request is sent
+        assert [e for e, _ in events] == ['request', 'connection', 'error']
+
+
+def test_no_pool_hooks(server):
+    with Session(pool=False) as s:
+        events = record(s)
+        s.get(server.url).bytes
+        assert [e for e, _ in events] == [
+            'request', 'connection', 'response', 'body'
+        ]
+        assert events[1][1][2] is False
+
+        del events[:]
+        s.head(server.url).bytes
+        assert [e for e, _ in events] == [
+            'request', 'connection', 'response', 'body'
+        ]
+
+
+def test_opened_other_response():
+    hooks = Hooks()
+    events = []
+    hooks.add('response', lambda *args: events.append(('response', args)))
+    hooks.add('body', lambda *args: events.append(('body', args)))
+    req = urllib.request.Request('http://foo.bar/')
+    response = MagicMock(spec=['status'], status=200)
+    HTTPHandler(hooks=hooks)._opened(req, response)
+    assert events == [('response', (req, response))]
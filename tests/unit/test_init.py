@@ -1,3 +1,8 @@
+import json
+import os
+import subprocess
+import sys
+
 import pytest
 
 import requisitor
@@ -12,18 +17,21 @@ def test_get(session):
     requisitor.get('http://foo.bar/', headers={})
 
     session().get.assert_called_once_with('http://foo.bar/', headers={})
+    session.assert_any_call(pool=False)
 
 
 def test_options(session):
     requisitor.options('http://foo.bar/', headers={})
 
     session().options.assert_called_once_with('http://foo.bar/', headers={})
+    session.assert_any_call(pool=False)
 
 
 def test_head(session):
     requisitor.head('http://foo.bar/', headers={})
 
     session().head.assert_called_once_with('http://foo.bar/', headers={})
+    session.assert_any_call(pool=False)
 
 
 def test_post(session):
@@ -31,6 +39,7 @@ def test_post(session):
 
     session().post.assert_called_once_with('http://foo.bar/', data='baz',
                                            headers={})
+    session.assert_any_call(pool=False)
 
 
 def test_put(session):
@@ -38,6 +47,7 @@ def test_put(session):
 
     session().put.assert_called_once_with('http://foo.bar/', data='baz',
                                           headers={})
+    session.assert_any_call(pool=False)
 
 
 def test_patch(session):
@@ -45,9 +55,39 @@ def test_patch(session):
 
     session().patch.assert_called_once_with('http://foo.bar/', data='baz',
                                             headers={})
+    session.assert_any_call(pool=False)
 
 
 def test_delete(session):
     requisitor.delete('http://foo.bar/', headers={})
 
     session().delete.assert_called_once_with('http://foo.bar/', headers={})
+    session.assert_any_call(pool=False)
+
+
+def test_lazy_imports():
+    # Run in a fresh interpreter, other tests have already imported
+    # everything into this one
+    code = (
+        'import json, sys; before = set(sys.modules); import requisitor; '
+        'print(json.dumps(sorted(set(sys.modules) - before)))'
+    )
+    env = dict(
+        os.environ,
+        PYTHONPATH=os.path.dirname(os.path.dirname(requisitor.__file__)),
+    )
+    out = subprocess.check_output([sys.executable, '-c', code], env=env)
+    imported = set(json.loads(out))
+
+    for name in ('asyncio', 'concurrent.futures', 'http.cookiejar',
+                 'mimetypes', 'requisitor.asyncsession', 'requisitor.cache',
+                 'requisitor.multipart'):
+        assert name not in imported
+    assert len(imported) < 100
+
+
+def test_lazy_async_session():
+    from requisitor.asyncsession import AsyncSession
+    assert requisitor.AsyncSession is AsyncSession
+    with pytest.raises(AttributeError):
+        requisitor.Foo
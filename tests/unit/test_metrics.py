@@ -0,0 +1,77 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from requisitor.errors import HTTPError
+from requisitor.metrics import Histogram
+from requisitor.metrics import Metrics
+from requisitor.session import Session
+from requisitor.timings import Timings
+
+
+def test_histogram():
+    h = Histogram(buckets=(1, 2))
+    for value in (0.5, 1, 1.5, 3):
+        h.observe(value)
+    assert h.cumulative() == [(1, 2), (2, 3), (float('inf'), 4)]
+    assert h.as_dict() == {
+        'buckets': [(1, 2), (2, 3), (float('inf'), 4)],
+        'sum': 6,
+        'count': 4,
+    }
+
+
+def test_metrics(server):
+    metrics = Metrics()
+    host = server.url.split('://')[1]
+    with Session() as s:
+        metrics.register(s)
+        s.get(server.url + '/redirect/302/foo').bytes
+        with pytest.raises(HTTPError):
+            s.get(server.url + '/status/404')
+
+        metrics.unregister(s)
+        assert not s.hooks
+        s.get(server.url).bytes
+
+    m = metrics.as_dict()[host]
+    assert m['requests'] == 3
+    assert m['responses'] == {200: 1, 302: 1, 404: 1}
+    assert m['errors'] == {'HTTPError': 1}
+    assert m['redirects'] == 1
+    assert m['connections'] == {'new': 1, 'reused': 2}
+    assert m['ttfb']['count'] == 3
+    # The body of the error response was never read
+    assert m['duration']['count'] == 2
+    assert m['duration']['buckets'][-1] == (float('inf'), 2)
+
+    text = metrics.prometheus()
+    assert '# TYPE requisitor_requests_total counter' in text
+    assert 'requisitor_requests_total{host="%s"} 3' % host in text
+    assert ('requisitor_responses_total{host="%s",status="404"} 1' % host
+            in text)
+    assert ('requisitor_errors_total{host="%s",error="HTTPError"} 1' % host
+            in text)
+    assert ('requisitor_connections_total{host="%s",state="reused"} 2' % host
+            in text)
+    assert '# TYPE requisitor_request_duration_seconds histogram' in text
+    assert ('requisitor_request_duration_seconds_bucket{host="%s",le="+Inf"} 2'
+            % host in text)
+    assert 'requisitor_ttfb_seconds_count{host="%s"} 3' % host in text
+    assert text.endswith('\n')
+
+    metrics.clear()
+    assert metrics.as_dict() == {}
+
+
+def test_metrics_without_timings():
+    metrics = Metrics()
+    req = MagicMock(host='foo.bar')
+    metrics._on_body(req, MagicMock(spec=[]))
+    metrics._on_body(req, MagicMock(timings=Timings(start=1)))
+    assert metrics.as_dict() == {}
+
+    metrics._on_response(req, MagicMock(spec=['status'], status=200))
+    m = metrics.as_dict()['foo.bar']
+    assert m['responses'] == {200: 1}
+    assert m['ttfb']['count'] == 0
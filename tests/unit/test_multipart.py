@@ -1,3 +1,4 @@
+import io
 import os
 import pathlib
 from email.message import Message
@@ -5,7 +6,25 @@ from email.message import Message
 import pytest
 
 from requisitor.multipart import Field
+from requisitor.multipart import MultipartEncoder
 from requisitor.multipart import prepare_multipart
+from requisitor.session import Session
+
+HERE = os.path.dirname(__file__)
+PNG = os.path.join(HERE, 'fixtures/1x1.png')
+
+
+class Unsized(io.RawIOBase):
+    name = 'unsized.bin'
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        return self._data.readinto(b)
 
 
 def test_prepare_multipart(request):
@@ -98,3 +117,77 @@ def test_bad_mime(mocker):
     mocker.patch('mimetypes.guess_type', side_effect=TypeError)
     content_type, b_data = prepare_multipart(fields)
     assert b'Content-Type: application/octet-stream' in b_data
+
+
+def test_encoder_length():
+    with open(PNG, 'rb') as f:
+        fields = {
+            'a': 'b',
+            'path': {'file': PNG},
+            'fileobj': {'file': f},
+            'pathlib': {'file': pathlib.Path(PNG)},
+        }
+        encoder = MultipartEncoder(fields, boundary='xyz', chunk_size=16)
+        chunks = list(encoder)
+
+    body = b''.join(chunks)
+    assert len(body) == encoder.length
+    assert encoder.content_type == 'multipart/form-data; boundary="xyz"'
+    assert body.endswith(b'\r\n--xyz--\r\n')
+    assert body.count(open(PNG, 'rb').read()) == 3
+    assert b'Content-Transfer-Encoding' not in body
+    assert all(len(c) >= 16 for c in chunks[:-1])
+
+
+def test_encoder_lazy(tmp_path, mocker):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(b'\x00' * 10)
+    m_open = mocker.patch('requisitor.multipart.open', create=True,
+                          side_effect=open)
+    encoder = MultipartEncoder({'f': {'file': str(path)}})
+    m_open.assert_not_called()
+
+    path.write_bytes(b'\x01' * 10)
+    assert b'\x01' * 10 in b''.join(encoder)
+    assert m_open.call_count == 1
+
+
+def test_encoder_repeatable():
+    with open(PNG, 'rb') as f:
+        f.read(4)
+        encoder = MultipartEncoder({'f': {'file': f}})
+        first = b''.join(encoder)
+        assert first == b''.join(encoder)
+    assert len(first) == encoder.length
+    assert open(PNG, 'rb').read()[4:] + b'\r\n' in first
+
+
+def test_encoder_unknown_length():
+    encoder = MultipartEncoder({'f': {'file': Unsized(b'foo')}})
+    assert encoder.length is None
+    assert b'\r\n\r\nfoo\r\n' in b''.join(encoder)
+
+
+def test_encoder_quoting():
+    encoder = MultipartEncoder({'a"\r\nb': 'c'}, boundary='xyz')
+    assert b'name="a%22%0D%0Ab"' in b''.join(encoder)
+
+
+@pytest.mark.parametrize('size', (True, False))
+def test_session_upload(server, size):
+    with open(PNG, 'rb') as f:
+        png = f.read()
+    fileobj = io.BytesIO(png) if size else Unsized(png)
+    fileobj.name = '1x1.png'
+
+    with Session() as s:
+        r = s.post(server.url, files={'a': 'b', 'f': {'file': fileobj}})
+        data = r.json()
+
+    headers = data['headers']
+    if size:
+        assert int(headers['Content-Length']) == len(data['body'])
+        assert 'Transfer-Encoding' not in headers
+    else:
+        assert headers['Transfer-Encoding'] == 'chunked'
+    assert png.decode('latin-1') in data['body']
@@ -0,0 +1,171 @@
+import socket
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from requisitor.errors import PoolError
+from requisitor.pool import ConnectionPool
+from requisitor.pool import is_connection_dropped
+from requisitor.session import Session
+
+
+def conn():
+    c = MagicMock()
+    c.sock = None
+    return c
+
+
+def test_acquire_release(mocker):
+    mocker.patch('requisitor.pool.is_connection_dropped', return_value=False)
+    pool = ConnectionPool()
+    c = MagicMock()
+    assert pool.acquire('a', lambda: c) == (c, False)
+    assert pool.size('a') == 1
+    pool.release('a', c)
+    assert pool.idle('a') == 1
+    assert pool.acquire('a', MagicMock) == (c, True)
+    assert pool.idle('a') == 0
+    pool.release('a', c, reusable=False)
+    c.close.assert_called_once_with()
+    assert pool.size() == 0
+
+
+def test_stale_idle_discarded(mocker):
+    mocker.patch('requisitor.pool.is_connection_dropped', return_value=True)
+    pool = ConnectionPool()
+    c = MagicMock()
+    pool.acquire('a', lambda: c)
+    pool.release('a', c)
+    new = MagicMock()
+    assert pool.acquire('a', lambda: new) == (new, False)
+    c.close.assert_called_once_with()
+    assert pool.size('a') == 1
+
+
+def test_max_per_host():
+    pool = ConnectionPool(max_per_host=1)
+    pool.acquire('a', conn)
+    pytest.raises(PoolError, pool.acquire, 'a', conn)
+    pool.acquire('b', conn)
+
+
+def test_max_total_evicts_idle(mocker):
+    mocker.patch('requisitor.pool.is_connection_dropped', return_value=False)
+    pool = ConnectionPool(max_total=1)
+    c = MagicMock()
+    pool.acquire('a', lambda: c)
+    pytest.raises(PoolError, pool.acquire, 'b', conn)
+    pool.release('a', c)
+    pool.acquire('b', conn)
+    c.close.assert_called_once_with()
+    assert pool.size('a') == 0
+
+    # The least recently released connection is evicted
+    pool = ConnectionPool(max_total=2)
+    c1, _ = pool.acquire('a', conn)
+    c2, _ = pool.acquire('a', conn)
+    c1.sock = c2.sock = object()
+    pool.release('a', c1)
+    pool.release('a', c2)
+    pool.acquire('b', conn)
+    c1.close.assert_called_once_with()
+    assert pool.idle('a') == 1
+
+
+def test_block_timeout():
+    pool = ConnectionPool(max_per_host=1, block=True, timeout=0.01)
+    pool.acquire('a', conn)
+    pytest.raises(PoolError, pool.acquire, 'a', conn)
+
+
+@pytest.mark.parametrize('timeout', [5, None])
+def test_block_waits_for_release(timeout):
+    pool = ConnectionPool(max_per_host=1, block=True, timeout=timeout)
+    c, _ = pool.acquire('a', conn)
+    timer = threading.Timer(0.05, pool.release, ('a', c, False))
+    timer.start()
+    assert pool.acquire('a', conn)[1] is False
+    timer.join()
+
+
+def test_factory_error():
+    pool = ConnectionPool()
+    pytest.raises(RuntimeError, pool.acquire, 'a',
+                  MagicMock(side_effect=RuntimeError))
+    assert pool.size() == 0
+
+
+def test_is_connection_dropped():
+    a, b = socket.socketpair()
+    try:
+        assert is_connection_dropped(conn()) is True
+        assert is_connection_dropped(MagicMock(sock=a)) is False
+        b.close()
+        assert is_connection_dropped(MagicMock(sock=a)) is True
+    finally:
+        a.close()
+    assert is_connection_dropped(MagicMock(sock=a)) is True
+
+
+def test_session_reuses_connection(server):
+    url = server.url + '/'
+    with Session() as s:
+        for _ in range(3):
+            assert s.get(url).json()['path'] == '/'
+        assert s.head(url).status_code == 200
+        assert s.get(url).status_code == 200
+    assert server.connections == 1
+
+
+def test_session_retries_stale_connection(server, mocker):
+    # Simulate the server closing the connection between the stale
+    # check and sending the request
+    mocker.patch('requisitor.pool.is_connection_dropped', return_value=False)
+    url = server.url + '/'
+    with Session() as s:
+        assert s.get(url).bytes
+        idle = next(iter(s.pool._idle.values()))[0]
+        idle.sock.shutdown(socket.SHUT_WR)
+        idle.sock.recv(1)
+        assert s.get(url).status_code == 200
+    assert server.connections == 2
+
+
+def test_session_without_pool(server):
+    url = server.url + '/'
+    s = Session(pool=False)
+    assert s.pool is None
+    for _ in range(2):
+        assert s.get(url).json()['path'] == '/'
+    s.close()
+    assert server.connections == 2
+
+
+def test_session_streaming_releases_connection(unix_server):
+    with Session() as s:
+        s.unix_socket = unix_server.path
+        r = s.get('http://localhost/chunked')
+        assert list(r.iter_content(2)) == [b'fo', b'ob', b'ar']
+        assert list(s.get('http://localhost/foo').iter_lines()) == [
+            s.get('http://localhost/foo').bytes
+        ]
+        assert s.get('http://localhost/gzip').json() == {'foo': 'bar'}
+    assert unix_server.connections == 1
+
+
+def test_session_pool_full(server):
+    # Responses holding every pooled connection do not fail new requests,
+    # those use connections outside of the pool
+    with Session(pool=ConnectionPool(max_per_host=1)) as s:
+        responses = [s.get(server.url + '/chunked') for _ in range(3)]
+        assert s.pool.size() == 1
+        assert [r.bytes for r in responses] == [b'foobar'] * 3
+        assert s.pool.size() == s.pool.idle(next(iter(s.pool._idle))) == 1
+        assert s.get(server.url).status_code == 200
+    assert server.connections == 3
+
+    s = Session(pool=ConnectionPool(max_per_host=1, block=True, timeout=0))
+    r = s.get(server.url + '/chunked')
+    pytest.raises(PoolError, s.get, server.url)
+    r.close()
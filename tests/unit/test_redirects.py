@@ -0,0 +1,126 @@
+import time
+from urllib.request import Request
+
+from requisitor.redirects import PermanentRedirectHandler
+from requisitor.redirects import RedirectCache
+from requisitor.session import Session
+
+
+def sent(session):
+    urls = []
+    session.hooks.add('request', lambda req: urls.append(
+        (req.get_method(), req.full_url.rpartition(':')[2].partition('/')[2])
+    ))
+    return urls
+
+
+def test_redirect_cache(mocker):
+    cache = RedirectCache(max_entries=2, ttl=60)
+    cache.set('a', 'b', 301)
+    cache.set('b', 'c', 308, max_age=0)
+    assert cache.get('a') == ('b', 301)
+    assert cache.get('b') is None
+
+    cache.set('b', 'c', 308)
+    cache.get('a')
+    cache.set('c', 'd', 301)
+    assert len(cache) == 2
+    assert cache.get('b') is None
+
+    now = time.monotonic()
+    cache.set('d', 'e', 301, max_age=10)
+    mocker.patch('time.monotonic', return_value=now + 30)
+    assert cache.get('d') is None
+    assert cache.get('c') == ('d', 301)
+    mocker.patch('time.monotonic', return_value=now + 61)
+    assert cache.get('c') is None
+
+    cache = RedirectCache(ttl=None)
+    cache.set('a', 'b', 301)
+    mocker.patch('time.monotonic', return_value=now + 1e9)
+    assert cache.get('a') == ('b', 301)
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_session_permanent_redirects(server):
+    with Session() as s:
+        urls = sent(s)
+        url = server.url + '/redirect/301/redirect/308/foo'
+        r = s.get(url)
+        assert r.json()['path'] == '/foo'
+        assert len(urls) == 3
+        assert len(s.redirect_cache) == 2
+
+        del urls[:]
+        r = s.get(url + '#frag')
+        assert r.json()['path'] == '/foo'
+        assert urls == [('GET', 'foo')]
+
+        # 301 turns a POST into a GET, and drops the payload
+        del urls[:]
+        r = s.post(url, data=b'foo')
+        assert urls == [('GET', 'foo')]
+        assert r.json()['body'] == ''
+        assert 'Content-Length' not in r.json()['headers']
+
+        # 308 keeps both
+        del urls[:]
+        r = s.post(server.url + '/redirect/308/foo', data=b'foo')
+        r = s.post(server.url + '/redirect/308/foo', data=b'foo')
+        assert urls[-1] == ('POST', 'foo')
+        assert r.json()['body'] == 'foo'
+
+        # Not followed, so not skipped either
+        r = s.get(url, allow_redirects=False)
+        assert r.status == 301
+
+
+def test_session_temporary_redirects(server):
+    with Session() as s:
+        s.get(server.url + '/redirect/302/foo')
+        s.get(server.url + '/redirect/307/foo')
+        assert len(s.redirect_cache) == 0
+
+
+def test_cache_control(server):
+    with Session() as s:
+        urls = sent(s)
+        for _ in range(2):
+            s.get(server.url + '/redirect/301/foo?cc=no-store')
+            s.get(server.url + '/redirect/301/bar?cc=max-age=0')
+        assert len(urls) == 8
+        s.get(server.url + '/redirect/301/baz?cc=max-age=60')
+        key = (None, server.url + '/redirect/301/baz?cc=max-age=60')
+        assert s.redirect_cache._entries[key][2] <= time.monotonic() + 60
+
+
+def test_redirect_cache_disabled(server):
+    with Session(redirect_cache=False) as s:
+        assert s.redirect_cache is None
+        urls = sent(s)
+        for _ in range(2):
+            s.get(server.url + '/redirect/301/foo')
+        assert len(urls) == 4
+        opener = next(iter(s._openers.values()))
+        assert not any(isinstance(h, PermanentRedirectHandler)
+                       for h in opener.handlers)
+
+
+def test_redirect_loop():
+    cache = RedirectCache()
+    h = PermanentRedirectHandler(cache)
+    cache.set((None, 'http://a/'), 'http://b/', 301)
+    cache.set((None, 'http://b/'), 'http://a/', 301)
+    req = h.http_request(Request('http://a/'))
+    assert req.full_url == 'http://b/'
+
+
+def test_redirect_chain_limit():
+    cache = RedirectCache()
+    h = PermanentRedirectHandler(cache)
+    h.max_redirections = 2
+    for a, b in ('ab', 'bc', 'cd'):
+        cache.set((None, 'http://%s/' % a), 'http://%s/' % b, 301)
+    req = h.http_request(Request('http://a/'))
+    assert req.full_url == 'http://c/'
@@ -1,14 +1,19 @@
 import gzip
 import importlib
 import io
+import json
 import sys
+import zlib
 from http.client import HTTPResponse
 from urllib.request import Request
 
 import pytest
 
+from requisitor.response import ContentDecoder
+from requisitor.response import DecodedResponse
 from requisitor.response import GzipDecodedResponse
 from requisitor.response import Response
+from requisitor.response import parse_content_encoding
 
 
 class Sock(io.BytesIO):
@@ -16,24 +21,24 @@ class Sock(io.BytesIO):
         return self
 
 
-RESP = b'''HTTP/1.1 200 OK
-Content-Type: application/json; charset=utf-8
-Set-Cookie: foo
-Set-Cookie: bar
-Content-Length: 14
-
+RESP = b'''HTTP/1.1 200 OK
+Content-Type: application/json; charset=utf-8
+Set-Cookie: foo
+Set-Cookie: bar
+Content-Length: 14
+
 {"foo": "bar"}
 '''
 
-GZIP_RESP = b'''HTTP/1.1 200 OK
-Content-Type: application/json; charset=utf-8
-Set-Cookie: foo
-Set-Cookie: bar
-Content-Encoding: gzip
-Content-Length: 14
-
-%s
-''' % gzip.compress(b'{"foo": "bar"}')
+GZIP_BODY = gzip.compress(b'{"foo": "bar"}')
+GZIP_RESP = b'''HTTP/1.1 200 OK
+Content-Type: application/json; charset=utf-8
+Set-Cookie: foo
+Set-Cookie: bar
+Content-Encoding: gzip
+Content-Length: %d
+
+%s''' % (len(GZIP_BODY), GZIP_BODY)
 
 
 @pytest.fixture
@@ -53,6 +58,13 @@ def test_Response__init__(response):
     assert isinstance(response.raw, HTTPResponse)
 
 
+def test_Response_headers_lazy(response):
+    assert response._headers is None
+    assert response.headers['set-cookie'] == 'foo, bar'
+    assert response.headers is response._headers
+    assert response.headers.get_all('set-cookie') == ['foo', 'bar']
+
+
 def test_Response_read(response):
     with pytest.raises(AttributeError):
         response.read
@@ -83,6 +95,39 @@ def test_Response_json(response):
     assert response.json() == {"foo": "bar"}
 
 
+def _json_response(body, charset, json_loads=None,
+                   content_type=b'application/json'):
+    r = HTTPResponse(
+        Sock(b'HTTP/1.1 200 OK\r\nContent-Type: %s%s\r\n'
+             b'Content-Length: %d\r\n\r\n%s' % (
+                 content_type, charset, len(body), body)),
+        method='GET',
+        url='https://foo.bar/',
+    )
+    r.begin()
+    return Response(r, Request('https://foo.bar/'), json_loads=json_loads)
+
+
+@pytest.mark.parametrize('encoding,charset,loaded', [
+    ('utf-8', b'', bytes),
+    ('utf-16', b'; charset=utf-16', bytes),
+    ('utf-32-le', b'; charset=UTF-32LE', bytes),
+    ('latin-1', b'; charset=latin-1', str),
+    ('utf-8', b'; charset=bogus', str),
+])
+def test_Response_json_bytes(encoding, charset, loaded, mocker):
+    body = '{"foo": "b\xe4r"}'.encode(encoding)
+    loads = mocker.MagicMock(side_effect=json.loads)
+    response = _json_response(body, charset, json_loads=loads)
+    if charset == b'; charset=bogus':
+        with pytest.raises(LookupError):
+            response.json()
+    else:
+        assert response.json(object_hook=dict) == {'foo': 'b\xe4r'}
+        assert isinstance(loads.call_args[0][0], loaded)
+        assert loads.call_args[1] == {'object_hook': dict}
+
+
 def test_Response_set_stream():
     r = HTTPResponse(
         Sock(GZIP_RESP),
@@ -92,22 +137,250 @@ def test_Response_set_stream():
     r.begin()
     req = Request('https://foo.bar/')
     response = Response(r, req)
-    assert isinstance(response.raw, GzipDecodedResponse)
+    assert isinstance(response.raw, DecodedResponse)
+    assert response.json() == {'foo': 'bar'}
 
 
-def test_GzipDecodedResponse(monkeypatch, mocker):
-    monkeypatch.delitem(sys.modules, 'gzip')
+def test_Response_set_stream_unsupported():
+    r = HTTPResponse(
+        Sock(RESP.replace(b'Content-Length', b'Content-Encoding: br\nC'
+                                             b'ontent-Length')),
+        method='GET',
+        url='https://foo.bar/',
+    )
+    r.begin()
+    response = Response(r)
+    assert response.raw is r
+
+
+def test_GzipDecodedResponse():
+    data = gzip.compress(b'foo') + gzip.compress(b'bar')
+    decoded = GzipDecodedResponse(io.BytesIO(data))
+    assert decoded.read() == b'foobar'
+    decoded.close()
+    assert decoded.closed
+
+
+@pytest.mark.parametrize('encoding,data', [
+    ('gzip', gzip.compress(b'foo' * 1000)),
+    ('x-gzip', gzip.compress(b'foo' * 1000)),
+    ('deflate', zlib.compress(b'foo' * 1000)),
+    ('deflate', zlib.compress(b'foo' * 1000)[2:-4]),
+    ('gzip, gzip', gzip.compress(gzip.compress(b'foo' * 1000))),
+    ('deflate, identity, GZIP',
+     gzip.compress(zlib.compress(b'foo' * 1000))),
+])
+def test_DecodedResponse(encoding, data):
+    encodings = parse_content_encoding(encoding)
+    decoded = DecodedResponse(io.BytesIO(data), encodings, chunk_size=7)
+    assert decoded.readable()
+    assert decoded.read(0) == b''
+    assert decoded.read(5) == b'foofo'
+    buf = bytearray(10)
+    assert decoded.readinto(buf) == 10
+    assert buf == b'ofoofoofoo'
+    assert decoded.readall() == b'foo' * 995
+    assert decoded.read() == b''
+
+
+def test_ContentDecoder_unsupported():
+    pytest.raises(ValueError, ContentDecoder, ['br'])
+
+
+def test_parse_content_encoding():
+    assert parse_content_encoding(None) == []
+    assert parse_content_encoding('identity') == []
+    assert parse_content_encoding('Gzip, br') == ['gzip', 'br']
+
+
+def test_no_zlib(monkeypatch, mocker):
+    monkeypatch.delitem(sys.modules, 'zlib')
     monkeypatch.delitem(sys.modules, 'requisitor.response')
 
     orig_import = __import__
 
     def _import(*args):
-        if args[0] == 'gzip':
+        if args[0] == 'zlib':
             raise ImportError
         return orig_import(*args)
 
     mocker.patch('builtins.__import__', _import)
 
     mod = importlib.import_module('requisitor.response')
-    assert mod.gzip is None
+    assert mod.zlib is None
     pytest.raises(NotImplementedError, mod.GzipDecodedResponse, None)
+
+
+def test_zstd():
+    zstd = pytest.importorskip('compression.zstd')
+    data = zstd.compress(b'foo') + zstd.compress(b'bar')
+    decoded = DecodedResponse(io.BytesIO(data), ['zstd'])
+    assert decoded.read() == b'foobar'
+
+
+def test_zstd_frames(mocker):
+    # Without compression.zstd, a decompressor standing in for it, that
+    # takes one frame at a time
+    class Decompressor:
+        def __init__(self):
+            self.eof = False
+            self.unused_data = b''
+
+        def decompress(self, data):
+            frame, _, self.unused_data = data.partition(b'|')
+            self.eof = True
+            return frame.upper()
+
+    mocker.patch('requisitor.response.zstd',
+                 mocker.Mock(ZstdDecompressor=Decompressor))
+    mocker.patch('requisitor.response.SUPPORTED_ENCODINGS',
+                 frozenset(('zstd',)))
+    decoder = ContentDecoder(['zstd'])
+    assert decoder.decompress(b'foo|bar') == b'FOOBAR'
+    assert decoder.flush() == b''
+
+
+def make_response(body, headers=b''):
+    r = HTTPResponse(
+        Sock(b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n%s\r\n%s' % (
+            len(body), headers, body
+        )),
+        method='GET',
+        url='https://foo.bar/',
+    )
+    r.begin()
+    return Response(r)
+
+
+def test_Response_iter_content():
+    response = make_response(b'foobarbaz')
+    assert list(response.iter_content(4)) == [b'foob', b'arba', b'z']
+    assert response.raw.isclosed()
+    assert response.bytes == b''
+
+    response = make_response(b'foobarbaz')
+    assert response.bytes == b'foobarbaz'
+    assert list(response.iter_content(4)) == [b'foob', b'arba', b'z']
+
+
+def test_Response_iter_content_early_close():
+    response = make_response(b'foobarbaz')
+    chunks = response.iter_content(4)
+    assert next(chunks) == b'foob'
+    chunks.close()
+    assert response.raw.isclosed()
+
+
+def test_Response_iter_content_gzip():
+    body = gzip.compress(b'foo' * 1000)
+    response = make_response(body, b'Content-Encoding: gzip\r\n')
+    assert b''.join(response.iter_content(7)) == b'foo' * 1000
+
+
+@pytest.mark.parametrize('kwargs,expected', [
+    ({}, [b'foo', b'bar', b'', b'baz']),
+    ({'chunk_size': 1}, [b'foo', b'bar', b'', b'baz']),
+    ({'keepends': True}, [b'foo\r\n', b'bar\n', b'\n', b'baz']),
+    ({'delimiter': b'\r\n', 'chunk_size': 2}, [b'foo', b'bar\n\nbaz']),
+])
+def test_Response_iter_lines(kwargs, expected):
+    response = make_response(b'foo\r\nbar\n\nbaz')
+    assert list(response.iter_lines(**kwargs)) == expected
+
+
+def test_Response_iter_lines_trailing_delimiter():
+    response = make_response(b'foo\nbar\n')
+    assert list(response.iter_lines()) == [b'foo', b'bar']
+
+
+def test_Response_iter_text():
+    response = make_response('ünïcødé'.encode())
+    assert ''.join(response.iter_text(chunk_size=1)) == 'ünïcødé'
+
+    response = make_response(b'')
+    assert list(response.iter_text()) == []
+
+    # Some decoders only return text once they reach the end
+    response = make_response(b'ab')
+    response.encoding = 'idna'
+    assert list(response.iter_text(chunk_size=1)) == ['ab']
+
+
+def test_Response_readinto():
+    response = make_response(b'foobarbaz')
+    buf = bytearray(4)
+    assert response.readinto(buf) == 4
+    assert buf == b'foob'
+
+    response = make_response(b'foobarbaz')
+    response.bytes
+    assert response.readinto(buf) == 4
+    assert buf == b'foob'
+    assert response.readinto(buf) == 4
+    assert buf == b'arba'
+
+    class Raw:
+        read = io.BytesIO(b'foo').read
+
+    response.raw = Raw()
+    response._bytes = None
+    assert response.readinto(buf) == 3
+    assert buf[:3] == b'foo'
+
+
+def test_Response_close():
+    with make_response(b'foobarbaz') as response:
+        pass
+    assert response.raw.isclosed()
+
+
+@pytest.mark.parametrize('body,expected', [
+    (b'{"a": 1}\n{"b": [1, 2]}\n\n12\n"x"\n',
+     [{'a': 1}, {'b': [1, 2]}, 12, 'x']),
+    (b'{"a": 1}\r\n{"b": 2}', [{'a': 1}, {'b': 2}]),
+    (b' [ {"a": 1} , 123456 ,"\xc3\xa4", [] , true]\n',
+     [{'a': 1}, 123456, '\xe4', [], True]),
+    (b'[]', []),
+    (b'  ', []),
+    (b'1234', [1234]),
+])
+@pytest.mark.parametrize('chunk_size', [1, 3, 1024])
+def test_Response_iter_json(body, expected, chunk_size):
+    response = _json_response(body, b'')
+    assert list(response.iter_json(chunk_size=chunk_size)) == expected
+    assert response.raw.isclosed()
+
+
+@pytest.mark.parametrize('body', [
+    b'[1, 2', b'[1,', b'[1 2]', b'[1,]', b'[1] 2', b'{"a": 1', b'{"a": 1} x',
+])
+def test_Response_iter_json_invalid(body):
+    response = _json_response(body, b'')
+    with pytest.raises(json.JSONDecodeError):
+        list(response.iter_json(chunk_size=2))
+
+
+@pytest.mark.parametrize('content_type,array,expected', [
+    (b'application/x-ndjson', None, [[1, 2], {'a': 1}, [3]]),
+    (b'application/jsonl', None, [[1, 2], {'a': 1}, [3]]),
+    (b'application/json', False, [[1, 2], {'a': 1}, [3]]),
+])
+def test_Response_iter_json_records(content_type, array, expected):
+    response = _json_response(b'[1, 2]\n{"a": 1}\n[3]\n', b'',
+                              content_type=content_type)
+    assert list(response.iter_json(chunk_size=3, array=array)) == expected
+
+
+def test_Response_iter_json_array():
+    response = _json_response(b'[1, 2]', b'',
+                              content_type=b'application/x-ndjson')
+    assert list(response.iter_json(array=True)) == [1, 2]
+
+    response = _json_response(b'{"a": 1}', b'')
+    with pytest.raises(json.JSONDecodeError):
+        list(response.iter_json(array=True))
+
+
+def test_Response_iter_json_kwargs():
+    response = _json_response(b'[1.5]', b'')
+    assert list(response.iter_json(parse_float=str)) == ['1.5']
@@ -1,17 +1,26 @@
 import http.cookiejar
+import json
+import os
 import pathlib
+import socket
 import ssl
 from unittest.mock import MagicMock
 from unittest.mock import call
+from urllib.request import BaseHandler
 from urllib.request import HTTPDigestAuthHandler
 
 import pytest
 
+import requisitor.errors
 import requisitor.session
+from requisitor.auth import HTTPBearerAuth
 from requisitor.auth import HTTPDigestAuth
 from requisitor.handlers import UnixHTTPHandler
 from requisitor.headers import Headers
 from requisitor.headers import normalize_headers
+from requisitor.hooks import Hooks
+from requisitor.pool import ConnectionPool
+from requisitor.response import ACCEPT_ENCODING
 from requisitor.sentinel import Sentinel
 
 
@@ -135,6 +144,41 @@ def test_create_context(session):
     assert count + 1 == len(context.get_ca_certs())
 
 
+def test_create_context_cached(session, mocker):
+    context = session._create_context(fixtures / 'cacert.pem')
+    assert session._create_context(fixtures / 'cacert.pem') is context
+    assert session._create_context(True) is not context
+
+    cert = (str(fixtures / 'cacert.pem'), str(fixtures / 'cakey.pem'))
+    load_cert_chain = mocker.patch('ssl.SSLContext.load_cert_chain')
+    with_cert = session._create_context(True, cert)
+    assert session._create_context(True, cert) is with_cert
+    load_cert_chain.assert_called_once_with(cert[0], keyfile=cert[1])
+
+
+def test_create_context_lazy(server):
+    # Creating a context loads the CA certificates, plain HTTP requests
+    # should not pay for that
+    with requisitor.session.Session() as s:
+        assert s.get(server.url).status_code == 200
+        assert s._contexts == {}
+
+
+def test_create_context_invalidated(session):
+    context = session._create_context(True)
+
+    session.verify = True
+    assert session._create_context(True) is not context
+
+    context = session._create_context(True)
+    session.cert = None
+    assert session._create_context(True) is not context
+
+    context = session._create_context(True)
+    session.clear_contexts()
+    assert session._create_context(True) is not context
+
+
 def test_request_files(full_session):
     session, build_opener, opener, response = full_session
 
@@ -172,6 +216,7 @@ def test_request_fallbacks(full_session, monkeypatch):
         call(Sentinel, session.cookies),  # cookies
         call(Sentinel, None),  # unix_socket
         call(Sentinel, True),  # verify
+        call(Sentinel, True),  # compression
     ]
 
     _fallback = MagicMock(return_value=None)
@@ -180,7 +225,7 @@ def test_request_fallbacks(full_session, monkeypatch):
     session.request('GET', 'http://foo.bar')
 
     _fallback.assert_has_calls(calls)
-    assert _fallback.call_count == 5
+    assert _fallback.call_count == 6
 
     args, kwargs = opener.open.call_args
     request = args[0]
@@ -201,6 +246,7 @@ def test_request_overrides(full_session, monkeypatch):
         call(cookies, session.cookies),  # cookies
         call(True, None),  # unix_socket
         call(False, True),  # verify
+        call(Sentinel, True),  # compression
     ]
 
     _fallback = MagicMock(return_value=None)
@@ -212,7 +258,7 @@ def test_request_overrides(full_session, monkeypatch):
                     params={'foo': 'baz', 'another': 'one'})
 
     _fallback.assert_has_calls(calls)
-    assert _fallback.call_count == 5
+    assert _fallback.call_count == 6
 
     args, kwargs = opener.open.call_args
     request = args[0]
@@ -310,3 +356,264 @@ def test_request_response(full_session, monkeypatch):
 
     args, kwargs = opener.open.call_args
     response.call_args[1]['request'] = args[0]
+
+
+def test_request_opener_cached(full_session):
+    session, build_opener, opener, response = full_session
+
+    session.request('GET', 'http://foo.bar', timeout=1)
+    session.request('GET', 'http://foo.bar/baz', timeout=2)
+    assert build_opener.call_count == 1
+    assert opener.open.call_args[1]['timeout'] == 2
+
+    session.request('GET', 'http://foo.bar', allow_redirects=False)
+    assert build_opener.call_count == 2
+
+    session.handlers.append(UnixHTTPHandler('/foo/bar'))
+    session.request('GET', 'http://foo.bar')
+    assert build_opener.call_count == 3
+
+    session.request('GET', 'http://foo.bar', auth=HTTPDigestAuth('foo', 'bar'))
+    assert build_opener.call_count == 4
+
+    session.request('GET', 'http://foo.bar', auth=('foo', 'bar'))
+    assert build_opener.call_count == 4
+
+    session.pool = ConnectionPool()
+    session.request('GET', 'http://foo.bar')
+    assert build_opener.call_count == 5
+
+    session.hooks = Hooks()
+    session.request('GET', 'http://foo.bar')
+    assert build_opener.call_count == 6
+
+
+def test_request_opener_bounded(full_session):
+    session, build_opener, opener, response = full_session
+    session.max_openers = 2
+
+    for unix_socket in ('/foo', '/bar', '/baz', '/foo'):
+        session.request('GET', 'http://foo.bar', unix_socket=unix_socket)
+
+    assert build_opener.call_count == 4
+    assert len(session._openers) == 2
+
+
+def test_request_opener_handlers(server):
+    class Handler(BaseHandler):
+        parents = []
+
+        def http_request(self, req):
+            self.parents.append(self.parent)
+            return req
+
+    session = requisitor.session.Session()
+    session.handlers.append(Handler())
+
+    session.get(server.url + '/redirect/302/foo')
+    session.get(server.url + '/redirect/302/foo', allow_redirects=False)
+    first, second = session._openers.values()
+    session.get(server.url + '/redirect/302/foo')
+
+    assert first is not second
+    assert Handler.parents == [first, first, second, first, first]
+
+
+def test_request_compression(server):
+    with requisitor.session.Session() as s:
+        r = s.get(server.url + '/redirect/302/foo')
+        assert r.json()['headers']['Accept-Encoding'] == ACCEPT_ENCODING
+
+        r = s.get(server.url, compression=False)
+        assert r.json()['headers']['Accept-Encoding'] == 'identity'
+
+        r = s.get(server.url, headers={'accept-encoding': 'br'})
+        assert r.json()['headers']['Accept-Encoding'] == 'br'
+
+        s.compression = False
+        r = s.get(server.url)
+        assert r.json()['headers']['Accept-Encoding'] == 'identity'
+
+        assert s.get(server.url + '/gzip').json() == {'foo': 'bar'}
+
+
+def test_request_streaming_body(server, tmp_path, mocker):
+    path = tmp_path / 'body'
+    path.write_bytes(b'x' * 100000)
+    sendfile = mocker.spy(socket.socket, 'sendfile')
+
+    with requisitor.session.Session() as s:
+        with open(path, 'rb') as f:
+            r = s.post(server.url, data=f)
+        data = r.json()
+        assert data['headers']['Content-Length'] == '100000'
+        assert data['body'] == 'x' * 100000
+        assert sendfile.call_count == 1
+
+        # Files of unknown size are sent chunked
+        rfd, wfd = os.pipe()
+        os.write(wfd, b'piped')
+        os.close(wfd)
+        with os.fdopen(rfd, 'rb') as f:
+            r = s.post(server.url, data=f)
+        data = r.json()
+        assert data['headers']['Transfer-Encoding'] == 'chunked'
+        assert data['body'] == 'piped'
+
+        r = s.post(server.url, data=(b'foo%d' % i for i in range(3)))
+        data = r.json()
+        assert data['headers']['Transfer-Encoding'] == 'chunked'
+        assert data['body'] == 'foo0foo1foo2'
+
+        r = s.put(server.url, data=[b'foo', b'bar'],
+                  headers={'Content-Length': '6'})
+        data = r.json()
+        assert 'Transfer-Encoding' not in data['headers']
+        assert data['body'] == 'foobar'
+
+
+@pytest.fixture
+def body_file(tmp_path):
+    path = tmp_path / 'body'
+    path.write_bytes(b'prefix' + b'x' * 100000)
+    with open(str(path), 'rb') as f:
+        # Sent from where the file was when the request was prepared
+        f.read(6)
+        yield f
+
+
+@pytest.mark.parametrize('pool', [None, False])
+@pytest.mark.parametrize('path', [
+    '/redirect/307/foo', '/redirect/308/foo', '/digest', '/bearer',
+])
+def test_request_body_resent(server, body_file, pool, path):
+    def session():
+        # Without remembering redirects, challenges or tokens, so that
+        # every request is sent twice
+        s = requisitor.session.Session(pool=pool, redirect_cache=False)
+        if path == '/digest':
+            s.auth = HTTPDigestAuth('user', 'pass')
+        elif path == '/bearer':
+            tokens = iter(('t0', 't1'))
+            s.auth = HTTPBearerAuth(lambda: next(tokens))
+        return s
+
+    # A file body is rewound, and sent again in full
+    with session() as s:
+        r = s.post(server.url + path, data=body_file, timeout=5)
+        data = r.json()
+        assert data['headers']['Content-Length'] == '100000'
+        assert data['body'] == 'x' * 100000
+
+    # A generator can only be sent once
+    with session() as s:
+        with pytest.raises(requisitor.errors.UnrewindableBodyError):
+            s.post(server.url + path, timeout=5,
+                   data=(b'foo%d' % i for i in range(3)))
+
+
+def test_prepared_file_body(server, body_file):
+    with requisitor.session.Session() as s:
+        prepared = s.prepare('POST', server.url, data=body_file)
+        for _ in range(2):
+            r = s.send(prepared, timeout=5)
+            assert r.json()['body'] == 'x' * 100000
+
+        # Bodies that can be iterated again are sent as they are
+        r = s.post(server.url + '/redirect/307/foo', data=[b'foo', b'bar'])
+        assert r.json()['body'] == 'foobar'
+
+
+def test_request_json_backend(server):
+    with requisitor.session.Session() as s:
+        s.json_dumps = MagicMock(return_value=b'{"dumped": true}')
+        s.json_loads = MagicMock(return_value={'loaded': True})
+
+        r = s.post(server.url, json={'foo': 'bar'})
+        s.json_dumps.assert_called_once_with({'foo': 'bar'})
+        assert r.json() == {'loaded': True}
+        assert s.json_loads.call_args[0][0] == r.bytes
+
+        s.json_dumps.return_value = '{"dumped": "str"}'
+        s.json_loads.side_effect = json.loads
+        assert s.post(server.url, json={}).json()['body'] == (
+            '{"dumped": "str"}'
+        )
+
+        with pytest.raises(requisitor.errors.HTTPError) as e:
+            s.get(server.url + '/status/404')
+        s.json_loads.reset_mock()
+        s.json_loads.side_effect = None
+        assert e.value.json() == {'loaded': True}
+        s.json_loads.assert_called_once_with(b'error')
+
+
+def test_request_base_url(full_session):
+    session, build_opener, opener, response = full_session
+    session.base_url = 'https://foo.bar/api/v1/'
+    assert session.base_url == 'https://foo.bar/api/v1/'
+
+    for url, expected in (('users', 'https://foo.bar/api/v1/users?a=b'),
+                          ('/users', 'https://foo.bar/users?a=b'),
+                          ('http://baz/', 'http://baz/?a=b')):
+        session.request('GET', url, params={'a': 'b'})
+        assert opener.open.call_args[0][0].full_url == expected
+
+    session.base_url = None
+    session.request('GET', 'http://qux/')
+    assert opener.open.call_args[0][0].full_url == 'http://qux/'
+
+    assert requisitor.session.Session(
+        base_url='http://foo/'
+    ).base_url == 'http://foo/'
+
+
+def test_prepare():
+    session = requisitor.session.Session()
+    session.headers['X-Session'] = 'foo'
+    session.headers['X-Override'] = 'foo'
+    session.params = {'a': 'b'}
+    session.base_url = 'http://foo.bar/api/'
+
+    prepared = session.prepare('POST', 'users', json={'foo': 'bar'},
+                               headers={'x-override': 'bar'})
+    assert isinstance(prepared, requisitor.session.PreparedRequest)
+    assert prepared.method == 'POST'
+    assert prepared.url == 'http://foo.bar/api/users?a=b'
+    assert prepared.host == 'foo.bar'
+    assert prepared.data == b'{"foo": "bar"}'
+    assert dict(prepared.headers) == {
+        'X-Session': 'foo',
+        'x-override': 'bar',
+        'content-type': 'application/json',
+    }
+    assert prepared.compression is True
+
+    # The session headers are layered on, not modified
+    assert session.headers == {'X-Session': 'foo', 'X-Override': 'foo'}
+
+    with pytest.raises(AttributeError):
+        prepared.url = 'http://baz/'
+
+    req = prepared.build_request()
+    assert req.full_url == prepared.url
+    assert req.data == prepared.data
+    assert req.get_method() == 'POST'
+    assert req.headers['X-override'] == 'bar'
+    assert req is not prepared.build_request()
+
+
+def test_send(server):
+    with requisitor.session.Session() as s:
+        prepared = s.prepare('PUT', server.url + '/foo',
+                             params={'a': 'b'}, data=b'foo')
+        for _ in range(2):
+            data = s.send(prepared).json()
+            assert data['method'] == 'PUT'
+            assert data['path'] == '/foo?a=b'
+            assert data['body'] == 'foo'
+        assert server.connections == 1
+
+        responses = list(s.imap([prepared, ('GET', server.url)]))
+        assert responses[0].json()['method'] == 'PUT'
+        assert responses[1].json()['method'] == 'GET'
@@ -0,0 +1,83 @@
+import concurrent.futures
+import itertools
+
+from requisitor.errors import HTTPError
+from requisitor.pool import ConnectionPool
+from requisitor.session import Session
+
+
+def test_map(server):
+    specs = [
+        ('GET', server.url + '/0'),
+        ('POST', server.url + '/1', {'json': {'foo': 'bar'}}),
+        {'method': 'GET', 'url': server.url + '/status/404'},
+        {'method': 'GET', 'url': server.url + '/3', 'params': {'a': 'b'}},
+        'bad spec',
+        ('GET', 'ftp:///foo'),
+    ]
+    with Session() as s:
+        results = s.map(specs, max_workers=2)
+
+    assert results[0].json()['path'] == '/0'
+    assert results[1].json()['body'] == '{"foo": "bar"}'
+    assert isinstance(results[2], HTTPError)
+    assert results[2].text == 'error'
+    assert results[3].json()['path'] == '/3?a=b'
+    assert isinstance(results[4], TypeError)
+    assert isinstance(results[5], OSError)
+
+
+def test_map_reuses_connections(server):
+    with Session() as s:
+        specs = [('GET', server.url + '/%d' % i) for i in range(50)]
+        results = s.map(specs)
+        assert [r.json()['path'] for r in results] == [
+            '/%d' % i for i in range(50)
+        ]
+        assert s.pool.size() <= s.pool.max_per_host
+    assert server.connections <= 10
+
+
+def test_map_max_workers(server, mocker):
+    pool = ConnectionPool(max_per_host=3, block=True)
+    executor = mocker.spy(concurrent.futures, 'ThreadPoolExecutor')
+    with Session(pool=pool) as s:
+        results = s.map([('GET', server.url)] * 40)
+        assert [r.status_code for r in results] == [200] * 40
+        executor.assert_called_once_with(3)
+
+        executor.reset_mock()
+        results = s.map([('GET', server.url)] * 40, max_workers=20)
+        assert [r.status_code for r in results] == [200] * 40
+        executor.assert_called_once_with(20)
+        assert s.pool.size() <= 3
+
+    s = Session(pool=False)
+    assert s._max_workers(None) == 10
+    assert s._max_workers(20) == 20
+
+
+def test_imap_backpressure(server):
+    consumed = []
+
+    def specs():
+        for i in itertools.count():
+            consumed.append(i)
+            yield 'GET', server.url + '/%d' % i
+
+    s = Session(pool=False)
+    results = s.imap(specs(), max_workers=2)
+    first = list(itertools.islice(results, 3))
+    assert [r.json()['path'] for r in first] == ['/0', '/1', '/2']
+    assert len(consumed) <= 7
+    results.close()
+
+
+def test_imap_unordered(server):
+    specs = (('GET', server.url + '/%d' % i) for i in range(20))
+    with Session() as s:
+        results = dict(s.imap_unordered(specs, max_workers=3))
+
+    assert sorted(results) == list(range(20))
+    for i, r in results.items():
+        assert r.json()['path'] == '/%d' % i
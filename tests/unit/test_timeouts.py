@@ -0,0 +1,206 @@
+import socket
+import time
+import urllib.error
+
+import pytest
+
+from requisitor.errors import DeadlineExceeded
+from requisitor.session import Session
+from requisitor.timeouts import Timeout
+
+
+def test_from_args(mocker):
+    assert Timeout.from_args() is None
+    assert Timeout.from_args(5) is None
+
+    t = Timeout.from_args((1, 2))
+    assert (t.connect, t.read, t.deadline, t.expires) == (1, 2, None, None)
+    assert repr(t) == '<Timeout connect=1 read=2 deadline=None>'
+    assert t.remaining() is None
+    assert t.connect_timeout() == 1
+    assert t.read_timeout() == 2
+
+    mocker.patch('time.monotonic', return_value=100)
+    t = Timeout.from_args(5, deadline=10)
+    assert (t.connect, t.read, t.expires) == (5, 5, 110)
+
+    base = Timeout(1, None, deadline=3)
+    t = Timeout.from_args(base)
+    assert t is not base
+    assert base.expires is None
+    assert (t.connect, t.read, t.expires) == (1, None, 103)
+    assert Timeout.from_args(base, deadline=20).expires == 120
+
+    time.monotonic.return_value = 101.5
+    assert t.remaining() == 1.5
+    assert t.connect_timeout() == 1
+    assert t.read_timeout() == 1.5
+
+    time.monotonic.return_value = 103
+    with pytest.raises(DeadlineExceeded):
+        t.read_timeout()
+
+
+def test_read_timeout(server):
+    with Session() as s:
+        with pytest.raises(socket.timeout) as excinfo:
+            s.get(server.url + '/slow/0.5', timeout=(5, 0.1))
+        assert not isinstance(excinfo.value, DeadlineExceeded)
+
+        assert s.get(server.url + '/slow/0.1', timeout=(0.05, 1)).status == 200
+
+        with pytest.raises(socket.timeout) as excinfo:
+            s.get(server.url + '/slow/0.5', timeout=0.1)
+        assert not isinstance(excinfo.value, DeadlineExceeded)
+
+
+def test_deadline(server):
+    with Session() as s:
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            s.get(server.url + '/slow/1', deadline=0.2)
+        assert time.monotonic() - start < 0.5
+
+        # Across redirects
+        with pytest.raises(DeadlineExceeded):
+            s.get(server.url + '/redirect/302/slow/0.15', timeout=5,
+                  deadline=0.1)
+
+        r = s.get(server.url + '/redirect/302/foo', timeout=(1, 1),
+                  deadline=5)
+        assert r.json()['path'] == '/foo'
+        assert s.pool.size() == 1
+
+
+def test_deadline_body(server):
+    with Session() as s:
+        # Every byte arrives within the read timeout, but not the body
+        r = s.get(server.url + '/trickle/0.05', timeout=1, deadline=0.2)
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            r.bytes
+        assert time.monotonic() - start < 0.3
+        # The connection is discarded
+        assert s.pool.size() == 0
+
+        r = s.get(server.url + '/trickle/0.01', deadline=2)
+        assert r.bytes == b'x' * 10
+        assert s.pool.size() == 1
+        assert s.pool.idle(next(iter(s.pool._idle))) == 1
+
+
+def test_deadline_readinto(mocker, server):
+    with Session() as s:
+        r = s.get(server.url + '/trickle/0.05', timeout=1, deadline=0.2)
+        b = bytearray(2)
+        assert r.raw.readinto(b) == 2
+        assert b == b'xx'
+        with pytest.raises(DeadlineExceeded):
+            while r.raw.readinto(b):
+                pass
+        assert s.pool.size() == 0
+
+        r = s.get(server.url + '/trickle/0.01', deadline=2)
+        b = bytearray(16)
+        assert r.raw.readinto(b) == 10
+        assert b[:10] == b'x' * 10
+        assert s.pool.size() == 1
+
+        r = s.get(server.url + '/trickle/0.01', timeout=1)
+        assert r.raw.readinto(b) == 10
+
+        # Other errors are raised as they are, discarding the connection
+        r = s.get(server.url + '/trickle/0.01', deadline=2)
+        mocker.patch.object(r.raw, 'read1', side_effect=ConnectionResetError)
+        with pytest.raises(ConnectionResetError):
+            r.bytes
+        assert s.pool.size() == 0
+
+        # The read timeout expiring before the deadline is not
+        # DeadlineExceeded
+        r = s.get(server.url + '/trickle/0.2', timeout=(1, 0.05),
+                  deadline=5)
+        with pytest.raises(socket.timeout) as excinfo:
+            r.bytes
+        assert not isinstance(excinfo.value, DeadlineExceeded)
+
+
+def test_deadline_without_pool(server):
+    with Session(pool=False) as s:
+        with pytest.raises(DeadlineExceeded):
+            s.get(server.url + '/slow/1', deadline=0.1)
+        r = s.get(server.url + '/trickle/0.05', deadline=0.2)
+        with pytest.raises(DeadlineExceeded):
+            r.bytes
+
+
+def test_connect_deadline(mocker):
+    mocker.patch('socket.getaddrinfo', side_effect=lambda *args: (
+        time.sleep(0.2) or [(socket.AF_INET, socket.SOCK_STREAM, 6, '',
+                             ('127.0.0.1', 80))]
+    ))
+    timeouts = []
+
+    def connect(sock, address):
+        timeouts.append(sock.gettimeout())
+        raise socket.timeout('timed out')
+
+    mocker.patch('socket.socket.connect', connect)
+    with Session() as s:
+        with pytest.raises(DeadlineExceeded):
+            s.get('http://foo.bar/', deadline=0.1)
+        assert timeouts == []
+
+        # Connecting is bounded by the time left after name resolution
+        with pytest.raises(urllib.error.URLError):
+            s.get('http://foo.bar/', timeout=(5, 5), deadline=0.5)
+        assert 0.2 < timeouts[0] < 0.31
+
+        with pytest.raises(urllib.error.URLError):
+            s.get('http://foo.bar/', timeout=(0.05, 5))
+        assert timeouts[1] == 0.05
+
+    # Raised as is, rather than wrapped in the URLError of urllib
+    with Session(pool=False) as s:
+        with pytest.raises(DeadlineExceeded):
+            s.get('http://foo.bar/', deadline=0.1)
+
+
+def test_connect_fallback(mocker, server):
+    host, port = server.server_address[:2]
+    getaddrinfo = mocker.patch('socket.getaddrinfo', return_value=[
+        (socket.AF_INET6, socket.SOCK_STREAM, 6, '', ('::1', port, 0, 0)),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, '', (host, port)),
+    ])
+    addresses = []
+    socket_connect = socket.socket.connect
+
+    def connect(sock, address):
+        addresses.append(address)
+        return socket_connect(sock, address)
+
+    mocker.patch('socket.socket.connect', connect)
+    with Session() as s:
+        # Each address is tried in turn, until one accepts the connection
+        r = s.get('http://foo.bar:%d/foo' % port, timeout=(1, 1))
+        assert r.json()['path'] == '/foo'
+        assert addresses[-1] == (host, port)
+
+    getaddrinfo.return_value = []
+    with Session() as s:
+        with pytest.raises(urllib.error.URLError) as excinfo:
+            s.get('http://foo.bar:%d/foo' % port)
+        assert 'getaddrinfo returns an empty list' in str(excinfo.value)
+
+
+def test_connect_timeout(mocker):
+    mocker.patch('socket.getaddrinfo', return_value=[
+        (socket.AF_INET, socket.SOCK_STREAM, 6, '', ('127.0.0.1', 80)),
+    ])
+    mocker.patch('socket.socket.connect',
+                 side_effect=socket.timeout('timed out'))
+    with Session() as s:
+        with pytest.raises(urllib.error.URLError) as excinfo:
+            s.get('http://foo.bar/', timeout=0.05)
+        assert isinstance(excinfo.value.reason, socket.timeout)
+        assert not isinstance(excinfo.value.reason, DeadlineExceeded)
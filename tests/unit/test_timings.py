@@ -0,0 +1,109 @@
+import datetime
+from unittest.mock import MagicMock
+
+import pytest
+
+from requisitor.handlers import TimedHTTPConnection
+from requisitor.handlers import TimedHTTPSConnection
+from requisitor.handlers import UnixHTTPSConnection
+from requisitor.response import Response
+from requisitor.session import Session
+from requisitor.timings import Timings
+
+
+def test_durations():
+    t = Timings(start=10)
+    assert t.durations() == {
+        'dns': None, 'connect': None, 'tls': None, 'send': None,
+        'ttfb': None, 'body': None, 'total': 0,
+    }
+    assert t.reused
+
+    t.dns, t.connect, t.tls, t.sent, t.headers, t.end = 11, 13, 16, 17, 20, 25
+    assert t.durations() == {
+        'dns': 1, 'connect': 2, 'tls': 3, 'send': 1, 'ttfb': 3, 'body': 5,
+        'total': 15,
+    }
+    assert not t.reused
+    t.url = 'http://foo.bar/'
+    assert repr(t) == '<Timings http://foo.bar/ %s>' % (t.durations(),)
+
+    # Reused connection, body not read yet
+    t = Timings(start=10)
+    t.sent, t.headers = 11, 12
+    assert t.durations()['send'] == 1
+    assert t.durations()['ttfb'] == 1
+    assert t.durations()['body'] is None
+    assert t.durations()['total'] == 2
+
+
+def test_session_timings(server):
+    with Session() as s:
+        r = s.get(server.url + '/redirect/302/foo')
+        first, second = r.timings
+        assert first.url == server.url + '/redirect/302/foo'
+        assert first.status == 302
+        assert second.url == server.url + '/foo'
+        assert second.status == 200
+
+        assert first.dns is not None
+        assert first.connect >= first.dns
+        assert first.tls is None
+        assert first.end is not None
+        assert second.reused
+        assert second.headers >= second.sent >= second.start >= first.end
+        assert second.end is None
+
+        r.bytes
+        assert second.end >= second.headers
+        assert isinstance(r.elapsed, datetime.timedelta)
+        assert r.elapsed.total_seconds() == pytest.approx(
+            second.headers - first.start, abs=1e-5
+        )
+
+        # Each response has its own timings
+        r = s.get(server.url)
+        assert len(r.timings) == 1
+        assert r.timings[0].reused
+
+
+def test_unix_timings(unix_server):
+    with Session() as s:
+        s.unix_socket = unix_server.path
+        r = s.get('http://localhost/foo')
+        timings, = r.timings
+        assert timings.dns is None
+        assert timings.connect is not None
+        assert timings.tls is None
+
+
+def test_tls_timings(mocker):
+    mocker.patch('http.client.HTTPSConnection.connect')
+    for conn in (TimedHTTPSConnection('foo.bar'),
+                 UnixHTTPSConnection('foo')('foo.bar')):
+        conn.connect()
+        assert conn.timings is None
+
+        conn.timings = Timings()
+        conn.connect()
+        assert conn.timings.tls >= conn.timings.start
+
+
+def test_connection_without_timings(server):
+    host, port = server.server_address[:2]
+    conn = TimedHTTPConnection(host, port, source_address=(host, 0))
+    # Requests not made with ``request`` are not timed
+    conn.putrequest('GET', '/foo')
+    conn.endheaders()
+    r = conn.getresponse()
+    assert r.read()
+    assert r.timings is None
+    assert conn.timings is None
+    assert conn.sock.getsockname()[0] == host
+    conn.close()
+
+
+def test_no_timings():
+    r = Response(MagicMock(headers={}), request=None)
+    assert r.timings == []
+    assert r.elapsed is None
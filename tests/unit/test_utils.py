@@ -1,14 +1,20 @@
 import io
 import os
 import pathlib
+from urllib.parse import urljoin
 from urllib.parse import urlparse
 
 import pytest
 
 from requisitor.utils import ensure_bytes
+from requisitor.utils import get_file_size
 from requisitor.utils import get_filename
 from requisitor.utils import is_binary_data
 from requisitor.utils import is_binary_fileobj
+from requisitor.utils import is_regular_file
+from requisitor.utils import iter_body
+from requisitor.utils import join_url
+from requisitor.utils import parse_url
 from requisitor.utils import read_bytes
 from requisitor.utils import update_url_params
 
@@ -30,6 +36,30 @@ def test_update_url_params(url, params, expected):
     assert update_url_params(url, params) == expected
 
 
+def test_update_url_params_fast_path(mocker):
+    parse_qs = mocker.patch('urllib.parse.parse_qs')
+    url = 'http://foo.bar/?a=b&a=&c'
+    assert update_url_params(url, {}) is url
+    assert update_url_params(url, {'a': None}) is url
+    parse_qs.assert_not_called()
+
+
+def test_parse_url_cached():
+    assert parse_url('http://foo.bar/baz') is parse_url('http://foo.bar/baz')
+
+
+@pytest.mark.parametrize('base', [
+    'https://h/v1/', 'https://h/v1', 'https://h', 'https://h/v1/x?q=1',
+])
+@pytest.mark.parametrize('url', [
+    'users', '/users', 'a/b?x=1', '../x', './y', '', '?q=2', '#f',
+    'http://o/z', '//o/z', 'a:b', 'a?b=../c', '/fetch/https://example.com',
+    'web/2020/https://x.org/',
+])
+def test_join_url(base, url):
+    assert join_url(urlparse(base), url) == urljoin(base, url)
+
+
 def test_is_binary_data():
     here = os.path.dirname(__file__)
     with open(os.path.join(here, 'fixtures/1x1.png'), 'rb') as f:
@@ -97,3 +127,38 @@ def test_read_bytes():
 def test_ensure_bytes():
     assert ensure_bytes('foo') == b'foo'
     assert ensure_bytes(b'foo') == b'foo'
+
+
+def test_get_file_size():
+    here = os.path.dirname(__file__)
+    small = os.path.join(here, 'fixtures/small.txt')
+
+    with open(small, 'rb') as f:
+        assert get_file_size(f) == 4
+        assert is_regular_file(f)
+        f.read(1)
+        assert get_file_size(f) == 3
+
+    b = io.BytesIO(b'foobar')
+    b.read(2)
+    assert get_file_size(b) == 4
+    assert b.tell() == 2
+    assert not is_regular_file(b)
+
+    r, w = os.pipe()
+    with os.fdopen(r, 'rb') as f:
+        os.close(w)
+        assert get_file_size(f) is None
+        assert not is_regular_file(f)
+
+    assert get_file_size(object()) is None
+
+
+def test_iter_body():
+    chunks = [b'a', b'bc', b'defg', b'h' * 10, b'i']
+    assert list(iter_body(iter(chunks), 4)) == [b'abcdefg', b'h' * 10, b'i']
+    assert list(iter_body(['ab', 'c'], 4)) == [b'abc']
+    assert list(iter_body(io.BytesIO(b'abcdefghi'), 4)) == [
+        b'abcd', b'efgh', b'i'
+    ]
+    assert list(iter_body(io.StringIO('abc'), 4)) == [b'abc']